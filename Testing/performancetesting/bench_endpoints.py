@@ -0,0 +1,373 @@
+"""In-process benchmark of every backend route against the in-memory datastore.
+
+Drives backend/app.py through the Flask test client at several collection
+sizes and reports p50/p95/p99 latency, allocation peak and Firestore
+round trips, reads and writes per request. The run fails if a write path
+goes over its ROUND_TRIP_BUDGETS entry. Results are written as JSON so two
+commits can be compared:
+
+    python bench_endpoints.py --sizes 100 1000 --output before.json
+    python bench_endpoints.py --sizes 100 1000 --output after.json --compare before.json
+"""
+import os
+import io
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import subprocess
+from datetime import date, timedelta
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'backend')
+
+# The app must be imported with the local datastore and without sending email
+os.environ['DATASTORE_BACKEND'] = 'memory'
+os.environ['OUTBOX_WORKERS'] = '0'
+os.environ.setdefault('OUTBOX_PATH', os.path.join(tempfile.mkdtemp(), 'outbox.sqlite3'))
+os.environ.setdefault('PREVIEW_QUEUE_PATH', os.path.join(tempfile.mkdtemp(), 'previews.sqlite3'))
+os.environ.setdefault('PREVIEW_SPOOL_DIR', tempfile.mkdtemp())
+sys.path.insert(0, os.path.abspath(BACKEND_DIR))
+
+import app as backend  # noqa: E402
+from firebase_config import db  # noqa: E402
+from user_cache import invalidate_user  # noqa: E402
+
+# Routes that call Firebase Authentication / identitytoolkit and can't run offline
+SKIPPED_ROUTES = {
+    '/send_verification_email': 'calls Firebase Authentication',
+    '/verify_email': 'calls identitytoolkit',
+    '/create_user': 'calls identitytoolkit',
+    '/login': 'calls identitytoolkit',
+    '/delete_user': 'calls Firebase Authentication',
+    '/events': 'long-lived stream, measured by events_fanout.py',
+}
+
+# Most Firestore round trips a single request may make; exceeding one fails the run
+ROUND_TRIP_BUDGETS = {
+    '/update_user': 1,
+    '/create_ticket': 1,
+    '/update_ticket': 2,
+    '/delete_ticket': 2,
+    '/create_appointment': 1,
+    '/update_appointment': 2,
+    '/delete_appointment': 2,
+    '/create_resource': 2,  # Blob read and one batch; the bench re-uploads the same file
+    '/update_resource': 1,
+    '/delete_resource': 2,
+    '/bulk_update_tickets': 2,
+    '/bulk_delete_tickets': 2,
+    '/bulk_update_appointments': 2,
+    '/bulk_delete_appointments': 2,
+    '/get_all_tickets?expand=user': 2,
+    '/get_all_appointments?expand=user': 2,
+    '/stats': 1,
+    '/search': 1,
+}
+
+# Documents touched by each bulk endpoint request
+BULK_SIZE = 50
+
+STUDENT_ID = 'bench-student'
+SECRETARY_ID = 'bench-secretary'
+FIRST_BENCH_DATE = date(2030, 1, 1)
+
+
+class Fixture:
+    """Seeds the datastore with `size` documents per collection."""
+
+    def __init__(self, size):
+        self.size = size
+        self.next_slot = 0
+        db.clear()
+        backend.resource_catalog.invalidate()
+        backend.booked_slots.invalidate()
+        backend.ticket_search.invalidate()
+        backend.resource_search.invalidate()
+
+        self.user_ids = [STUDENT_ID, SECRETARY_ID] + [f'user-{i}' for i in range(size)]
+        for user_id in self.user_ids:
+            db.collection('users').document(user_id).set(self.user('secretary' if user_id == SECRETARY_ID else 'user'))
+
+        self.ticket_ids = []
+        self.appointment_ids = []
+        self.resource_ids = []
+        for i in range(size):
+            owner = STUDENT_ID if i % 10 == 0 else f'user-{i}'
+            self.ticket_ids.append(self.add_ticket(owner))
+            self.appointment_ids.append(self.add_appointment(owner))
+            self.resource_ids.append(self.add_resource())
+
+    def user(self, role):
+        return {'firstName': 'Bench', 'lastName': 'User', 'phone': '0500000000', 'role': role,
+                'createdAt': backend.firestore.SERVER_TIMESTAMP, 'lastUpdatedDate': backend.firestore.SERVER_TIMESTAMP}
+
+    def slot(self):
+        slots = backend.ALLOWED_TIME_SLOTS
+        day = FIRST_BENCH_DATE + timedelta(days=self.next_slot // len(slots))
+        time_slot = slots[self.next_slot % len(slots)]
+        self.next_slot += 1
+        return day.isoformat(), time_slot
+
+    def add_ticket(self, owner=STUDENT_ID):
+        _, ref = db.collection('tickets').add({
+            'title': 'Printer jam in lab 3', 'description': 'The printer shows a paper jam error. ' * 5,
+            'status': 'In Progress', 'feedback': '', 'userId': owner,
+            'createdAt': backend.firestore.SERVER_TIMESTAMP, 'lastUpdatedDate': backend.firestore.SERVER_TIMESTAMP,
+        })
+        return ref.id
+
+    def add_appointment(self, owner=STUDENT_ID):
+        appointment_date, appointment_time = self.slot()
+        ref = db.collection('appointments').document()
+        ref.set({
+            'title': 'Laptop setup', 'description': 'Need help configuring VPN. ' * 5,
+            'appointmentDate': appointment_date, 'appointmentTime': appointment_time,
+            'status': 'In Progress', 'feedback': '', 'userId': owner,
+            'createdAt': backend.firestore.SERVER_TIMESTAMP, 'lastUpdatedDate': backend.firestore.SERVER_TIMESTAMP,
+        })
+        backend.slot_ref(appointment_date, appointment_time).set(
+            backend.slot_data(ref.id, owner, appointment_date, appointment_time))
+        return ref.id
+
+    def add_resource(self):
+        _, ref = db.collection('resources').add({
+            'title': 'VPN guide', 'description': 'How to connect to the university VPN. ' * 5, 'type': 'Guide',
+            'createdAt': backend.firestore.SERVER_TIMESTAMP, 'lastUpdatedDate': backend.firestore.SERVER_TIMESTAMP,
+        })
+        return ref.id
+
+
+def scenarios(fixture):
+    """(route, method, role, build_request) for every benchmarked request.
+
+    build_request runs outside the measured region and returns test client kwargs.
+    """
+    def query(path, **params):
+        return lambda: {'path': path, 'query_string': params}
+
+    def body(path, build):
+        return lambda: {'path': path, 'json': build()}
+
+    def new_slot():
+        appointment_date, appointment_time = fixture.slot()
+        return {'title': 'Bench', 'description': 'Bench appointment',
+                'appointmentDate': appointment_date, 'appointmentTime': appointment_time}
+
+    def uncached_users(build):
+        # Measure the batched profile read rather than the profile cache
+        def build_request():
+            for user_id in fixture.user_ids:
+                invalidate_user(user_id)
+            return build()
+        return build_request
+
+    def resource_form():
+        return {'path': '/create_resource', 'content_type': 'multipart/form-data', 'data': {
+            'title': 'Bench', 'description': 'Bench resource', 'type': 'Guide',
+            'file': (io.BytesIO(b'x' * 64 * 1024), f'bench-{time.perf_counter_ns()}.pdf'),
+        }}
+
+    first_ticket = fixture.ticket_ids[0]
+    first_appointment = fixture.appointment_ids[0]
+    first_resource = fixture.resource_ids[0]
+    day = FIRST_BENCH_DATE.isoformat()
+
+    return [
+        ('/logout', 'post', 'user', query('/logout')),
+        ('/check_auth', 'get', 'user', query('/check_auth')),
+        ('/auth_cache_stats', 'get', 'secretary', query('/auth_cache_stats')),
+        ('/metrics', 'get', None, query('/metrics')),
+        ('/get_user', 'get', 'secretary', query('/get_user', userId=STUDENT_ID)),
+        ('/get_all_users', 'get', 'secretary', query('/get_all_users')),
+        ('/update_user', 'put', 'user', body('/update_user', lambda: {'userId': STUDENT_ID, 'phone': '0511111111'})),
+        ('/create_ticket', 'post', 'user', body('/create_ticket', lambda: {'title': 'Bench', 'description': 'Bench ticket'})),
+        ('/get_ticket', 'get', 'user', query('/get_ticket', ticketId=first_ticket)),
+        ('/get_all_tickets', 'get', 'secretary', query('/get_all_tickets')),
+        ('/get_all_tickets?expand=user', 'get', 'secretary', uncached_users(query('/get_all_tickets', expand='user', limit=100))),
+        ('/get_all_tickets?includeArchived=1', 'get', 'secretary', query('/get_all_tickets', includeArchived=1, limit=100)),
+        ('/get_user_tickets', 'get', 'user', query('/get_user_tickets')),
+        ('/update_ticket', 'put', 'secretary', body('/update_ticket', lambda: {'ticketId': first_ticket, 'status': 'Resolved', 'feedback': 'Done'})),
+        ('/delete_ticket', 'delete', 'user', lambda: {'path': '/delete_ticket', 'query_string': {'ticketId': fixture.add_ticket()}}),
+        ('/bulk_update_tickets', 'put', 'secretary', body('/bulk_update_tickets', lambda: {'ticketIds': fixture.ticket_ids[:BULK_SIZE], 'status': 'Resolved'})),
+        ('/bulk_delete_tickets', 'delete', 'secretary', body('/bulk_delete_tickets', lambda: {'ticketIds': [fixture.add_ticket() for _ in range(BULK_SIZE)]})),
+        ('/create_appointment', 'post', 'user', body('/create_appointment', new_slot)),
+        ('/get_appointment', 'get', 'user', query('/get_appointment', appointmentId=first_appointment)),
+        ('/get_all_appointments', 'get', 'secretary', query('/get_all_appointments')),
+        ('/get_all_appointments?expand=user', 'get', 'secretary', uncached_users(query('/get_all_appointments', expand='user', limit=100))),
+        ('/get_user_appointments', 'get', 'user', query('/get_user_appointments')),
+        ('/update_appointment', 'put', 'secretary', body('/update_appointment', lambda: {'appointmentId': first_appointment, 'status': 'Approved', 'feedback': 'See you'})),
+        ('/delete_appointment', 'delete', 'user', lambda: {'path': '/delete_appointment', 'query_string': {'appointmentId': fixture.add_appointment()}}),
+        ('/bulk_update_appointments', 'put', 'secretary', body('/bulk_update_appointments', lambda: {'appointmentIds': fixture.appointment_ids[:BULK_SIZE], 'status': 'Approved'})),
+        ('/bulk_delete_appointments', 'delete', 'secretary', body('/bulk_delete_appointments', lambda: {'appointmentIds': [fixture.add_appointment() for _ in range(BULK_SIZE)]})),
+        ('/check_time_slot_availability', 'get', 'user', query('/check_time_slot_availability', date=day, time='09:00 AM')),
+        ('/availability', 'get', 'user', query('/availability', **{'from': day, 'to': (FIRST_BENCH_DATE + timedelta(days=29)).isoformat()})),
+        ('/stats', 'get', 'secretary', query('/stats')),
+        ('/search', 'get', 'user', query('/search', q='printer jam')),
+        ('/create_resource', 'post', 'secretary', resource_form),
+        ('/upload_progress', 'get', 'secretary', query('/upload_progress', uploadId='missing')),
+        ('/get_resource', 'get', None, query('/get_resource', resourceId=first_resource)),
+        ('/get_all_resources', 'get', None, query('/get_all_resources')),
+        ('/update_resource', 'put', 'secretary', body('/update_resource', lambda: {'resourceId': first_resource, 'title': 'VPN guide v2'})),
+        ('/delete_resource', 'delete', 'secretary', lambda: {'path': '/delete_resource', 'query_string': {'resourceId': fixture.add_resource()}}),
+    ]
+
+
+def log_in(client, role):
+    with client.session_transaction() as session:
+        session.clear()
+        if role is not None:
+            session['user_id'] = SECRETARY_ID if role == 'secretary' else STUDENT_ID
+            session['role'] = role
+            session['email'] = 'bench@example.com'
+            session['firstName'] = 'Bench'
+            session['lastName'] = 'User'
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def send(client, method, role, build_request, trace=False):
+    """Send one request and return (response, seconds, peak traced bytes)."""
+    log_in(client, role)
+    kwargs = build_request()
+    path = kwargs.pop('path')
+    db.reset_stats()
+    if trace:
+        tracemalloc.start()
+    started = time.perf_counter()
+    response = getattr(client, method)(path, **kwargs)
+    response.get_data()
+    elapsed = time.perf_counter() - started
+    peak = 0
+    if trace:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return response, elapsed, peak
+
+
+def run_scenario(client, method, role, build_request, iterations, warmup, alloc_samples=5):
+    latencies, statuses = [], set()
+    operations = {'roundTrips': 0, 'reads': 0, 'writes': 0}
+
+    for i in range(warmup + iterations):
+        response, elapsed, _ = send(client, method, role, build_request)
+        if i >= warmup:
+            latencies.append(elapsed * 1000)
+            statuses.add(response.status_code)
+            for key in operations:
+                operations[key] += db.stats[key]
+
+    # Allocations are traced in a separate pass so tracing doesn't skew latency
+    peak = 0
+    for _ in range(alloc_samples):
+        peak = max(peak, send(client, method, role, build_request, trace=True)[2])
+
+    latencies.sort()
+    return {
+        'p50Ms': round(percentile(latencies, 0.50), 3),
+        'p95Ms': round(percentile(latencies, 0.95), 3),
+        'p99Ms': round(percentile(latencies, 0.99), 3),
+        'peakAllocKiB': round(peak / 1024, 1),
+        'firestoreRoundTrips': operations['roundTrips'] / iterations,
+        'firestoreReads': operations['reads'] / iterations,
+        'firestoreWrites': operations['writes'] / iterations,
+        'statusCodes': sorted(statuses),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous, current):
+    print(f"\nChange against {previous['meta'].get('commit')}:")
+    for size, endpoints in current['results'].items():
+        for route, result in endpoints.items():
+            before = previous['results'].get(size, {}).get(route)
+            if not before:
+                continue
+            for key in ('p50Ms', 'p95Ms', 'firestoreRoundTrips', 'firestoreReads'):
+                if before[key] and abs(result[key] - before[key]) / before[key] >= 0.1:
+                    change = (result[key] - before[key]) / before[key] * 100
+                    print(f"  size={size:<6} {route:<32} {key:<20} {before[key]:>10} -> {result[key]:<10} ({change:+.0f}%)")
+
+
+def check_round_trips(report):
+    over_budget = []
+    for size, endpoints in report['results'].items():
+        for route, budget in ROUND_TRIP_BUDGETS.items():
+            result = endpoints.get(route)
+            if result and result['firestoreRoundTrips'] > budget:
+                over_budget.append(f"size={size} {route}: {result['firestoreRoundTrips']} round trips (budget {budget})")
+    return over_budget
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--routes', nargs='*', help='Only benchmark these routes')
+    parser.add_argument('--output', default='bench-results.json')
+    parser.add_argument('--compare', help='Previous results file to diff against')
+    args = parser.parse_args()
+
+    client = backend.app.test_client()
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'iterations': args.iterations,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': {},
+        'skipped': dict(SKIPPED_ROUTES),
+    }
+
+    covered = set()
+    for size in args.sizes:
+        fixture = Fixture(size)
+        results = report['results'][str(size)] = {}
+        for route, method, role, build_request in scenarios(fixture):
+            covered.add(route)
+            if args.routes and route not in args.routes:
+                continue
+            results[route] = run_scenario(client, method, role, build_request, args.iterations, args.warmup)
+            r = results[route]
+            print(f"size={size:<6} {route:<32} p50={r['p50Ms']:>8.3f}ms p95={r['p95Ms']:>8.3f}ms "
+                  f"p99={r['p99Ms']:>8.3f}ms peak={r['peakAllocKiB']:>9.1f}KiB "
+                  f"rt={r['firestoreRoundTrips']:.1f} reads={r['firestoreReads']:.1f} writes={r['firestoreWrites']:.1f}")
+
+    # Flag routes added to the app without a benchmark scenario
+    for rule in backend.app.url_map.iter_rules():
+        if rule.endpoint != 'static' and rule.rule not in covered and rule.rule not in SKIPPED_ROUTES:
+            report['skipped'][rule.rule] = 'no benchmark scenario'
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+    for route, reason in report['skipped'].items():
+        print(f"Skipped {route}: {reason}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+    over_budget = check_round_trips(report)
+    if over_budget:
+        print('\nOver the Firestore round-trip budget:')
+        for line in over_budget:
+            print(f'  {line}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""Compare gunicorn's gthread and gevent workers on an I/O-bound route.
+
+Starts a stand-in for identitytoolkit that answers after --auth-latency ms,
+runs the backend under gunicorn once per worker class with the same number of
+workers and threads, and drives POST /login (sign-in, account lookup and a
+profile read) from --clients concurrent clients. The in-memory datastore adds
+--datastore-latency ms to every Firestore round trip:
+
+    python bench_modes.py --workers 2 --clients 64 --requests 1000
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'backend'))
+MODES = ('gthread', 'gevent')
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def start_auth_stub(latency):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            time.sleep(latency)
+            email = payload.get('email')
+            if isinstance(email, list):  # accounts:lookup takes a list of emails
+                email = email[0]
+            if self.path.split('?')[0].endswith(':signInWithPassword'):
+                body = {'localId': 'bench-user', 'email': email, 'idToken': 'bench-token'}
+            else:
+                body = {'users': [{'localId': 'bench-user', 'email': email, 'emailVerified': True}]}
+            data = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_server(mode, args, auth_host, extra_env=None):
+    port = free_port()
+    env = dict(
+        os.environ,
+        DATASTORE_BACKEND='memory',
+        MEMORY_DATASTORE_LATENCY_MS=str(args.datastore_latency),
+        FIREBASE_AUTH_EMULATOR_HOST=auth_host,
+        FIREBASE_API_KEY='bench',
+        OUTBOX_WORKERS='0',
+        OUTBOX_PATH=os.path.join(tempfile.mkdtemp(), 'outbox.sqlite3'),
+        PREVIEW_WORKER='0',
+        GUNICORN_WORKER_CLASS=mode,
+        WEB_CONCURRENCY=str(args.workers),
+        GUNICORN_THREADS=str(args.threads),
+        BIND=f'127.0.0.1:{port}',
+        **(extra_env or {}),
+    )
+    process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--access-logfile', '/dev/null'],
+                               cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            requests.options(f'{url}/login', timeout=5)
+            return process, url
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f'gunicorn ({mode}) did not start')
+
+
+def drive(url, args):
+    local = threading.local()
+
+    def one(i):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        started = time.perf_counter()
+        response = local.session.post(f'{url}/login', json={'email': f'bench{i}@example.com', 'password': 'secret'})
+        return (time.perf_counter() - started) * 1000, response.status_code
+
+    with ThreadPoolExecutor(max_workers=args.clients) as pool:
+        list(pool.map(one, range(args.clients)))  # warm up connections and clients
+        started = time.perf_counter()
+        results = list(pool.map(one, range(args.requests)))
+        elapsed = time.perf_counter() - started
+    latencies = [latency for latency, _ in results]
+    errors = sum(1 for _, status in results if status != 200)
+    return {
+        'throughput': args.requests / elapsed,
+        'p50': percentile(latencies, 0.5),
+        'p95': percentile(latencies, 0.95),
+        'errors': errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=4, help='threads per gthread worker')
+    parser.add_argument('--clients', type=int, default=64)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--auth-latency', type=float, default=40, help='identitytoolkit latency in ms')
+    parser.add_argument('--datastore-latency', type=float, default=20, help='Firestore round trip latency in ms')
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES))
+    args = parser.parse_args()
+
+    stub = start_auth_stub(args.auth_latency / 1000)
+    auth_host = f'127.0.0.1:{stub.server_address[1]}'
+    print(f"{args.workers} workers, {args.clients} clients, {args.requests} logins, "
+          f"auth {args.auth_latency:g}ms, datastore {args.datastore_latency:g}ms")
+    for mode in args.modes:
+        process, url = start_server(mode, args, auth_host)
+        try:
+            result = drive(url, args)
+        finally:
+            process.terminate()
+            process.wait()
+        print(f"{mode:8} {result['throughput']:8.1f} req/s  p50={result['p50']:.1f}ms  p95={result['p95']:.1f}ms  "
+              f"errors={result['errors']}")
+    stub.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Response size and latency of the listings with `fields=` and compression.
+
+Seeds the in-memory datastore with tickets and resources that have long
+descriptions and feedback, then requests each listing in full and with the
+fields a secretary table shows, without compression and with gzip and
+brotli. Latency includes the time spent compressing:
+
+    python bench_payloads.py --documents 1000 --iterations 20
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'backend')
+
+os.environ['DATASTORE_BACKEND'] = 'memory'
+os.environ['OUTBOX_WORKERS'] = '0'
+os.environ.setdefault('OUTBOX_PATH', os.path.join(tempfile.mkdtemp(), 'outbox.sqlite3'))
+sys.path.insert(0, os.path.abspath(BACKEND_DIR))
+
+import app as backend  # noqa: E402
+from firebase_config import db  # noqa: E402
+
+ROUTES = {
+    '/get_all_tickets': 'title,status,createdAt',
+    '/get_all_appointments': 'title,status,appointmentDate,appointmentTime',
+    '/get_all_resources': 'title,type',
+}
+ENCODINGS = ('identity', 'gzip', 'br')
+DESCRIPTION = ('The projector in lab 3 flickers and turns off after a few minutes. '
+               'I tried another cable and restarting the laptop. ') * 4
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def seed(count):
+    for i in range(count):
+        common = {'description': f'{i} {DESCRIPTION}', 'createdAt': backend.datetime.now(),
+                  'lastUpdatedDate': backend.datetime.now()}
+        db.collection('tickets').add({**common, 'title': f'Ticket {i}', 'status': 'In Progress',
+                                      'feedback': f'Checked on {i}. ' * 20, 'userId': f'user-{i % 50}'})
+        db.collection('appointments').add({**common, 'title': f'Meeting {i}', 'status': 'Pending',
+                                           'feedback': '', 'userId': f'user-{i % 50}',
+                                           'appointmentDate': '2026-01-01', 'appointmentTime': '10:00'})
+        db.collection('resources').add({**common, 'title': f'Guide {i}', 'type': 'pdf',
+                                        'fileName': f'guide-{i}.pdf', 'fileUrl': f'https://files.example/guide-{i}.pdf'})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--documents', type=int, default=500)
+    parser.add_argument('--iterations', type=int, default=20)
+    args = parser.parse_args()
+
+    seed(args.documents)
+    client = backend.app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = 'bench-secretary'
+        session['role'] = 'secretary'
+
+    print(f"{args.documents} documents per collection, {args.iterations} iterations")
+    print(f"{'route':24} {'fields':8} {'encoding':9} {'bytes':>10} {'p50 ms':>8} {'p95 ms':>8}")
+    for route, fields in ROUTES.items():
+        for projected in (False, True):
+            url = f'{route}?fields={fields}' if projected else route
+            for encoding in ENCODINGS:
+                headers = {'Accept-Encoding': encoding}
+                latencies = []
+                for _ in range(args.iterations):
+                    started = time.perf_counter()
+                    response = client.get(url, headers=headers)
+                    latencies.append((time.perf_counter() - started) * 1000)
+                assert response.status_code == 200, response.data
+                print(f"{route:24} {'some' if projected else 'all':8} {encoding:9} {len(response.data):>10} "
+                      f"{percentile(latencies, 0.5):>8.2f} {percentile(latencies, 0.95):>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Preview generation for uploaded images and PDFs.
+
+Runs the backend against the in-memory datastore and storage, uploads
+photos and multi-page PDFs through /create_resource, then runs the queued
+preview jobs on a process pool, as preview_worker.py does. Reports the
+upload latency (which must not include rendering), the time to render all
+previews, and the bytes the catalog page loads with previews instead of
+the original files. Uploading a file again must reuse its preview:
+
+    python bench_previews.py --files 8 --processes 2
+"""
+import io
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'backend')
+
+os.environ['DATASTORE_BACKEND'] = 'memory'
+os.environ['OUTBOX_WORKERS'] = '0'
+os.environ.setdefault('OUTBOX_PATH', os.path.join(tempfile.mkdtemp(), 'outbox.sqlite3'))
+os.environ.setdefault('PREVIEW_QUEUE_PATH', os.path.join(tempfile.mkdtemp(), 'previews.sqlite3'))
+os.environ.setdefault('PREVIEW_SPOOL_DIR', tempfile.mkdtemp())
+sys.path.insert(0, os.path.abspath(BACKEND_DIR))
+
+from PIL import Image  # noqa: E402
+import app as backend  # noqa: E402
+from firebase_config import db  # noqa: E402
+from previews import create_pool, run_pending  # noqa: E402
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def photo(seed, width=4000, height=3000):
+    # Noise compresses about as badly as a real photo
+    random.seed(seed)
+    small = Image.frombytes('RGB', (width // 8, height // 8), random.randbytes(width // 8 * height // 8 * 3))
+    output = io.BytesIO()
+    small.resize((width, height)).save(output, 'JPEG', quality=90)
+    return output.getvalue()
+
+
+def pdf(seed, pages=20):
+    random.seed(seed)
+    images = [Image.new('RGB', (1240, 1754), tuple(random.randrange(256) for _ in range(3))) for _ in range(pages)]
+    output = io.BytesIO()
+    images[0].save(output, 'PDF', save_all=True, append_images=images[1:], resolution=150)
+    return output.getvalue()
+
+
+def upload(client, content, file_name):
+    started = time.perf_counter()
+    response = client.post('/create_resource', content_type='multipart/form-data', data={
+        'title': file_name, 'description': 'Handout', 'type': 'Guide',
+        'file': (io.BytesIO(content), file_name),
+    })
+    elapsed = (time.perf_counter() - started) * 1000
+    assert response.status_code == 200, response.data
+    return response.json['resourceId'], elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=8, help='photos and PDFs, half each')
+    parser.add_argument('--processes', type=int, default=2)
+    args = parser.parse_args()
+
+    client = backend.app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = 'bench-secretary'
+        session['role'] = 'secretary'
+
+    files = [(photo(i), f'photo-{i}.jpg') if i % 2 == 0 else (pdf(i), f'handout-{i}.pdf') for i in range(args.files)]
+    latencies, resource_ids = [], []
+    for content, file_name in files:
+        resource_id, elapsed = upload(client, content, file_name)
+        resource_ids.append(resource_id)
+        latencies.append(elapsed)
+    print(f"create_resource: p50={percentile(latencies, 0.5):.1f}ms p95={percentile(latencies, 0.95):.1f}ms")
+
+    with create_pool(args.processes) as pool:
+        started = time.perf_counter()
+        ran = run_pending(pool)
+        elapsed = time.perf_counter() - started
+    print(f"{ran} previews rendered and stored in {elapsed:.2f}s with {args.processes} processes")
+
+    failures = []
+    original_bytes = preview_bytes = 0
+    for resource_id, (content, file_name) in zip(resource_ids, files):
+        resource = db.collection('resources').document(resource_id).get().to_dict()
+        if not resource.get('previewUrl'):
+            failures.append(f'{file_name} has no preview')
+            continue
+        original_bytes += len(content)
+        preview_bytes += resource['previewSizeBytes']
+    print(f"catalog loads {preview_bytes / 1024:.0f} KiB of previews instead of {original_bytes / 1024:.0f} KiB of files")
+
+    # The same content again gets the existing preview in the create itself
+    resource_id, _ = upload(client, *files[0])
+    if not db.collection('resources').document(resource_id).get().to_dict().get('previewUrl'):
+        failures.append('a re-uploaded file did not reuse its preview')
+
+    for failure in failures:
+        print(f'FAILED {failure}')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Fan-out cost of the /events change feed against the in-memory datastore.
+
+Opens SUBSCRIBERS feed subscriptions spread over many users (plus a few
+secretaries), then updates tickets through the API and measures how long it
+takes for each change to be queued for every interested subscriber. It also
+checks that all those clients share one listener per collection:
+
+    python events_fanout.py --subscribers 5000 --updates 200
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'backend')
+
+os.environ['DATASTORE_BACKEND'] = 'memory'
+os.environ['OUTBOX_WORKERS'] = '0'
+os.environ.setdefault('OUTBOX_PATH', os.path.join(tempfile.mkdtemp(), 'outbox.sqlite3'))
+os.environ.setdefault('MAX_EVENT_STREAMS', '100000')
+sys.path.insert(0, os.path.abspath(BACKEND_DIR))
+
+import app as backend  # noqa: E402
+from firebase_config import db  # noqa: E402
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--subscribers', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--secretaries', type=int, default=5)
+    parser.add_argument('--updates', type=int, default=100)
+    args = parser.parse_args()
+
+    feed = backend.change_feed
+    ticket_ids = []
+    for i in range(args.users):
+        _, ref = db.collection('tickets').add({'title': 'Printer jam', 'description': 'Lab 3', 'status': 'In Progress',
+                                               'feedback': '', 'userId': f'user-{i}'})
+        ticket_ids.append(ref.id)
+
+    subscriptions = [feed.subscribe(f'user-{i % args.users}') for i in range(args.subscribers - args.secretaries)]
+    subscriptions += [feed.subscribe('bench-secretary', see_all=True) for _ in range(args.secretaries)]
+    print(f"{len(subscriptions)} subscriptions served by {len(db._watches)} listeners")
+
+    client = backend.app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = 'bench-secretary'
+        session['role'] = 'secretary'
+
+    latencies = []
+    for i in range(args.updates):
+        started = time.perf_counter()
+        # Listener callbacks run inside the write with the in-memory datastore
+        client.put('/update_ticket', json={'ticketId': ticket_ids[i % len(ticket_ids)], 'feedback': f'Update {i}'})
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    delivered = sum(subscription.events.qsize() for subscription in subscriptions)
+    expected_per_update = args.subscribers / args.users + args.secretaries
+    print(f"update + fan-out p50={percentile(latencies, 0.5):.3f}ms p95={percentile(latencies, 0.95):.3f}ms")
+    print(f"{delivered} events queued, ~{expected_per_update:.0f} per update")
+
+    for subscription in subscriptions:
+        feed.unsubscribe(subscription)
+    print(f"{len(db._watches)} listeners left after every client disconnected")
+
+
+if __name__ == '__main__':
+    main()
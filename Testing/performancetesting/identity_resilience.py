@@ -0,0 +1,153 @@
+"""Check the identitytoolkit client against a local mock identitytoolkit.
+
+The mock can answer normally, hang, fail a given number of times or be down.
+The script checks that calls reuse pooled keep-alive connections, that a hung
+upstream is cut off by the read timeout, that transient failures are retried,
+that signUp isn't retried once it may have been handled, and that the circuit
+breaker fails fast and recovers:
+
+    python identity_resilience.py
+"""
+import os
+import sys
+import json
+import time
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'backend')
+
+
+class MockIdentityToolkit:
+    def __init__(self):
+        self.mode = 'ok'
+        self.failures_left = 0
+        self.hang_seconds = 0
+        self.requests = 0
+        self.connections = 0
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                mock.connections += 1
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if self.path.split('?')[0].endswith(':lookup'):
+                    # Account lookups from firebase_admin during /login
+                    self.reply(200, {'users': [{'localId': 'mock-user', 'email': 'a@example.com', 'emailVerified': True}]})
+                    return
+                mock.requests += 1
+                if mock.mode == 'hang':
+                    time.sleep(mock.hang_seconds)
+                if mock.mode == 'down' or (mock.mode == 'flaky' and mock.failures_left > 0):
+                    mock.failures_left -= 1
+                    self.reply(503, {'error': {'message': 'UNAVAILABLE'}})
+                else:
+                    self.reply(200, {'localId': 'mock-user', 'idToken': 'mock-token', 'email': 'a@example.com'})
+
+            def reply(self, status, body):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.server.handle_error = lambda request, address: None  # Clients that gave up on a hung call
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def host(self):
+        return f'127.0.0.1:{self.server.server_address[1]}'
+
+    def reset(self, mode='ok', failures=0, hang_seconds=0):
+        self.mode, self.failures_left, self.hang_seconds = mode, failures, hang_seconds
+        self.requests = 0
+
+
+mock = MockIdentityToolkit()
+os.environ['DATASTORE_BACKEND'] = 'memory'
+os.environ['OUTBOX_WORKERS'] = '0'
+os.environ.setdefault('OUTBOX_PATH', os.path.join(tempfile.mkdtemp(), 'outbox.sqlite3'))
+os.environ['FIREBASE_AUTH_EMULATOR_HOST'] = mock.host
+os.environ['FIREBASE_API_KEY'] = 'mock'
+os.environ['IDENTITY_READ_TIMEOUT'] = '0.5'
+os.environ['IDENTITY_RETRIES'] = '2'
+os.environ['IDENTITY_BREAKER_THRESHOLD'] = '3'
+os.environ['IDENTITY_BREAKER_RESET_SECONDS'] = '1'
+sys.path.insert(0, os.path.abspath(BACKEND_DIR))
+
+import app as backend  # noqa: E402
+from http_client import ServiceUnavailableError  # noqa: E402
+
+failed = []
+
+
+def check(name, condition, detail=''):
+    print(f"{'ok  ' if condition else 'FAIL'} {name}{f' ({detail})' if detail else ''}")
+    if not condition:
+        failed.append(name)
+
+
+def call(endpoint='signInWithPassword'):
+    started = time.perf_counter()
+    try:
+        backend.make_firebase_request(endpoint, {'email': 'a@example.com', 'password': 'secret'})
+        error = None
+    except ServiceUnavailableError as e:
+        error = e
+    return error, time.perf_counter() - started
+
+
+def main():
+    mock.reset()
+    connections = mock.connections
+    for _ in range(20):
+        call()
+    check('20 sequential calls share one keep-alive connection', mock.connections - connections == 1,
+          f'{mock.connections - connections} connections')
+
+    mock.reset('flaky', failures=2)
+    error, _ = call()
+    check('two transient 503s are retried', error is None and mock.requests == 3, f'{mock.requests} requests')
+
+    mock.reset('hang', hang_seconds=2)
+    error, elapsed = call('signUp')
+    check('a hung signUp is cut off by the read timeout and not retried',
+          error is not None and mock.requests == 1 and elapsed < 1.5, f'{elapsed:.2f}s, {mock.requests} requests')
+
+    mock.reset('down')
+    for _ in range(3):
+        call()
+    requests_before = mock.requests
+    error, elapsed = call()
+    check('the breaker opens after repeated failures and fails fast',
+          error is not None and mock.requests == requests_before and elapsed < 0.05, f'{elapsed * 1000:.1f}ms')
+
+    client = backend.app.test_client()
+    response = client.post('/login', json={'email': 'a@example.com', 'password': 'secret'})
+    check('login answers 503 while the breaker is open', response.status_code == 503, str(response.status_code))
+
+    mock.reset()
+    time.sleep(backend.identity_toolkit.breaker.reset_seconds)
+    error, _ = call()
+    check('a trial call after the reset period closes the breaker', error is None)
+    error, _ = call()
+    check('calls go through again', error is None and mock.requests == 2, f'{mock.requests} requests')
+
+    mock.server.shutdown()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""Check that resource files are stored once per content and removed only when unused.
+
+Runs the backend against the in-memory datastore and storage. Uploads the
+same handout for many resources (from several threads at once), replaces
+and deletes them, and checks after each step how many objects are stored,
+how many storage calls were made (uploads and removals) and the reference count kept in `blobs`:
+
+    python resource_dedup.py --resources 20 --size-kb 512
+"""
+import io
+import os
+import sys
+import hashlib
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'backend')
+
+os.environ['DATASTORE_BACKEND'] = 'memory'
+os.environ['OUTBOX_WORKERS'] = '0'
+os.environ.setdefault('OUTBOX_PATH', os.path.join(tempfile.mkdtemp(), 'outbox.sqlite3'))
+os.environ.setdefault('PREVIEW_QUEUE_PATH', os.path.join(tempfile.mkdtemp(), 'previews.sqlite3'))
+os.environ.setdefault('PREVIEW_SPOOL_DIR', tempfile.mkdtemp())
+sys.path.insert(0, os.path.abspath(BACKEND_DIR))
+
+import app as backend  # noqa: E402
+from firebase_config import db  # noqa: E402
+from supabase_config import storage  # noqa: E402
+from content_store import BUCKET_NAME, BLOB_COLLECTION  # noqa: E402
+
+failures = []
+
+
+def client():
+    test_client = backend.app.test_client()
+    with test_client.session_transaction() as session:
+        session['user_id'] = 'bench-secretary'
+        session['role'] = 'secretary'
+    return test_client
+
+
+def create(content, file_name):
+    response = client().post('/create_resource', content_type='multipart/form-data', data={
+        'title': file_name, 'description': 'Handout', 'type': 'Guide',
+        'file': (io.BytesIO(content), file_name),
+    })
+    assert response.status_code == 200, response.data
+    return response.json['resourceId']
+
+
+def stored_objects():
+    return dict(storage._objects.get(BUCKET_NAME, {}))
+
+
+def ref_count(content):
+    blob = db.collection(BLOB_COLLECTION).document(hashlib.sha256(content).hexdigest()).get()
+    return blob.get('refCount') if blob.exists else None
+
+
+def check(step, objects, calls, counts):
+    stored = stored_objects()
+    print(f"{step:48} objects={len(stored):<3} storageCalls={storage.stats['calls']:<4} "
+          f"refCounts={[ref_count(content) for content in counts]}")
+    if len(stored) != objects:
+        failures.append(f'{step}: {len(stored)} objects stored, expected {objects}')
+    if calls is not None and storage.stats['calls'] != calls:
+        failures.append(f"{step}: {storage.stats['calls']} storage calls, expected {calls}")
+    for content, expected in counts.items():
+        if ref_count(content) != expected:
+            failures.append(f'{step}: refCount {ref_count(content)}, expected {expected}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--resources', type=int, default=20)
+    parser.add_argument('--size-kb', type=int, default=512)
+    args = parser.parse_args()
+
+    handout = os.urandom(args.size_kb * 1024)
+    revised = os.urandom(args.size_kb * 1024)
+
+    first = create(handout, 'handout.pdf')
+    check('first upload', 1, 1, {handout: 1})
+
+    # Same content under other names, several at once: no more uploads
+    with ThreadPoolExecutor(8) as pool:
+        copies = list(pool.map(lambda i: create(handout, f'handout-{i}.pdf'), range(args.resources - 1)))
+    check(f'{args.resources - 1} more uploads of the same file', 1, 1, {handout: args.resources})
+
+    # Different content under the same name doesn't collide
+    other = create(revised, 'handout.pdf')
+    check('different file, same name', 2, 2, {handout: args.resources, revised: 1})
+
+    # Replacing a file moves the reference
+    response = client().put('/update_resource', content_type='multipart/form-data', data={
+        'resourceId': first, 'file': (io.BytesIO(revised), 'handout-v2.pdf'),
+    })
+    assert response.status_code == 200, response.data
+    check('first resource gets the revised file', 2, 2, {handout: args.resources - 1, revised: 2})
+
+    for resource_id in copies[:-1]:
+        assert client().delete(f'/delete_resource?resourceId={resource_id}').status_code == 200
+    check('all but one copy deleted', 2, None, {handout: 1, revised: 2})
+
+    client().delete(f'/delete_resource?resourceId={copies[-1]}')
+    check('last copy deleted', 1, None, {handout: None, revised: 2})
+
+    # A file stored before hashing is only removed when no resource uses its name
+    storage.from_(BUCKET_NAME).upload('legacy.pdf', b'legacy')
+    legacy = [db.collection('resources').add({'title': 'Old', 'fileName': 'legacy.pdf'})[1].id for _ in range(2)]
+    client().delete(f'/delete_resource?resourceId={legacy[0]}')
+    check('one of two legacy resources deleted', 2, None, {})
+    client().delete(f'/delete_resource?resourceId={legacy[1]}')
+    check('both legacy resources deleted', 1, None, {})
+
+    for resource_id in (first, other):
+        client().delete(f'/delete_resource?resourceId={resource_id}')
+    check('everything deleted', 0, None, {handout: None, revised: None})
+
+    for failure in failures:
+        print(f'FAILED {failure}')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
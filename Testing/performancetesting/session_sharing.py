@@ -0,0 +1,63 @@
+"""Check that a login is honoured by every gunicorn worker.
+
+Runs the backend under gunicorn with several workers (and no sticky
+sessions), logs in against a stand-in identitytoolkit, then calls
+/check_auth many times with the session cookie. Every call must be
+authenticated, whichever worker serves it, and none may be after logout:
+
+    python session_sharing.py --workers 4 --checks 200
+    SESSION_BACKEND=redis SESSION_REDIS_URL=redis://localhost:6379/0 python session_sharing.py
+"""
+import sys
+import time
+import argparse
+import tempfile
+
+import requests
+
+from bench_modes import start_auth_stub, start_server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--checks', type=int, default=200)
+    args = parser.parse_args()
+    # start_server's settings: no added latency, one thread per worker
+    args.threads, args.datastore_latency = 1, 0
+
+    stub = start_auth_stub(0)
+    with tempfile.TemporaryDirectory() as state_dir:
+        process, url = start_server('gthread', args, f'127.0.0.1:{stub.server_address[1]}', {
+            'SESSION_DB_PATH': f'{state_dir}/sessions.sqlite3',
+            'SECRET_KEY_PATH': f'{state_dir}/secret_key',
+        })
+        try:
+            http = requests.Session()
+            response = http.post(f'{url}/login', json={'email': 'bench@example.com', 'password': 'secret'})
+            assert response.status_code == 200, response.text
+
+            latencies, authenticated = [], 0
+            for _ in range(args.checks):
+                # A new connection each time so the load spreads across workers
+                started = time.perf_counter()
+                result = requests.get(f'{url}/check_auth', cookies=http.cookies).json()
+                latencies.append((time.perf_counter() - started) * 1000)
+                authenticated += result['isAuthenticated']
+            latencies.sort()
+            print(f"{authenticated}/{args.checks} checks authenticated across {args.workers} workers, "
+                  f"p50={latencies[len(latencies) // 2]:.2f}ms")
+
+            http.post(f'{url}/logout')
+            after_logout = sum(requests.get(f'{url}/check_auth', cookies=http.cookies).json()['isAuthenticated']
+                               for _ in range(args.workers * 5))
+            print(f"{after_logout} checks authenticated after logout")
+        finally:
+            process.terminate()
+            process.wait()
+    stub.shutdown()
+    sys.exit(0 if authenticated == args.checks and after_logout == 0 else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+import http from "k6/http";
+import { check } from "k6";
+import { Counter } from "k6/metrics";
+
+// Fires BOOKINGS simultaneous create_appointment requests at the same slot.
+// Run the backend against the Firestore emulator (FIRESTORE_EMULATOR_HOST=localhost:8080)
+// and pass a verified test account:
+//   k6 run -e EMAIL=student@example.com -e PASSWORD=secret slot-race-test.js
+const API_BASE_URL = __ENV.API_BASE_URL || "http://localhost:5000";
+const BOOKINGS = parseInt(__ENV.BOOKINGS || "50");
+const SLOT_DATE = __ENV.SLOT_DATE || "2030-01-15";
+const SLOT_TIME = __ENV.SLOT_TIME || "10:30 AM";
+
+const bookingsCreated = new Counter("bookings_created");
+const bookingsRejected = new Counter("bookings_rejected");
+
+export let options = {
+  scenarios: {
+    race: {
+      executor: "per-vu-iterations",
+      vus: BOOKINGS,
+      iterations: 1,
+    },
+  },
+  thresholds: {
+    // Exactly one booking may win the slot
+    bookings_created: ["count==1"],
+  },
+};
+
+export function setup() {
+  const loginResponse = http.post(
+    `${API_BASE_URL}/login`,
+    JSON.stringify({ email: __ENV.EMAIL, password: __ENV.PASSWORD }),
+    { headers: { "Content-Type": "application/json" } }
+  );
+  check(loginResponse, {
+    "Login status is 200": (res) => res.status === 200,
+  });
+  return { session: loginResponse.cookies.session[0].value };
+}
+
+export default function (data) {
+  const response = http.post(
+    `${API_BASE_URL}/create_appointment`,
+    JSON.stringify({
+      title: "Slot race",
+      description: "Concurrent booking test",
+      appointmentDate: SLOT_DATE,
+      appointmentTime: SLOT_TIME,
+    }),
+    {
+      headers: { "Content-Type": "application/json" },
+      cookies: { session: data.session },
+    }
+  );
+
+  if (response.status === 200) {
+    bookingsCreated.add(1);
+  } else {
+    bookingsRejected.add(1);
+  }
+
+  check(response, {
+    "Booking is accepted or rejected as taken": (res) =>
+      res.status === 200 || res.status === 400,
+  });
+}
@@ -1,24 +1,43 @@
 import os
-from flask import Flask, request, jsonify, session
+from flask import Flask, request, jsonify, session, Response, stream_with_context
 from firebase_admin import firestore, auth
-import requests
-from firebase_config import db
-from supabase_config import storage
+from google.api_core.exceptions import AlreadyExists, NotFound, FailedPrecondition
+from firebase_config import db, transactional
 import functools
 from flask_cors import CORS
 import secrets
+import itertools
+import queue
 from datetime import timedelta, datetime
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+from email_outbox import enqueue_email
+from concurrent_io import run_concurrently
+from session_store import init_sessions
+from http_client import HttpClient, CircuitBreaker, ServiceUnavailableError
+from slot_index import SlotIndex
+from catalog_cache import CatalogCache
+from search_index import SearchIndex
+from change_feed import ChangeFeed, KEEPALIVE_SECONDS
+from resource_uploads import get_upload_progress, UploadTooLargeError, MAX_UPLOAD_BYTES
+from content_store import HashingRequest, save_with_file, delete_with_file
+from previews import enqueue_preview
+from projection import parse_fields, parse_expand, selected_fields, project, ProjectionError
+from pagination import wants_pagination, paginate_many, PaginationError, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from archiver import archive_name
+from dashboard_stats import record_change, counter_update, read_stats
+from bulk_writes import parse_ids, read_documents, commit_in_batches, BulkRequestError
+import metrics
+import compression
+from metrics import timed
+from user_cache import get_user_profile, get_user_profiles, remember_user_profile, invalidate_user, record_session_hit, get_stats as get_user_cache_stats
 
 app = Flask(__name__)
-app.secret_key = secrets.token_hex(16)  # Generate a secure secret key
-app.config['SESSION_TYPE'] = 'filesystem'
+app.request_class = HashingRequest  # Uploaded files are hashed while they are received
+init_sessions(app)  # Stable secret key and a session store shared by all workers
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=1)
 app.config['SESSION_COOKIE_SECURE'] = False  # Set to False for development
 app.config['SESSION_COOKIE_HTTPONLY'] = True
 app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES + 1024 * 1024  # Largest resource file plus form fields
 
 # Configure CORS with proper settings
 CORS(app, 
@@ -32,7 +51,11 @@ CORS(app,
          }
      })
 
-db = firestore.client()
+# Request and dependency latency, scraped from /metrics
+metrics.init_app(app)
+# gzip/brotli for larger JSON bodies
+compression.init_app(app)
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
 
 # Authentication and Authorization Helpers
 def verify_id_token(id_token):
@@ -41,7 +64,8 @@ def verify_id_token(id_token):
         if not id_token or not id_token.startswith('Bearer '):
             return None
         token = id_token.split('Bearer ')[1]
-        decoded_token = auth.verify_id_token(token)
+        with timed('firebase_auth', 'verify_id_token'):
+            decoded_token = auth.verify_id_token(token)
         return decoded_token
     except Exception as e:
         return None
@@ -67,13 +91,34 @@ def require_secretary_role(f):
     return decorated_function
 
 # Firebase API Helpers
+# One pooled keep-alive client per worker; signUp and update (oobCode) are not
+# retried once they may have reached identitytoolkit
+identity_toolkit = HttpClient(
+    'identitytoolkit',
+    connect_timeout=float(os.environ.get('IDENTITY_CONNECT_TIMEOUT', 3.05)),
+    read_timeout=float(os.environ.get('IDENTITY_READ_TIMEOUT', 10)),
+    retries=int(os.environ.get('IDENTITY_RETRIES', 2)),
+    breaker=CircuitBreaker(
+        threshold=int(os.environ.get('IDENTITY_BREAKER_THRESHOLD', 5)),
+        reset_seconds=float(os.environ.get('IDENTITY_BREAKER_RESET_SECONDS', 30)),
+    ),
+)
+NON_IDEMPOTENT_ENDPOINTS = {'signUp', 'update'}
+
 def get_firebase_api_url(endpoint):
+    # Local runs can point FIREBASE_AUTH_EMULATOR_HOST at the Firebase Auth emulator
+    emulator_host = os.environ.get('FIREBASE_AUTH_EMULATOR_HOST')
+    if emulator_host:
+        return f'http://{emulator_host}/identitytoolkit.googleapis.com/v1/accounts:{endpoint}?key={os.environ.get("FIREBASE_API_KEY")}'
     return f'https://identitytoolkit.googleapis.com/v1/accounts:{endpoint}?key={os.environ.get("FIREBASE_API_KEY")}'
 
 def make_firebase_request(endpoint, payload):
     url = get_firebase_api_url(endpoint)
-    response = requests.post(url, json=payload)
-    result = response.json()
+    response = identity_toolkit.post(url, endpoint, idempotent=endpoint not in NON_IDEMPOTENT_ENDPOINTS, json=payload)
+    try:
+        result = response.json()
+    except ValueError:
+        raise ServiceUnavailableError(f'identitytoolkit returned HTTP {response.status_code}')
     if 'error' in result:
         raise Exception(result['error']['message'])
     return result
@@ -98,14 +143,149 @@ def verify_email_with_code(oob_code):
 
 # User Helpers
 def get_user_role(user_id):
-    user_doc = db.collection('users').document(user_id).get()
-    return user_doc.to_dict().get('role', 'user') if user_doc.exists else 'user'
+    # The logged-in user's role was stored in the session at login
+    if user_id == session.get('user_id') and session.get('role'):
+        record_session_hit()
+        return session['role']
+    user_data = get_user_profile(user_id)
+    return user_data.get('role', 'user') if user_data else 'user'
 
 def check_user_permission(current_user_id, target_user_id, required_role='secretary'):
     if current_user_id == target_user_id:
         return True
     return get_user_role(current_user_id) == required_role
 
+# Listing Helpers
+# Set PAGINATE_LISTINGS=1 once the frontend sends `limit`/`cursor`; until then
+# listings without those parameters return the full array as before
+PAGINATE_LISTINGS = os.environ.get('PAGINATE_LISTINGS', '0') == '1'
+# User fields embedded by `expand=user`
+USER_SUMMARY_FIELDS = ('firstName', 'lastName', 'phone')
+STREAM_BATCH_SIZE = 100
+
+def merged_document(current, updated_data):
+    """The document as it reads after `updated_data` is written, without reading it back."""
+    merged = dict(current)
+    merged.update({field: value for field, value in updated_data.items() if value is not firestore.SERVER_TIMESTAMP})
+    return merged
+
+def document_to_dict(doc, fields=None):
+    data = doc.to_dict()
+    if fields is not None:
+        data = project(data, fields)
+    data['id'] = doc.id
+    return data
+
+def wants_stream():
+    """Clients opt into NDJSON streaming with `?stream=1` or `Accept: application/x-ndjson`."""
+    if request.args.get('stream', '').lower() in ('1', 'true', 'yes'):
+        return True
+    return request.accept_mimetypes.best == 'application/x-ndjson'
+
+def attach_users(items):
+    """Embed each item's user (name and phone), reading the uncached users in one batch."""
+    profiles = get_user_profiles(item['userId'] for item in items if item.get('userId'))
+    for item in items:
+        profile = profiles.get(item.get('userId'))
+        item['user'] = project(profile, USER_SUMMARY_FIELDS) if profile is not None else None
+    return items
+
+def documents_to_dicts(snapshots, fields=None, expand=()):
+    items = [document_to_dict(doc, fields) for doc in snapshots]
+    if 'user' in expand:
+        attach_users(items)
+    return items
+
+def stream_response(queries, fields=None, expand=()):
+    """Stream one JSON document per line straight from Firestore, keeping memory flat."""
+    def generate():
+        snapshots = itertools.chain.from_iterable(query.stream() for query in queries)
+        # Documents are expanded a batch at a time
+        while True:
+            batch = documents_to_dicts(itertools.islice(snapshots, STREAM_BATCH_SIZE), fields, expand)
+            if not batch:
+                break
+            for item in batch:
+                yield app.json.dumps(item) + '\n'
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+def wants_archived():
+    return request.args.get('includeArchived', '').lower() in ('1', 'true', 'yes')
+
+def list_response(query, collection_name, expandable=(), archive_query=None):
+    """Respond with the documents matched by `query`, one page at a time if requested.
+
+    With `fields=a,b` only those fields (and the id) are fetched from Firestore.
+    `expand=user` embeds each document's user, see attach_users.
+    `includeArchived=1` adds the matches of `archive_query` (see archiver.py).
+    """
+    try:
+        fields = parse_fields(request.args)
+        expand = parse_expand(request.args, expandable)
+    except ProjectionError as e:
+        return jsonify({'error': str(e)}), 400
+    queries = [query]
+    if archive_query is not None and wants_archived():
+        queries.append(archive_query)
+    if fields is not None:
+        if 'user' in expand and 'userId' not in fields:
+            fields = fields + ['userId']
+        queries = [query.select(selected_fields(fields, request.args)) for query in queries]
+    
+    if wants_stream():
+        return stream_response(queries, fields, expand)
+    
+    if not wants_pagination(request.args, PAGINATE_LISTINGS):
+        return jsonify(documents_to_dicts(itertools.chain.from_iterable(query.stream() for query in queries), fields, expand))
+    
+    try:
+        snapshots, next_cursor = paginate_many(queries, collection_name, request.args)
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({
+        'items': documents_to_dicts(snapshots, fields, expand),
+        'nextCursor': next_cursor
+    })
+
+# Bulk Helpers
+def bulk_update(collection_name, ids, updated_data):
+    """Apply the same update to many documents; returns the per-id errors and the updated documents."""
+    snapshots = read_documents(db, collection_name, ids)
+    merged = {item_id: merged_document(snapshot.to_dict(), updated_data) for item_id, snapshot in snapshots.items()}
+    operations = [
+        (item_id, [('update', snapshot.reference, updated_data, db.write_option(last_update_time=snapshot.update_time))]
+                  + counter_writes(collection_name, snapshot.to_dict(), merged[item_id]))
+        for item_id, snapshot in snapshots.items()
+    ]
+    errors = commit_in_batches(db, operations)
+    errors.update((item_id, 'Not found') for item_id in ids if item_id not in snapshots)
+    updated = [(item_id, merged[item_id]) for item_id in ids if errors[item_id] is None]
+    return errors, updated
+
+def counter_writes(collection_name, old_data=None, new_data=None):
+    """The dashboard counter write for one bulk item, committed in the item's batch."""
+    update = counter_update(collection_name, old_data, new_data)
+    return [('merge', update[0], update[1], None)] if update else []
+
+def bulk_response(ids, errors):
+    results = [{'id': item_id, 'success': errors[item_id] is None} for item_id in ids]
+    for result in results:
+        if not result['success']:
+            result['error'] = errors[result['id']]
+    succeeded = sum(1 for result in results if result['success'])
+    return jsonify({'results': results, 'succeeded': succeeded, 'failed': len(results) - succeeded})
+
+def bulk_status_update(data, valid_statuses):
+    """Validate the status/feedback fields shared by the bulk update endpoints."""
+    if 'status' in data and data['status'] not in valid_statuses:
+        raise BulkRequestError(f'Invalid status. Status must be one of: {", ".join(valid_statuses)}')
+    updated_data = {field: data[field] for field in ('status', 'feedback') if field in data}
+    if not updated_data:
+        raise BulkRequestError('No valid fields to update')
+    updated_data['lastUpdatedDate'] = firestore.SERVER_TIMESTAMP
+    return updated_data
+
 # Email Verification Endpoints
 @app.route('/send_verification_email', methods=['POST'])
 def send_verification_email_endpoint():
@@ -116,7 +296,8 @@ def send_verification_email_endpoint():
         return jsonify({'error': 'Email is required'}), 400
     
     try:
-        user = auth.get_user_by_email(email)
+        with timed('firebase_auth', 'get_user_by_email'):
+            user = auth.get_user_by_email(email)
         send_verification_email(user.uid)
         return jsonify({"message": "Verification email sent successfully"})
     except Exception as e:
@@ -133,6 +314,8 @@ def verify_email_endpoint():
     try:
         verify_email_with_code(oob_code)
         return jsonify({"message": "Email verified successfully"})
+    except ServiceUnavailableError as e:
+        return jsonify({'error': str(e)}), 503
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -171,10 +354,11 @@ def create_user():
             'createdAt': firestore.SERVER_TIMESTAMP,
             'lastUpdatedDate': firestore.SERVER_TIMESTAMP,
         }
-        db.collection('users').document(uid).set(user_data)
-        
-        # Send verification email
-        send_verification_email(id_token)
+        # Store the profile and send the verification email at the same time
+        run_concurrently(
+            lambda: db.collection('users').document(uid).set(user_data),
+            lambda: send_verification_email(id_token)
+        )
         
         return jsonify({
             "message": "User created successfully. Please check your email to verify your account before logging in.",
@@ -184,6 +368,8 @@ def create_user():
             "emailVerified": False
         }), 201
 
+    except ServiceUnavailableError as e:
+        return jsonify({'error': str(e)}), 503
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -207,10 +393,21 @@ def login():
             "password": password,
             "returnSecureToken": True
         }
-        result = make_firebase_request('signInWithPassword', signin_payload)
+
+        def load_user():
+            with timed('firebase_auth', 'get_user_by_email'):
+                user = auth.get_user_by_email(email)
+            user_doc = db.collection('users').document(user.uid).get() if user.email_verified else None
+            return user, user_doc
+
+        # The password check doesn't depend on the account lookup and profile
+        # read, so they run at the same time; a failed sign-in still wins
+        result, (user, user_doc) = run_concurrently(
+            lambda: make_firebase_request('signInWithPassword', signin_payload),
+            load_user
+        )
 
         # Check if email is verified
-        user = auth.get_user_by_email(email)
         if not user.email_verified:
             return jsonify({'error': 'Email not verified. Please verify your email first.'}), 401
 
@@ -222,7 +419,7 @@ def login():
         session['email'] = email
 
         # Get user role and details
-        user_doc = db.collection('users').document(uid).get()
+        remember_user_profile(uid, user_doc.to_dict() if user_doc.exists else None)
         if user_doc.exists:
             user_data = user_doc.to_dict()
             session['role'] = user_data.get('role', 'user')
@@ -236,6 +433,8 @@ def login():
             "role": session.get('role', 'user')
         })
 
+    except ServiceUnavailableError as e:
+        return jsonify({'error': str(e)}), 503
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -254,43 +453,72 @@ def check_auth():
             "isAuthenticated": True,
             "userId": session['user_id'],
             "email": session['email'],
-            "role": session['role']
+            "role": session.get('role', 'user')
         })
     return jsonify({"isAuthenticated": False}), 401
 
-
-def send_email(s_email, s_password, r_email, data, documentId, type, status):
-    sender_email = s_email # Replace with your email address
-    sender_password = s_password # Replace with your email (App) Password
+@app.route('/auth_cache_stats', methods=['GET'])
+@require_secretary_role
+def auth_cache_stats():
+    return jsonify(get_user_cache_stats())
+
+def user_cache_metrics():
+    stats = get_user_cache_stats()
+    lines = ['# HELP user_role_lookups_total Role lookups by where they were answered.',
+             '# TYPE user_role_lookups_total counter']
+    for source, key in (('session', 'sessionHits'), ('cache', 'cacheHits'), ('firestore', 'firestoreReads')):
+        lines.append(f'user_role_lookups_total{{source="{source}"}} {stats[key]}')
+    lines += ['# HELP user_cache_entries Profiles currently cached.', '# TYPE user_cache_entries gauge',
+              f'user_cache_entries {stats["cachedUsers"]}']
+    return lines
+
+metrics.register_collector(user_cache_metrics)
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    # Scrapers authenticate with a bearer token when METRICS_TOKEN is set
+    if METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {METRICS_TOKEN}':
+        return jsonify({'error': 'Authentication required'}), 401
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+# Email Notifications
+# Notifications are written to a durable outbox and sent by background workers
+SECRETARY_EMAIL = os.environ.get('SECRETARY_EMAIL', 'nivad94643@idoidraw.com') # Secretary - add any temp mail
+USER_NOTIFICATION_EMAIL = os.environ.get('USER_NOTIFICATION_EMAIL', 'nivad94643@idoidraw.com') # User - add any temp mail
+
+def send_email(r_email, data, documentId, type, status):
     receiver_email = r_email
 
-    message = MIMEMultipart()
-    message["From"] = sender_email
-    message["To"] = receiver_email
-
     if (status == "create"):
-        message["Subject"] = f"New {str.capitalize(type)} Created - {documentId}"
+        subject = f"New {str.capitalize(type)} Created - {documentId}"
         if (type == "ticket"):
             body = f"A new {type} has been created:\nTitle: {data['title']}\nDescription: {data['description']}\n\nBy {session.get('firstName')} {session.get('lastName')}"
         elif (type == "appointment"):
             body = f"A new {type} has been created:\nTitle: {data['title']}\nDescription: {data['description']}\nAppointment Date: {data['appointmentDate']}\n Appointment Time: {data['appointmentTime']}\n\nBy {session.get('firstName')} {session.get('lastName')}"
     
     elif (status == "update"):
-        message["Subject"] = f"{str.capitalize(type)} Updated - {documentId}"
+        subject = f"{str.capitalize(type)} Updated - {documentId}"
         body = f"Your {type} has been updated:\nTitle: {data['title']}\nDescription: {data['description']}\nStatus: {data['status']}\nFeedback: {data['feedback']}\n\nThanks,\nSmart Secretary System"
-    
-    message.attach(MIMEText(body, "plain"))
 
     try:
-        # SMTP Server
-        server = smtplib.SMTP("smtp.gmail.com", 587)
-        server.starttls()
-        server.login(sender_email, sender_password)
-        server.send_message(message)
-        server.quit()
-        print("Email sent successfully")
+        enqueue_email(receiver_email, subject, body)
+    except Exception as e:
+        print(f"Error queueing email: {e}")
+
+def send_bulk_update_email(r_email, items, type):
+    """Queue one email summarizing every item updated for this recipient."""
+    subject = f"{len(items)} {str.capitalize(type)}s Updated"
+    details = "\n\n".join(
+        f"{type.capitalize()} {documentId}:\nTitle: {data['title']}\nStatus: {data['status']}\nFeedback: {data['feedback']}"
+        for documentId, data in items
+    )
+    body = f"The following {type}s have been updated:\n\n{details}\n\nThanks,\nSmart Secretary System"
+
+    try:
+        enqueue_email(r_email, subject, body)
     except Exception as e:
-        print(f"Error sending email: {e}")
+        print(f"Error queueing email: {e}")
 
 
 # ===== USERS CRUD =====
@@ -304,28 +532,19 @@ def get_user():
     
     # Users can only get their own data unless they're a secretary
     current_user_id = session.get('user_id')
-    user_doc = db.collection('users').document(current_user_id).get()
-    user_role = user_doc.to_dict().get('role') if user_doc.exists else 'user'
-    
-    if user_id != current_user_id and user_role != 'secretary':
+    if user_id != current_user_id and get_user_role(current_user_id) != 'secretary':
         return jsonify({'error': 'Unauthorized to access this user data'}), 403
     
-    user_doc = db.collection('users').document(user_id).get()
-    if user_doc.exists:
-        return jsonify(user_doc.to_dict())
+    user_data = get_user_profile(user_id)
+    if user_data is not None:
+        return jsonify(user_data)
     return jsonify({'error': 'User not found'}), 404
 
 
 @app.route('/get_all_users', methods=['GET'])
 @require_secretary_role
 def get_all_users():
-    users = db.collection('users').stream()
-    result = []
-    for user in users:
-        user_data = user.to_dict()
-        user_data['id'] = user.id
-        result.append(user_data)
-    return jsonify(result)
+    return list_response(db.collection('users'), 'users')
 
 
 @app.route('/update_user', methods=['PUT'])
@@ -340,10 +559,7 @@ def update_user():
     current_user_id = session.get('user_id')
     
     # Only allow users to update their own data unless they're a secretary
-    user_doc = db.collection('users').document(current_user_id).get()
-    user_role = user_doc.to_dict().get('role') if user_doc.exists else 'user'
-    
-    if user_id != current_user_id and user_role != 'secretary':
+    if user_id != current_user_id and get_user_role(current_user_id) != 'secretary':
         return jsonify({'error': 'Unauthorized to update this user'}), 403
     
     # Validate and filter allowed fields
@@ -360,6 +576,14 @@ def update_user():
     updated_data['lastUpdatedDate'] = firestore.SERVER_TIMESTAMP
     
     db.collection('users').document(user_id).update(updated_data)
+    invalidate_user(user_id)
+    
+    # Keep the names used in notification emails current
+    if user_id == current_user_id:
+        for field in ['firstName', 'lastName']:
+            if field in updated_data:
+                session[field] = updated_data[field]
+    
     return jsonify({"message": "User updated successfully"})
 
 
@@ -372,9 +596,11 @@ def delete_user():
     
     try:
         # Delete user from Firebase Auth
-        auth.delete_user(user_id)
+        with timed('firebase_auth', 'delete_user'):
+            auth.delete_user(user_id)
         # Delete user data from Firestore
         db.collection('users').document(user_id).delete()
+        invalidate_user(user_id)
         return jsonify({"message": "User deleted successfully"})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -382,6 +608,17 @@ def delete_user():
 
 # ===== TICKETS CRUD =====
 
+TICKET_STATUSES = ['In Progress', 'Resolved']
+
+# Full-text index for /search, kept current by the ticket write handlers
+SEARCH_INDEX_TTL_SECONDS = int(os.environ.get('SEARCH_INDEX_TTL_SECONDS', 300))
+ticket_search = SearchIndex(
+    lambda: db.collection('tickets').select(['title', 'description', 'userId']).stream(),
+    fields={'title': 3, 'description': 1},
+    owner_field='userId',
+    ttl=SEARCH_INDEX_TTL_SECONDS
+)
+
 @app.route('/create_ticket', methods=['POST'])
 @require_auth
 def create_ticket():
@@ -402,17 +639,18 @@ def create_ticket():
         'lastUpdatedDate': firestore.SERVER_TIMESTAMP,
     }
     
-    # Add ticket to Firestore with auto-generated ID
-    ticket_ref = db.collection('tickets').add(ticket_data)
+    # Add ticket to Firestore with auto-generated ID, counting it in the same write
+    ticket_ref = db.collection('tickets').document()
+    batch = db.batch()
+    batch.set(ticket_ref, ticket_data)
+    record_change(batch, 'tickets', None, ticket_data)
+    batch.commit()
+    ticket_search.add(ticket_ref.id, ticket_data)
     
-    # Send email notification to secretary
-    sender_email = "official.smartsecretarysystem@gmail.com" # User
-    sender_password = "ygrf wpsi vblg dggi"
-    reciever_email = "nivad94643@idoidraw.com" # Secretary - add any temp mail
-    if reciever_email:
-        send_email(sender_email, sender_password, reciever_email, ticket_data, ticket_ref[1].id, "ticket", "create")
+    # Queue email notification to secretary
+    send_email(SECRETARY_EMAIL, ticket_data, ticket_ref.id, "ticket", "create")
     
-    return jsonify({'ticketId': ticket_ref[1].id})
+    return jsonify({'ticketId': ticket_ref.id})
 
 
 @app.route('/get_ticket', methods=['GET'])
@@ -423,6 +661,9 @@ def get_ticket():
         return jsonify({'error': 'ticketId is required'}), 400
     
     ticket_doc = db.collection('tickets').document(ticket_id).get()
+    if not ticket_doc.exists:
+        # Old ones may have been archived
+        ticket_doc = db.collection(archive_name('tickets')).document(ticket_id).get()
     if not ticket_doc.exists:
         return jsonify({'error': 'Ticket not found'}), 404
     
@@ -430,10 +671,7 @@ def get_ticket():
     current_user_id = session.get('user_id')
     
     # Check if the user is the owner of the ticket or a secretary
-    user_doc = db.collection('users').document(current_user_id).get()
-    user_role = user_doc.to_dict().get('role') if user_doc.exists else 'user'
-    
-    if ticket_data['userId'] != current_user_id and user_role != 'secretary':
+    if ticket_data['userId'] != current_user_id and get_user_role(current_user_id) != 'secretary':
         return jsonify({'error': 'Unauthorized to access this ticket'}), 403
     
     return jsonify(ticket_data)
@@ -442,13 +680,8 @@ def get_ticket():
 @app.route('/get_all_tickets', methods=['GET'])
 @require_secretary_role
 def get_all_tickets():
-    tickets = db.collection('tickets').stream()
-    result = []
-    for ticket in tickets:
-        ticket_data = ticket.to_dict()
-        ticket_data['id'] = ticket.id
-        result.append(ticket_data)
-    return jsonify(result)
+    return list_response(db.collection('tickets'), 'tickets', expandable=('user',),
+                         archive_query=db.collection(archive_name('tickets')))
 
 
 @app.route('/get_user_tickets', methods=['GET'])
@@ -460,19 +693,11 @@ def get_user_tickets():
     
     # If trying to access another user's tickets, check if secretary
     current_user_id = session.get('user_id')
-    if user_id != current_user_id:
-        user_doc = db.collection('users').document(current_user_id).get()
-        user_role = user_doc.to_dict().get('role') if user_doc.exists else 'user'
-        if user_role != 'secretary':
-            return jsonify({'error': 'Unauthorized to access tickets of other users'}), 403
+    if user_id != current_user_id and get_user_role(current_user_id) != 'secretary':
+        return jsonify({'error': 'Unauthorized to access tickets of other users'}), 403
     
-    tickets = db.collection('tickets').where('userId', '==', user_id).stream()
-    result = []
-    for ticket in tickets:
-        ticket_data = ticket.to_dict()
-        ticket_data['id'] = ticket.id
-        result.append(ticket_data)
-    return jsonify(result)
+    return list_response(db.collection('tickets').where('userId', '==', user_id), 'tickets', expandable=('user',),
+                         archive_query=db.collection(archive_name('tickets')).where('userId', '==', user_id))
 
 
 @app.route('/update_ticket', methods=['PUT'])
@@ -485,14 +710,9 @@ def update_ticket():
     
     ticket_id = data['ticketId']
     
-    # Check if the ticket exists
-    ticket_doc = db.collection('tickets').document(ticket_id).get()
-    if not ticket_doc.exists:
-        return jsonify({'error': 'Ticket not found'}), 404
-    
     # Validate status if it's being updated
     if 'status' in data:
-        valid_statuses = ['In Progress', 'Resolved']
+        valid_statuses = TICKET_STATUSES
         if data['status'] not in valid_statuses:
             return jsonify({'error': f'Invalid status. Status must be one of: {", ".join(valid_statuses)}'}), 400
     
@@ -509,16 +729,26 @@ def update_ticket():
     # Add lastUpdatedDate to fields being updated
     updated_data['lastUpdatedDate'] = firestore.SERVER_TIMESTAMP
     
-    db.collection('tickets').document(ticket_id).update(updated_data)
-    ticket_doc = db.collection('tickets').document(ticket_id).get()
-    ticket_data = ticket_doc.to_dict()
+    # Check if the ticket exists
+    ticket_ref = db.collection('tickets').document(ticket_id)
+    ticket_doc = ticket_ref.get()
+    if not ticket_doc.exists:
+        return jsonify({'error': 'Ticket not found'}), 404
+    
+    # Only write if nobody changed the ticket since it was read, so the
+    # notification can be built from the read instead of a second one
+    ticket_data = merged_document(ticket_doc.to_dict(), updated_data)
+    batch = db.batch()
+    batch.update(ticket_ref, updated_data, option=db.write_option(last_update_time=ticket_doc.update_time))
+    record_change(batch, 'tickets', ticket_doc.to_dict(), ticket_data)
+    try:
+        batch.commit()
+    except FailedPrecondition:
+        return jsonify({'error': 'Ticket was modified by another request. Please try again.'}), 409
+    ticket_search.update(ticket_id, updated_data)
 
-    # Send email notification to user
-    sender_email = "official.smartsecretarysystem@gmail.com" # Secretary
-    sender_password = "ygrf wpsi vblg dggi"
-    reciever_email = "nivad94643@idoidraw.com" # User - add any temp mail
-    if reciever_email:
-        send_email(sender_email, sender_password, reciever_email, ticket_data, ticket_id, "ticket", "update")
+    # Queue email notification to user
+    send_email(USER_NOTIFICATION_EMAIL, ticket_data, ticket_id, "ticket", "update")
     
     return jsonify({"message": "Ticket updated successfully"})
 
@@ -530,8 +760,9 @@ def delete_ticket():
     if not ticket_id:
         return jsonify({'error': 'ticketId is required'}), 400
     
-    # Check if the ticket exists
-    ticket_doc = db.collection('tickets').document(ticket_id).get()
+    # Check if the ticket exists; its status is needed to update the counters
+    ticket_ref = db.collection('tickets').document(ticket_id)
+    ticket_doc = ticket_ref.get()
     if not ticket_doc.exists:
         return jsonify({'error': 'Ticket not found'}), 404
     
@@ -539,18 +770,65 @@ def delete_ticket():
     current_user_id = session.get('user_id')
     
     # Check if the user is the owner of the ticket or a secretary
-    user_doc = db.collection('users').document(current_user_id).get()
-    user_role = user_doc.to_dict().get('role') if user_doc.exists else 'user'
-    
-    if ticket_data['userId'] != current_user_id and user_role != 'secretary':
+    if ticket_data['userId'] != current_user_id and get_user_role(current_user_id) != 'secretary':
         return jsonify({'error': 'Unauthorized to delete this ticket'}), 403
     
-    db.collection('tickets').document(ticket_id).delete()
+    batch = db.batch()
+    batch.delete(ticket_ref, option=db.write_option(last_update_time=ticket_doc.update_time))
+    record_change(batch, 'tickets', ticket_data, None)
+    try:
+        batch.commit()
+    except FailedPrecondition:
+        return jsonify({'error': 'Ticket was modified by another request. Please try again.'}), 409
+    ticket_search.remove(ticket_id)
     return jsonify({"message": "Ticket deleted successfully"})
 
 
+@app.route('/bulk_update_tickets', methods=['PUT'])
+@require_secretary_role
+def bulk_update_tickets():
+    data = request.get_json()
+    try:
+        ticket_ids = parse_ids(data, 'ticketIds')
+        updated_data = bulk_status_update(data, TICKET_STATUSES)
+    except BulkRequestError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    errors, updated = bulk_update('tickets', ticket_ids, updated_data)
+    
+    # Queue one summary email per recipient instead of one per ticket; every
+    # user notification currently goes to USER_NOTIFICATION_EMAIL
+    if updated:
+        send_bulk_update_email(USER_NOTIFICATION_EMAIL, updated, "ticket")
+    
+    return bulk_response(ticket_ids, errors)
+
+
+@app.route('/bulk_delete_tickets', methods=['DELETE'])
+@require_secretary_role
+def bulk_delete_tickets():
+    try:
+        ticket_ids = parse_ids(request.get_json(silent=True), 'ticketIds')
+    except BulkRequestError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    snapshots = read_documents(db, 'tickets', ticket_ids)
+    errors = commit_in_batches(db, [
+        (ticket_id, [('delete', snapshot.reference, None, db.write_option(last_update_time=snapshot.update_time))]
+                    + counter_writes('tickets', snapshot.to_dict(), None))
+        for ticket_id, snapshot in snapshots.items()
+    ])
+    errors.update((ticket_id, 'Not found') for ticket_id in ticket_ids if ticket_id not in snapshots)
+    for ticket_id in ticket_ids:
+        if errors[ticket_id] is None:
+            ticket_search.remove(ticket_id)
+    return bulk_response(ticket_ids, errors)
+
+
 # ===== APPOINTMENTS CRUD =====
 
+APPOINTMENT_STATUSES = ['In Progress', 'Approved', 'Rejected']
+
 # Allowed time slots for appointments
 ALLOWED_TIME_SLOTS = [
     "09:00 AM",
@@ -570,6 +848,49 @@ ALLOWED_TIME_SLOTS = [
     "04:00 PM",
     "04:30 PM",
 ]
+ALLOWED_SLOT_TIMES = [datetime.strptime(slot, '%I:%M %p').time() for slot in ALLOWED_TIME_SLOTS]
+
+# Booked slots per day, kept in sync by the appointment endpoints
+MAX_AVAILABILITY_DAYS = 62
+booked_slots = SlotIndex(ALLOWED_TIME_SLOTS, ttl=int(os.environ.get('AVAILABILITY_INDEX_TTL_SECONDS', 60)))
+
+# Every booking owns a `slots/{date}_{time}` document, so a slot can only be
+# created once and availability is a single document lookup
+def slot_ref(date, time):
+    return db.collection('slots').document(f"{date}_{time}")
+
+def slot_data(appointment_id, user_id, date, time):
+    return {
+        'appointmentId': appointment_id,
+        'userId': user_id,
+        'appointmentDate': date,
+        'appointmentTime': time,
+        'createdAt': firestore.SERVER_TIMESTAMP,
+    }
+
+@transactional
+def move_appointment_slot(transaction, appointment_ref, updated_data):
+    """Update an appointment and move its slot document atomically.
+
+    Returns the appointment as it was before the update. The new slot isn't
+    read; its create fails with AlreadyExists on commit if it is booked.
+    """
+    appointment_doc = appointment_ref.get(transaction=transaction)
+    if not appointment_doc.exists:
+        raise NotFound(f'Appointment {appointment_ref.id} not found')
+    current = appointment_doc.to_dict()
+    new_date = updated_data.get('appointmentDate', current['appointmentDate'])
+    new_time = updated_data.get('appointmentTime', current['appointmentTime'])
+    
+    old_slot = slot_ref(current['appointmentDate'], current['appointmentTime'])
+    new_slot = slot_ref(new_date, new_time)
+    if new_slot.id != old_slot.id:
+        transaction.delete(old_slot)
+        transaction.create(new_slot, slot_data(appointment_ref.id, current['userId'], new_date, new_time))
+    
+    transaction.update(appointment_ref, updated_data)
+    record_change(transaction, 'appointments', current, merged_document(current, updated_data))
+    return current
 
 @app.route('/create_appointment', methods=['POST'])
 @require_auth
@@ -602,12 +923,6 @@ def create_appointment():
     if data['appointmentTime'] not in ALLOWED_TIME_SLOTS:
         return jsonify({'error': 'Invalid time slot. Please select a valid time slot.'}), 400
     
-    # Check if there's already an appointment at this date and time
-    existing_appointments = db.collection('appointments').where('appointmentDate', '==', data['appointmentDate']).where('appointmentTime', '==', data['appointmentTime']).get()
-    
-    if len(existing_appointments) > 0:
-        return jsonify({'error': 'This time slot is already booked. Please choose a different time.'}), 400
-    
     # Extract validated appointment data fields
     appointment_data = {
         'title': data['title'],
@@ -621,17 +936,24 @@ def create_appointment():
         'lastUpdatedDate': firestore.SERVER_TIMESTAMP,
     }
     
-    # Add appointment to Firestore with auto-generated ID
-    appointment_ref = db.collection('appointments').add(appointment_data)
+    # Create the slot and the appointment in one atomic write; the slot create
+    # fails if the time slot is already booked
+    appointment_ref = db.collection('appointments').document()
+    batch = db.batch()
+    batch.create(slot_ref(data['appointmentDate'], data['appointmentTime']),
+                 slot_data(appointment_ref.id, session.get('user_id'), data['appointmentDate'], data['appointmentTime']))
+    batch.set(appointment_ref, appointment_data)
+    record_change(batch, 'appointments', None, appointment_data)
+    try:
+        batch.commit()
+    except AlreadyExists:
+        return jsonify({'error': 'This time slot is already booked. Please choose a different time.'}), 400
+    booked_slots.book(data['appointmentDate'], data['appointmentTime'])
 
-    # Send email notification to secretary
-    sender_email = "official.smartsecretarysystem@gmail.com" # User
-    sender_password = "ygrf wpsi vblg dggi"
-    reciever_email = "nivad94643@idoidraw.com" # Secretary - add any temp mail
-    if reciever_email:
-        send_email(sender_email, sender_password, reciever_email, appointment_data, appointment_ref[1].id, "appointment", "create")
+    # Queue email notification to secretary
+    send_email(SECRETARY_EMAIL, appointment_data, appointment_ref.id, "appointment", "create")
     
-    return jsonify({'appointmentId': appointment_ref[1].id})
+    return jsonify({'appointmentId': appointment_ref.id})
 
 
 @app.route('/get_appointment', methods=['GET'])
@@ -642,6 +964,9 @@ def get_appointment():
         return jsonify({'error': 'appointmentId is required'}), 400
     
     appointment_doc = db.collection('appointments').document(appointment_id).get()
+    if not appointment_doc.exists:
+        # Old ones may have been archived
+        appointment_doc = db.collection(archive_name('appointments')).document(appointment_id).get()
     if not appointment_doc.exists:
         return jsonify({'error': 'Appointment not found'}), 404
     
@@ -649,10 +974,7 @@ def get_appointment():
     current_user_id = session.get('user_id')
     
     # Check if the user is the owner of the appointment or a secretary
-    user_doc = db.collection('users').document(current_user_id).get()
-    user_role = user_doc.to_dict().get('role') if user_doc.exists else 'user'
-    
-    if appointment_data['userId'] != current_user_id and user_role != 'secretary':
+    if appointment_data['userId'] != current_user_id and get_user_role(current_user_id) != 'secretary':
         return jsonify({'error': 'Unauthorized to access this appointment'}), 403
     
     return jsonify(appointment_data)
@@ -661,13 +983,8 @@ def get_appointment():
 @app.route('/get_all_appointments', methods=['GET'])
 @require_secretary_role
 def get_all_appointments():
-    appointments = db.collection('appointments').stream()
-    result = []
-    for appointment in appointments:
-        appointment_data = appointment.to_dict()
-        appointment_data['id'] = appointment.id
-        result.append(appointment_data)
-    return jsonify(result)
+    return list_response(db.collection('appointments'), 'appointments', expandable=('user',),
+                         archive_query=db.collection(archive_name('appointments')))
 
 
 @app.route('/get_user_appointments', methods=['GET'])
@@ -679,19 +996,11 @@ def get_user_appointments():
     
     # If trying to access another user's appointments, check if secretary
     current_user_id = session.get('user_id')
-    if user_id != current_user_id:
-        user_doc = db.collection('users').document(current_user_id).get()
-        user_role = user_doc.to_dict().get('role') if user_doc.exists else 'user'
-        if user_role != 'secretary':
-            return jsonify({'error': 'Unauthorized to access appointments of other users'}), 403
+    if user_id != current_user_id and get_user_role(current_user_id) != 'secretary':
+        return jsonify({'error': 'Unauthorized to access appointments of other users'}), 403
     
-    appointments = db.collection('appointments').where('userId', '==', user_id).stream()
-    result = []
-    for appointment in appointments:
-        appointment_data = appointment.to_dict()
-        appointment_data['id'] = appointment.id
-        result.append(appointment_data)
-    return jsonify(result)
+    return list_response(db.collection('appointments').where('userId', '==', user_id), 'appointments', expandable=('user',),
+                         archive_query=db.collection(archive_name('appointments')).where('userId', '==', user_id))
 
 
 @app.route('/update_appointment', methods=['PUT'])
@@ -704,17 +1013,21 @@ def update_appointment():
     
     appointment_id = data['appointmentId']
     
-    # Check if the appointment exists
-    appointment_doc = db.collection('appointments').document(appointment_id).get()
-    if not appointment_doc.exists:
-        return jsonify({'error': 'Appointment not found'}), 404
-    
     # Validate status if it's being updated
     if 'status' in data:
-        valid_statuses = ['In Progress', 'Approved', 'Rejected']
+        valid_statuses = APPOINTMENT_STATUSES
         if data['status'] not in valid_statuses:
             return jsonify({'error': f'Invalid status. Status must be one of: {", ".join(valid_statuses)}'}), 400
     
+    # Validate the new slot if it's being moved
+    if 'appointmentTime' in data and data['appointmentTime'] not in ALLOWED_TIME_SLOTS:
+        return jsonify({'error': 'Invalid time slot. Please select a valid time slot.'}), 400
+    if 'appointmentDate' in data:
+        try:
+            datetime.strptime(data['appointmentDate'], '%Y-%m-%d')
+        except ValueError:
+            return jsonify({'error': 'Invalid date or time format'}), 400
+    
     # Validate and filter allowed fields
     allowed_fields = ['title', 'description', 'appointmentDate', 'appointmentTime', 'status', 'feedback']
     updated_data = {}
@@ -728,15 +1041,38 @@ def update_appointment():
     # Add lastUpdatedDate to fields being updated
     updated_data['lastUpdatedDate'] = firestore.SERVER_TIMESTAMP
     
-    db.collection('appointments').document(appointment_id).update(updated_data)
-    appointment_data = appointment_doc.to_dict()
+    appointment_ref = db.collection('appointments').document(appointment_id)
+    
+    if 'appointmentDate' in updated_data or 'appointmentTime' in updated_data:
+        # The transaction reads the appointment itself, so there is no separate existence check
+        try:
+            appointment_data = move_appointment_slot(db.transaction(), appointment_ref, updated_data)
+        except NotFound:
+            return jsonify({'error': 'Appointment not found'}), 404
+        except AlreadyExists:
+            return jsonify({'error': 'This time slot is already booked. Please choose a different time.'}), 400
+        
+        # Move the booking in the availability index
+        booked_slots.release(appointment_data.get('appointmentDate'), appointment_data.get('appointmentTime'))
+        booked_slots.book(updated_data.get('appointmentDate', appointment_data.get('appointmentDate')),
+                          updated_data.get('appointmentTime', appointment_data.get('appointmentTime')))
+    else:
+        # Check if the appointment exists
+        appointment_doc = appointment_ref.get()
+        if not appointment_doc.exists:
+            return jsonify({'error': 'Appointment not found'}), 404
+        appointment_data = appointment_doc.to_dict()
+        batch = db.batch()
+        batch.update(appointment_ref, updated_data, option=db.write_option(last_update_time=appointment_doc.update_time))
+        record_change(batch, 'appointments', appointment_data, merged_document(appointment_data, updated_data))
+        try:
+            batch.commit()
+        except FailedPrecondition:
+            return jsonify({'error': 'Appointment was modified by another request. Please try again.'}), 409
+    appointment_data = merged_document(appointment_data, updated_data)
 
-    # Send email notification to user
-    sender_email = "official.smartsecretarysystem@gmail.com" # Secretary
-    sender_password = "ygrf wpsi vblg dggi"
-    reciever_email = "nivad94643@idoidraw.com" # User - add any temp mail
-    if reciever_email:
-        send_email(sender_email, sender_password, reciever_email, appointment_data, appointment_id, "appointment", "update")
+    # Queue email notification to user
+    send_email(USER_NOTIFICATION_EMAIL, appointment_data, appointment_id, "appointment", "update")
     
     return jsonify({"message": "Appointment updated successfully"})
 
@@ -749,7 +1085,8 @@ def delete_appointment():
         return jsonify({'error': 'appointmentId is required'}), 400
     
     # Check if the appointment exists
-    appointment_doc = db.collection('appointments').document(appointment_id).get()
+    appointment_ref = db.collection('appointments').document(appointment_id)
+    appointment_doc = appointment_ref.get()
     if not appointment_doc.exists:
         return jsonify({'error': 'Appointment not found'}), 404
     
@@ -757,16 +1094,69 @@ def delete_appointment():
     current_user_id = session.get('user_id')
     
     # Check if the user is the owner of the appointment or a secretary
-    user_doc = db.collection('users').document(current_user_id).get()
-    user_role = user_doc.to_dict().get('role') if user_doc.exists else 'user'
-    
-    if appointment_data['userId'] != current_user_id and user_role != 'secretary':
+    if appointment_data['userId'] != current_user_id and get_user_role(current_user_id) != 'secretary':
         return jsonify({'error': 'Unauthorized to delete this appointment'}), 403
     
-    db.collection('appointments').document(appointment_id).delete()
+    # Delete the appointment and free its slot together; the precondition
+    # keeps a concurrently moved appointment from leaving its new slot behind
+    batch = db.batch()
+    batch.delete(appointment_ref, option=db.write_option(last_update_time=appointment_doc.update_time))
+    batch.delete(slot_ref(appointment_data.get('appointmentDate'), appointment_data.get('appointmentTime')))
+    record_change(batch, 'appointments', appointment_data, None)
+    try:
+        batch.commit()
+    except FailedPrecondition:
+        return jsonify({'error': 'Appointment was modified by another request. Please try again.'}), 409
+    booked_slots.release(appointment_data.get('appointmentDate'), appointment_data.get('appointmentTime'))
     return jsonify({"message": "Appointment deleted successfully"})
 
 
+@app.route('/bulk_update_appointments', methods=['PUT'])
+@require_secretary_role
+def bulk_update_appointments():
+    # Only status and feedback; moving an appointment needs its own transaction
+    data = request.get_json()
+    try:
+        appointment_ids = parse_ids(data, 'appointmentIds')
+        updated_data = bulk_status_update(data, APPOINTMENT_STATUSES)
+    except BulkRequestError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    errors, updated = bulk_update('appointments', appointment_ids, updated_data)
+    
+    # Queue one summary email per recipient instead of one per appointment
+    if updated:
+        send_bulk_update_email(USER_NOTIFICATION_EMAIL, updated, "appointment")
+    
+    return bulk_response(appointment_ids, errors)
+
+
+@app.route('/bulk_delete_appointments', methods=['DELETE'])
+@require_secretary_role
+def bulk_delete_appointments():
+    try:
+        appointment_ids = parse_ids(request.get_json(silent=True), 'appointmentIds')
+    except BulkRequestError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # Each appointment is deleted together with its slot
+    snapshots = read_documents(db, 'appointments', appointment_ids)
+    operations = []
+    for appointment_id, snapshot in snapshots.items():
+        appointment_data = snapshot.to_dict()
+        operations.append((appointment_id, [
+            ('delete', snapshot.reference, None, db.write_option(last_update_time=snapshot.update_time)),
+            ('delete', slot_ref(appointment_data.get('appointmentDate'), appointment_data.get('appointmentTime')), None, None),
+        ] + counter_writes('appointments', appointment_data, None)))
+    errors = commit_in_batches(db, operations)
+    errors.update((appointment_id, 'Not found') for appointment_id in appointment_ids if appointment_id not in snapshots)
+    
+    for appointment_id, snapshot in snapshots.items():
+        if errors[appointment_id] is None:
+            booked_slots.release(snapshot.get('appointmentDate'), snapshot.get('appointmentTime'))
+    return bulk_response(appointment_ids, errors)
+
+
 @app.route('/check_time_slot_availability', methods=['GET'])
 @require_auth
 def check_time_slot_availability():
@@ -796,15 +1186,100 @@ def check_time_slot_availability():
     if time not in ALLOWED_TIME_SLOTS:
         return jsonify({'error': 'Invalid time slot', 'isAvailable': False}), 400
     
-    # Check if there's already an appointment at this date and time
-    existing_appointments = db.collection('appointments').where('appointmentDate', '==', date).where('appointmentTime', '==', time).get()
-    
-    is_available = len(existing_appointments) == 0
+    # A booked slot always has its slot document
+    is_available = not slot_ref(date, time).get().exists
     return jsonify({'isAvailable': is_available})
 
 
+@app.route('/availability', methods=['GET'])
+@require_auth
+def get_availability():
+    start = request.args.get('from')
+    end = request.args.get('to')
+    
+    if not start or not end:
+        return jsonify({'error': 'from and to dates are required'}), 400
+    
+    try:
+        start_date = datetime.strptime(start, '%Y-%m-%d').date()
+        end_date = datetime.strptime(end, '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({'error': 'Invalid date format'}), 400
+    
+    if end_date < start_date:
+        return jsonify({'error': 'to must not be before from'}), 400
+    if (end_date - start_date).days >= MAX_AVAILABILITY_DAYS:
+        return jsonify({'error': f'Date range cannot exceed {MAX_AVAILABILITY_DAYS} days'}), 400
+    
+    days = [(start_date + timedelta(days=i)).isoformat() for i in range((end_date - start_date).days + 1)]
+    
+    # Load every day that isn't indexed yet with a single range query
+    missing_days = booked_slots.missing_days(days)
+    if missing_days:
+        appointments = db.collection('appointments') \
+            .where('appointmentDate', '>=', missing_days[0]) \
+            .where('appointmentDate', '<=', missing_days[-1]) \
+            .select(['appointmentDate', 'appointmentTime']) \
+            .stream()
+        booked_slots.load(missing_days, ((doc.get('appointmentDate'), doc.get('appointmentTime')) for doc in appointments))
+    
+    now = datetime.now()
+    availability = {}
+    for offset, day in enumerate(days):
+        day_date = start_date + timedelta(days=offset)
+        bitmap = booked_slots.bitmap(day)
+        availability[day] = {}
+        for i, slot in enumerate(ALLOWED_TIME_SLOTS):
+            is_past = day_date < now.date() or (day_date == now.date() and ALLOWED_SLOT_TIMES[i] < now.time())
+            availability[day][slot] = not is_past and not bitmap & (1 << i)
+    
+    return jsonify({'timeSlots': ALLOWED_TIME_SLOTS, 'availability': availability})
+
+
+# ===== DASHBOARD =====
+
+@app.route('/stats', methods=['GET'])
+@require_secretary_role
+def get_dashboard_stats():
+    # Counters are kept up to date by every ticket and appointment write
+    return jsonify(read_stats())
+
+
 # ===== RESOURCES CRUD =====
 
+# Cached snapshot of the public resources catalog, dropped on every resource write
+resource_catalog = CatalogCache(
+    lambda: [document_to_dict(doc) for doc in db.collection('resources').stream()],
+    lambda value: app.json.dumps(value),
+    ttl=int(os.environ.get('RESOURCE_CACHE_TTL_SECONDS', 30))
+)
+
+resource_search = SearchIndex(
+    lambda: db.collection('resources').select(['title', 'description', 'type', 'fileName']).stream(),
+    fields={'title': 3, 'type': 2, 'description': 1, 'fileName': 1},
+    ttl=SEARCH_INDEX_TTL_SECONDS
+)
+
+def store_resource_file(resource_ref, resource_data, file_data, create=True):
+    """Write a resource with its file, stored once per content, and return the file fields."""
+    upload_id = request.form.get('uploadId') or secrets.token_hex(8)
+    fields = save_with_file(resource_ref, resource_data, file_data, upload_id, create=create)
+    # Files seen before already have a preview; others get one from preview_worker.py
+    if 'previewUrl' not in fields:
+        try:
+            enqueue_preview(resource_ref.id, file_data, fields)
+        except Exception as e:
+            print(f"Error queueing preview: {e}")
+    return fields
+
+def cached_json_response(body, etag):
+    """JSON response with a strong ETag that answers If-None-Match with 304."""
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
 @app.route('/create_resource', methods=['POST'])
 @require_secretary_role
 def create_resource():
@@ -834,32 +1309,34 @@ def create_resource():
         'lastUpdatedDate': firestore.SERVER_TIMESTAMP,
     }
 
-    # Handle file upload if present
+    resource_ref = db.collection('resources').document()
+    # Handle file upload if present; the resource is written with its file
     if 'file' in data and data['file']:
         try:
-            # Get file data and original file name
-            file_data = data['file']
-            file_name = file_data.filename  # Get the original file name from the uploaded file
-            
-            # Upload to Supabase storage using original file name
-            bucket_name = 'resources'
-            storage.from_(bucket_name).upload(file_name, file_data.read())
-
-            # Get public URL of the uploaded file
-            file_url = storage.from_(bucket_name).get_public_url(file_name)
-            # Add download parameter to force download
-            file_url = f"{file_url}download={file_name}"
-            
-            # Add file URL to resource data
-            resource_data['fileUrl'] = file_url
-            resource_data['fileName'] = file_name  # Store original file name
+            resource_data.update(store_resource_file(resource_ref, resource_data, data['file']))
+        except UploadTooLargeError as e:
+            return jsonify({'error': str(e)}), 413
         except Exception as e:
             return jsonify({'error': f'Failed to upload file: {str(e)}'}), 500
+    else:
+        resource_ref.set(resource_data)
+    resource_catalog.invalidate()
+    resource_search.add(resource_ref.id, resource_data)
     
-    # Add resource to Firestore with auto-generated ID
-    resource_ref = db.collection('resources').add(resource_data)
+    return jsonify({'resourceId': resource_ref.id})
+
+
+@app.route('/upload_progress', methods=['GET'])
+@require_secretary_role
+def upload_progress():
+    upload_id = request.args.get('uploadId')
+    if not upload_id:
+        return jsonify({'error': 'uploadId is required'}), 400
     
-    return jsonify({'resourceId': resource_ref[1].id})
+    progress = get_upload_progress(upload_id)
+    if progress is None:
+        return jsonify({'error': 'Upload not found'}), 404
+    return jsonify(progress)
 
 
 @app.route('/get_resource', methods=['GET'])
@@ -868,6 +1345,11 @@ def get_resource():
     if not resource_id:
         return jsonify({'error': 'resourceId is required'}), 400
     
+    cached = resource_catalog.get().items.get(resource_id)
+    if cached:
+        return cached_json_response(*cached)
+    
+    # Not in the snapshot yet, e.g. created by another worker
     resource_doc = db.collection('resources').document(resource_id).get()
     if resource_doc.exists:
         return jsonify(resource_doc.to_dict())
@@ -876,13 +1358,18 @@ def get_resource():
 
 @app.route('/get_all_resources', methods=['GET'])
 def get_all_resources():
-    resources = db.collection('resources').stream()
-    result = []
-    for resource in resources:
-        resource_data = resource.to_dict()
-        resource_data['id'] = resource.id
-        result.append(resource_data)
-    return jsonify(result)
+    if wants_stream() or wants_pagination(request.args, PAGINATE_LISTINGS):
+        return list_response(db.collection('resources'), 'resources')
+    
+    try:
+        fields = parse_fields(request.args)
+        parse_expand(request.args, ())
+    except ProjectionError as e:
+        return jsonify({'error': str(e)}), 400
+    snapshot = resource_catalog.get()
+    if fields is not None:
+        return cached_json_response(*snapshot.projection(fields))
+    return cached_json_response(snapshot.body, snapshot.etag)
 
 
 @app.route('/update_resource', methods=['PUT'])
@@ -904,11 +1391,7 @@ def update_resource():
         return jsonify({'error': 'resourceId is required'}), 400
     
     resource_id = data['resourceId']
-    
-    # Check if the resource exists
-    resource_doc = db.collection('resources').document(resource_id).get()
-    if not resource_doc.exists:
-        return jsonify({'error': 'Resource not found'}), 404
+    resource_ref = db.collection('resources').document(resource_id)
     
     # Validate and filter allowed fields
     allowed_fields = ['title', 'description', 'type']
@@ -917,35 +1400,28 @@ def update_resource():
         if field in data:
             updated_data[field] = data[field]
     
-    # Handle file upload if present
-    if 'file' in data and data['file']:
-        try:
-            # Get file data and original file name
-            file_data = data['file']
-            file_name = file_data.filename  # Get the original file name from the uploaded file
-            
-            # Upload to Supabase storage using original file name
-            bucket_name = 'resources'
-            storage.from_(bucket_name).upload(file_name, file_data.read())
-            
-            # Get public URL of the uploaded file
-            file_url = storage.from_(bucket_name).get_public_url(file_name)
-            # Add download parameter to force download
-            file_url = f"{file_url}download={file_name}"
-            
-            # Add file URL to resource data
-            updated_data['fileUrl'] = file_url
-            updated_data['fileName'] = file_name  # Store original file name
-        except Exception as e:
-            return jsonify({'error': f'Failed to upload file: {str(e)}'}), 500
-    
-    if not updated_data:
+    has_file = 'file' in data and data['file']
+    if not updated_data and not has_file:
         return jsonify({'error': 'No valid fields to update'}), 400
     
     # Add lastUpdatedDate to fields being updated
     updated_data['lastUpdatedDate'] = firestore.SERVER_TIMESTAMP
     
-    db.collection('resources').document(resource_id).update(updated_data)
+    # update() fails if the resource doesn't exist
+    try:
+        if has_file:
+            # The new file takes the place of the old one in the same write
+            updated_data.update(store_resource_file(resource_ref, updated_data, data['file'], create=False))
+        else:
+            resource_ref.update(updated_data)
+    except NotFound:
+        return jsonify({'error': 'Resource not found'}), 404
+    except UploadTooLargeError as e:
+        return jsonify({'error': str(e)}), 413
+    except Exception as e:
+        return jsonify({'error': f'Failed to upload file: {str(e)}'}), 500
+    resource_catalog.invalidate()
+    resource_search.update(resource_id, updated_data)
     return jsonify({"message": "Resource updated successfully"})
 
 
@@ -956,36 +1432,121 @@ def delete_resource():
     if not resource_id:
         return jsonify({'error': 'resourceId is required'}), 400
     
-    # Check if the resource exists
-    resource_doc = db.collection('resources').document(resource_id).get()
-    if not resource_doc.exists:
-        return jsonify({'error': 'Resource not found'}), 404
-    
-    # Get resource data
-    resource_data = resource_doc.to_dict()
-    
-    # Delete file from Supabase if it exists
-    if 'fileName' in resource_data:
-        try:
-            bucket_name = 'resources'
-            storage.from_(bucket_name).remove(resource_data['fileName'])
-        except Exception as e:
-            return jsonify({
-                'error': f'Failed to delete file from storage: {str(e)}'
-            }), 500
-    
-    # Delete resource from Firestore
+    # Delete the resource; its file is removed from storage once no other resource uses it
+    resource_ref = db.collection('resources').document(resource_id)
     try:
-        db.collection('resources').document(resource_id).delete()
+        delete_with_file(resource_ref)
+        resource_catalog.invalidate()
+        resource_search.remove(resource_id)
         return jsonify({
             "message": "Resource and associated file deleted successfully"
         })
+    except NotFound:
+        return jsonify({'error': 'Resource not found'}), 404
     except Exception as e:
         return jsonify({
             'error': f'Failed to delete resource: {str(e)}'
         }), 500
 
 
+# ===== SEARCH =====
+
+@app.route('/search', methods=['GET'])
+def search():
+    query = request.args.get('q', '').strip()
+    scope = request.args.get('scope', 'tickets')
+    if not query:
+        return jsonify({'error': 'q is required'}), 400
+    if scope not in ('tickets', 'resources'):
+        return jsonify({'error': 'scope must be tickets or resources'}), 400
+    
+    try:
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+        offset = int(request.args.get('cursor') or 0)
+    except ValueError:
+        return jsonify({'error': 'limit and cursor must be integers'}), 400
+    if not 1 <= limit <= MAX_PAGE_SIZE or offset < 0:
+        return jsonify({'error': f'limit must be between 1 and {MAX_PAGE_SIZE}'}), 400
+    
+    if scope == 'resources':
+        # Resources are public, like get_all_resources
+        matches = resource_search.search(query)
+    else:
+        # Same ownership rules as get_user_tickets; secretaries search every ticket
+        current_user_id = session.get('user_id')
+        if not current_user_id:
+            return jsonify({'error': 'Authentication required'}), 401
+        user_id = request.args.get('userId')
+        if get_user_role(current_user_id) == 'secretary':
+            matches = ticket_search.search(query, owner=user_id)
+        elif user_id and user_id != current_user_id:
+            return jsonify({'error': 'Unauthorized to access tickets of other users'}), 403
+        else:
+            matches = ticket_search.search(query, owner=current_user_id)
+    
+    # The index ranks; the page itself is read from Firestore so it's never stale
+    page = matches[offset:offset + limit]
+    scores = dict(page)
+    collection = db.collection(scope)
+    references = [collection.document(doc_id) for doc_id, _ in page]
+    documents = {doc.id: doc for doc in db.get_all(references) if doc.exists} if references else {}
+    items = []
+    for doc_id, score in page:
+        if doc_id in documents:
+            item = document_to_dict(documents[doc_id])
+            item['score'] = round(scores[doc_id], 4)
+            items.append(item)
+    
+    next_offset = offset + limit
+    return jsonify({
+        'items': items,
+        'total': len(matches),
+        'nextCursor': str(next_offset) if next_offset < len(matches) else None
+    })
+
+
+# ===== EVENTS =====
+
+# Ticket and appointment changes pushed to connected clients over Server-Sent Events
+change_feed = ChangeFeed(db, ('tickets', 'appointments'), lambda value: app.json.dumps(value))
+
+@app.route('/events', methods=['GET'])
+@require_auth
+def events():
+    # Students get changes to their own tickets and appointments, secretaries get all of them
+    current_user_id = session.get('user_id')
+    subscription = change_feed.subscribe(current_user_id, see_all=get_user_role(current_user_id) == 'secretary')
+    if subscription is None:
+        return jsonify({'error': 'Too many open event streams. Please try again later.'}), 503
+    
+    def generate():
+        try:
+            yield 'retry: 5000\n\n'
+            while not subscription.overflowed:
+                try:
+                    yield subscription.events.get(timeout=KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    # Comment lines keep proxies from closing an idle stream
+                    yield ': keepalive\n\n'
+            # Events were dropped, the client should refetch its lists
+            yield 'event: resync\ndata: {}\n\n'
+        finally:
+            change_feed.unsubscribe(subscription)
+    
+    # No request context is kept for the stream's lifetime; generate() doesn't need it
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+# Build the search indexes when a worker starts instead of on the first search
+def warm_search_indexes():
+    ticket_search.warm()
+    resource_search.warm()
+
+
 # Run the Flask app
 if __name__ == '__main__':
+    warm_search_indexes()
     app.run(debug=True, port=5000)
\ No newline at end of file
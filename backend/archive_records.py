@@ -0,0 +1,30 @@
+"""Move resolved tickets, rejected appointments and past appointments older
+than ARCHIVE_AFTER_DAYS (default 90) into `tickets_archive` and
+`appointments_archive`. Schedule it daily, e.g. from cron:
+0 3 * * * cd /srv/backend && python archive_records.py
+
+Use --dry-run to only count what would move, or --every HOURS to keep
+running and archive on that interval.
+"""
+import time
+import argparse
+from archiver import ARCHIVED_COLLECTIONS, ARCHIVE_AFTER_DAYS, archive_collection
+
+
+def archive_all(dry_run=False):
+    for collection_name in ARCHIVED_COLLECTIONS:
+        moved, skipped = archive_collection(collection_name, dry_run=dry_run)
+        action = 'would move' if dry_run else 'moved'
+        print(f"{collection_name}: {action} {moved} documents older than {ARCHIVE_AFTER_DAYS} days, skipped {skipped}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dry-run', action='store_true')
+    parser.add_argument('--every', type=float, metavar='HOURS')
+    args = parser.parse_args()
+
+    archive_all(args.dry_run)
+    while args.every:
+        time.sleep(args.every * 3600)
+        archive_all(args.dry_run)
@@ -0,0 +1,76 @@
+import os
+from datetime import datetime, timedelta, timezone
+from google.api_core.exceptions import FailedPrecondition, NotFound
+from firebase_admin import firestore
+from firebase_config import db
+
+# Resolved tickets, rejected appointments and past appointments older than
+# this move out of the collections the listings read
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', 90))
+# Each archived document is one set and one delete, within the 500-write batch limit
+ARCHIVE_BATCH_SIZE = 200
+ARCHIVED_COLLECTIONS = ('tickets', 'appointments')
+DOCUMENT_ID = '__name__'
+
+
+def archive_name(collection_name):
+    return f'{collection_name}_archive'
+
+
+def archive_queries(collection_name, now):
+    """(query, range field) pairs matching the documents that are old enough to archive."""
+    cutoff = now - timedelta(days=ARCHIVE_AFTER_DAYS)
+    collection = db.collection(collection_name)
+    if collection_name == 'tickets':
+        return [(collection.where('status', '==', 'Resolved').where('lastUpdatedDate', '<', cutoff), 'lastUpdatedDate')]
+    return [
+        (collection.where('appointmentDate', '<', cutoff.date().isoformat()), 'appointmentDate'),
+        (collection.where('status', '==', 'Rejected').where('lastUpdatedDate', '<', cutoff), 'lastUpdatedDate'),
+    ]
+
+
+def _move(collection_name, snapshots):
+    # The delete only applies if the document hasn't changed since it was read
+    batch = db.batch()
+    for snapshot in snapshots:
+        batch.set(db.collection(archive_name(collection_name)).document(snapshot.id),
+                  {**snapshot.to_dict(), 'archivedAt': firestore.SERVER_TIMESTAMP})
+        batch.delete(snapshot.reference, option=db.write_option(last_update_time=snapshot.update_time))
+    batch.commit()
+
+
+def archive_collection(collection_name, now=None, dry_run=False):
+    """Move the old documents of `collection_name` to its archive collection in batches.
+
+    Returns (moved, skipped); a document that changes while it is being
+    archived is skipped and picked up by the next run if it still qualifies.
+    """
+    now = now or datetime.now(timezone.utc)
+    moved = skipped = 0
+    matched = set()  # Ids found by a dry run; an appointment can match both queries
+    for query, range_field in archive_queries(collection_name, now):
+        query = query.order_by(range_field).order_by(DOCUMENT_ID)
+        last = None
+        while True:
+            page = query.start_after(last) if last is not None else query
+            snapshots = list(page.limit(ARCHIVE_BATCH_SIZE).stream())
+            if not snapshots:
+                break
+            last = snapshots[-1]
+            if dry_run:
+                matched.update(snapshot.id for snapshot in snapshots)
+            else:
+                try:
+                    _move(collection_name, snapshots)
+                    moved += len(snapshots)
+                except (FailedPrecondition, NotFound):
+                    # Something in the batch changed; move the rest one by one
+                    for snapshot in snapshots:
+                        try:
+                            _move(collection_name, [snapshot])
+                            moved += 1
+                        except (FailedPrecondition, NotFound):
+                            skipped += 1
+            if len(snapshots) < ARCHIVE_BATCH_SIZE:
+                break
+    return (len(matched) if dry_run else moved), skipped
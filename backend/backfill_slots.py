@@ -0,0 +1,30 @@
+"""Create the `slots/{date}_{time}` documents for appointments booked before
+slot reservations existed. Run once before deploying: python backfill_slots.py
+"""
+from google.api_core.exceptions import AlreadyExists
+from firebase_config import db
+from app import slot_ref, slot_data
+
+
+def backfill_slots():
+    created, conflicts = 0, []
+    for appointment in db.collection('appointments').stream():
+        data = appointment.to_dict()
+        date, time = data.get('appointmentDate'), data.get('appointmentTime')
+        if not date or not time:
+            continue
+        try:
+            slot_ref(date, time).create(slot_data(appointment.id, data.get('userId'), date, time))
+            created += 1
+        except AlreadyExists:
+            owner = slot_ref(date, time).get().get('appointmentId')
+            if owner != appointment.id:
+                conflicts.append((appointment.id, owner, date, time))
+    return created, conflicts
+
+
+if __name__ == '__main__':
+    created, conflicts = backfill_slots()
+    print(f"Created {created} slot documents")
+    for appointment_id, owner, date, time in conflicts:
+        print(f"Double booking: {appointment_id} and {owner} both hold {date} {time}")
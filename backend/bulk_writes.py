@@ -0,0 +1,94 @@
+from google.api_core.exceptions import GoogleAPICallError, NotFound, FailedPrecondition
+
+MAX_BULK_ITEMS = 500
+# Firestore accepts at most 500 writes in one batch
+BATCH_WRITE_LIMIT = 500
+
+
+class BulkRequestError(ValueError):
+    """Raised when the list of ids in a bulk request is missing or invalid."""
+
+
+def parse_ids(data, key):
+    """Return the unique ids under `key`, in the order they were sent."""
+    ids = (data or {}).get(key)
+    if not isinstance(ids, list) or not ids:
+        raise BulkRequestError(f'{key} must be a non-empty list')
+    if not all(isinstance(item_id, str) and item_id and '/' not in item_id for item_id in ids):
+        raise BulkRequestError(f'{key} must only contain document ids')
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > MAX_BULK_ITEMS:
+        raise BulkRequestError(f'At most {MAX_BULK_ITEMS} ids can be sent at once')
+    return ids
+
+
+def read_documents(db, collection_name, ids):
+    """Read every document in one round trip; returns {id: snapshot} for those that exist."""
+    collection = db.collection(collection_name)
+    snapshots = db.get_all([collection.document(item_id) for item_id in ids])
+    return {snapshot.id: snapshot for snapshot in snapshots if snapshot.exists}
+
+
+def _add_writes(batch, writes):
+    for kind, reference, data, option in writes:
+        if kind == 'update':
+            batch.update(reference, data, option=option)
+        elif kind == 'merge':
+            batch.set(reference, data, merge=True)
+        else:
+            batch.delete(reference, option=option)
+
+
+def _describe(error):
+    if isinstance(error, FailedPrecondition):
+        return 'Modified by another request. Please try again.'
+    if isinstance(error, NotFound):
+        return 'Not found'
+    return str(error)
+
+
+def commit_in_batches(db, operations):
+    """Commit each item's writes, packing as many items as fit into one batch.
+
+    `operations` is a list of (item_id, writes) where each write is a
+    (kind, reference, data, option) tuple and kind is 'update', 'merge'
+    (set with merge=True) or 'delete'.
+    An item's writes always land in the same batch. If a batch fails, its
+    items are retried one batch each so only the failing items are reported.
+    Returns {item_id: error message or None}.
+    """
+    results = {}
+    chunk, chunk_writes = [], 0
+    chunks = []
+    for item_id, writes in operations:
+        if chunk and chunk_writes + len(writes) > BATCH_WRITE_LIMIT:
+            chunks.append(chunk)
+            chunk, chunk_writes = [], 0
+        chunk.append((item_id, writes))
+        chunk_writes += len(writes)
+    if chunk:
+        chunks.append(chunk)
+
+    for chunk in chunks:
+        batch = db.batch()
+        for _, writes in chunk:
+            _add_writes(batch, writes)
+        try:
+            batch.commit()
+            results.update((item_id, None) for item_id, _ in chunk)
+            continue
+        except GoogleAPICallError as e:
+            if len(chunk) == 1:
+                results[chunk[0][0]] = _describe(e)
+                continue
+
+        # Find out which items failed
+        for item_id, writes in chunk:
+            batch = db.batch()
+            _add_writes(batch, writes)
+            try:
+                batch.commit()
+                results[item_id] = None
+            except GoogleAPICallError as e:
+                results[item_id] = _describe(e)
+    return results
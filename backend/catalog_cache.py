@@ -0,0 +1,73 @@
+import time
+import hashlib
+import threading
+from projection import project
+
+MAX_PROJECTIONS = 16  # Field lists whose bodies are kept per snapshot
+
+
+class CatalogSnapshot:
+    """Serialized catalog plus per-item bodies, each with a strong ETag."""
+
+    def __init__(self, items, dumps):
+        self.dumps = dumps
+        self.documents = items
+        self.body = dumps(items).encode('utf-8')
+        self.etag = hashlib.sha256(self.body).hexdigest()
+        self._projections = {}
+        self.items = {}
+        for item in items:
+            item = dict(item)
+            item_id = item.pop('id')
+            item_body = dumps(item).encode('utf-8')
+            self.items[item_id] = (item_body, hashlib.sha256(item_body).hexdigest())
+
+    def projection(self, fields):
+        """The catalog body and ETag with only `fields` (and the id) of each item, built once per field list."""
+        key = tuple(fields)
+        projected = self._projections.get(key)
+        if projected is None:
+            body = self.dumps([{**project(item, fields), 'id': item['id']} for item in self.documents]).encode('utf-8')
+            projected = (body, hashlib.sha256(body).hexdigest())
+            if len(self._projections) < MAX_PROJECTIONS:
+                self._projections[key] = projected
+        return projected
+
+
+class CatalogCache:
+    """Process-local snapshot of a whole collection.
+
+    The snapshot is rebuilt at most once at a time, dropped by `invalidate()`
+    after local writes, and expires after `ttl` seconds so writes made by other
+    worker processes become visible.
+    """
+
+    def __init__(self, loader, dumps, ttl=30):
+        self.loader = loader
+        self.dumps = dumps
+        self.ttl = ttl
+        self._snapshot = None
+        self._loaded_at = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self):
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._loaded_at < self.ttl:
+            return snapshot
+
+        with self._lock:
+            # Another thread may have rebuilt it while we waited
+            if self._snapshot is not None and time.monotonic() - self._loaded_at < self.ttl:
+                return self._snapshot
+            generation = self._generation
+            snapshot = CatalogSnapshot(self.loader(), self.dumps)
+            # Don't keep a snapshot that was invalidated while it was loading
+            if generation == self._generation:
+                self._snapshot = snapshot
+                self._loaded_at = time.monotonic()
+            return snapshot
+
+    def invalidate(self):
+        self._generation += 1
+        self._snapshot = None
@@ -0,0 +1,120 @@
+import os
+import queue
+import threading
+from datetime import datetime, timezone
+
+MAX_EVENT_STREAMS = int(os.environ.get('MAX_EVENT_STREAMS', 1000))
+MAX_QUEUED_EVENTS = 100
+KEEPALIVE_SECONDS = 15
+
+# Document fields sent with each change event
+EVENT_FIELDS = ('title', 'status', 'feedback', 'appointmentDate', 'appointmentTime', 'lastUpdatedDate')
+
+
+class Subscription:
+    """One connected client's queue of formatted events."""
+
+    def __init__(self, user_id, see_all):
+        self.user_id = user_id
+        self.see_all = see_all
+        self.events = queue.Queue(maxsize=MAX_QUEUED_EVENTS)
+        self.overflowed = False
+
+    def push(self, event):
+        try:
+            self.events.put_nowait(event)
+        except queue.Full:
+            # The client isn't keeping up; it will be told to refetch
+            self.overflowed = True
+
+
+class ChangeFeed:
+    """Fans a single Firestore listener per collection out to many clients.
+
+    The listeners only watch documents written after they started, are
+    started by the first subscriber and stopped when the last one leaves.
+    Each change is serialized once and queued for its owner's subscriptions
+    and for every subscription that sees all users (secretaries).
+    """
+
+    def __init__(self, db, collection_names, dumps):
+        self.db = db
+        self.collection_names = collection_names
+        self.dumps = dumps
+        self._by_user = {}
+        self._see_all = set()
+        self._count = 0
+        self._watches = []
+        self._lock = threading.Lock()
+        self._watch_lock = threading.Lock()
+
+    def subscribe(self, user_id, see_all=False):
+        """Return a new Subscription, or None when MAX_EVENT_STREAMS are already open."""
+        with self._lock:
+            if self._count >= MAX_EVENT_STREAMS:
+                return None
+            subscription = Subscription(user_id, see_all)
+            if see_all:
+                self._see_all.add(subscription)
+            else:
+                self._by_user.setdefault(user_id, set()).add(subscription)
+            self._count += 1
+        self._update_listeners()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            if subscription.see_all:
+                self._see_all.discard(subscription)
+            else:
+                subscriptions = self._by_user.get(subscription.user_id, set())
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    self._by_user.pop(subscription.user_id, None)
+            self._count -= 1
+        self._update_listeners()
+
+    def _update_listeners(self):
+        # Listeners are started and stopped under their own lock, never while
+        # holding the one the listener callbacks take
+        with self._watch_lock:
+            with self._lock:
+                wanted = self._count > 0
+            if wanted and not (self._watches and all(watch.is_active for watch in self._watches)):
+                self._stop()
+                since = datetime.now(timezone.utc)
+                for collection_name in self.collection_names:
+                    query = self.db.collection(collection_name).where('lastUpdatedDate', '>=', since)
+                    self._watches.append(query.on_snapshot(self._listener(collection_name)))
+            elif not wanted:
+                self._stop()
+
+    def _stop(self):
+        for watch in self._watches:
+            watch.unsubscribe()
+        self._watches = []
+
+    def _listener(self, collection_name):
+        initial = [True]
+
+        def on_snapshot(documents, changes, read_time):
+            # The first callback only lists what already matched when the listener started
+            if initial[0]:
+                initial[0] = False
+                return
+            for change in changes:
+                self._publish(collection_name, change)
+        return on_snapshot
+
+    def _publish(self, collection_name, change):
+        data = change.document.to_dict() or {}
+        payload = {
+            'id': change.document.id,
+            'type': 'removed' if change.type.name == 'REMOVED' else 'changed',
+            **{field: data[field] for field in EVENT_FIELDS if field in data},
+        }
+        event = f"event: {collection_name}\ndata: {self.dumps(payload)}\n\n"
+        with self._lock:
+            subscriptions = list(self._by_user.get(data.get('userId'), ())) + list(self._see_all)
+        for subscription in subscriptions:
+            subscription.push(event)
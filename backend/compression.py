@@ -0,0 +1,77 @@
+import os
+import gzip
+import threading
+import brotli
+from flask import request
+
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', 1024))
+COMPRESSIBLE_MIMETYPES = {'application/json', 'text/plain', 'text/html', 'text/csv'}
+# Quick settings for bodies compressed per request
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+# Bodies with an ETag (e.g. the resource catalog) are compressed once and kept
+CACHED_BODIES = 64
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _encode(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def _choose_encoding():
+    accepted = request.accept_encodings
+    for encoding in ('br', 'gzip'):
+        if accepted[encoding]:
+            return encoding
+    return None
+
+
+def _cached_encode(etag, body, encoding):
+    key = (etag, encoding)
+    encoded = _cache.get(key)
+    if encoded is None:
+        encoded = _encode(body, encoding)
+        with _cache_lock:
+            if len(_cache) >= CACHED_BODIES:
+                _cache.pop(next(iter(_cache)))
+            _cache[key] = encoded
+    return encoded
+
+
+def compress_response(response):
+    """Compress a buffered JSON or text body with brotli or gzip, whichever the client prefers."""
+    if (response.direct_passthrough or response.is_streamed or response.status_code < 200
+            or response.status_code in (204, 206, 304) or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_BYTES:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = _choose_encoding()
+    if encoding is None:
+        return response
+
+    etag, weak = response.get_etag()
+    if etag:
+        # Each encoding is a different representation, so it gets its own ETag
+        response.set_etag(f'{etag}-{encoding}', weak=weak)
+        response.make_conditional(request)
+        if response.status_code == 304:
+            return response
+        encoded = _cached_encode(etag, body, encoding)
+    else:
+        encoded = _encode(body, encoding)
+
+    response.set_data(encoded)
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def init_app(app):
+    app.after_request(compress_response)
@@ -0,0 +1,33 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Threads for overlapping independent network calls within one request.
+# Under gunicorn's gevent worker these threads are greenlets.
+IO_POOL_SIZE = int(os.environ.get('IO_POOL_SIZE', 32))
+
+_pool = None
+_pool_pid = None
+_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool, _pool_pid
+    # A pool's threads don't survive a fork, so each worker creates its own
+    if _pool_pid != os.getpid():
+        with _lock:
+            if _pool_pid != os.getpid():
+                _pool = ThreadPoolExecutor(max_workers=IO_POOL_SIZE, thread_name_prefix='io')
+                _pool_pid = os.getpid()
+    return _pool
+
+
+def run_concurrently(*calls):
+    """Run independent blocking calls at the same time and return their results in order.
+
+    If several calls fail, the exception of the first one (in argument order)
+    is raised. The calls must not use the Flask request or session.
+    """
+    pool = _get_pool()
+    futures = [pool.submit(call) for call in calls]
+    return [future.result() for future in futures]
@@ -0,0 +1,266 @@
+import time
+import hashlib
+from datetime import datetime, timedelta, timezone
+from tempfile import SpooledTemporaryFile
+from flask import Request
+from google.api_core.exceptions import AlreadyExists, FailedPrecondition, NotFound
+from firebase_admin import firestore
+from firebase_config import db
+from supabase_config import storage
+from resource_uploads import upload_file
+from metrics import timed
+
+# Resource files are stored once per content under `sha256/<digest>`, and
+# `blobs/<digest>` counts the resources that use it. A blob whose count drops
+# to 0 is a tombstone until its object has been removed from storage. The
+# preview made by preview_worker.py is stored next to it and shared the same way.
+BUCKET_NAME = 'resources'
+BLOB_COLLECTION = 'blobs'
+# Same threshold as Werkzeug's default upload stream
+SPOOL_MAX_BYTES = 500 * 1024
+READ_CHUNK_BYTES = 1024 * 1024
+# A tombstone this old belongs to a delete that didn't finish and may be taken over
+REMOVAL_TIMEOUT = timedelta(seconds=60)
+COMMIT_ATTEMPTS = 5
+RETRY_DELAY_SECONDS = 0.2
+
+
+class HashingSpool:
+    """Spooled upload file that hashes the bytes as Werkzeug writes them."""
+
+    def __init__(self):
+        self._file = SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES, mode='rb+')
+        self._sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self._sha256.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    def hexdigest(self):
+        return self._sha256.hexdigest()
+
+    def __iter__(self):
+        return iter(self._file)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+class HashingRequest(Request):
+    """Request whose file uploads are hashed while the form is parsed."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return HashingSpool()
+
+
+def file_digest(file_storage):
+    """(sha256 hex digest, size) of an uploaded file, reading it only if it wasn't hashed while spooled."""
+    stream = file_storage.stream
+    if isinstance(stream, HashingSpool):
+        return stream.hexdigest(), stream.size
+    sha256, size = hashlib.sha256(), 0
+    stream.seek(0)
+    for chunk in iter(lambda: stream.read(READ_CHUNK_BYTES), b''):
+        sha256.update(chunk)
+        size += len(chunk)
+    stream.seek(0)
+    return sha256.hexdigest(), size
+
+
+def object_name(digest):
+    return f'sha256/{digest}'
+
+
+def preview_object_name(digest):
+    return f'sha256/{digest}.preview.webp'
+
+
+def _blob_ref(digest):
+    return db.collection(BLOB_COLLECTION).document(digest)
+
+
+def _unchanged(snapshot):
+    return db.write_option(last_update_time=snapshot.update_time)
+
+
+def _is_live(blob):
+    return blob.exists and blob.get('refCount') > 0
+
+
+def _is_stale(blob):
+    return datetime.now(timezone.utc) - blob.update_time > REMOVAL_TIMEOUT
+
+
+def file_fields(file_name, digest, size):
+    """Fields stored on a resource for its file."""
+    file_url = storage.from_(BUCKET_NAME).get_public_url(object_name(digest))
+    return {
+        # Downloads are still saved under the original file name
+        'fileUrl': f"{file_url}download={file_name}",
+        'fileName': file_name,
+        'fileHash': digest,
+        'fileSize': size,
+    }
+
+
+def preview_fields(digest, size_bytes):
+    """Fields stored on a resource for the preview of its file."""
+    return {
+        'previewUrl': storage.from_(BUCKET_NAME).get_public_url(preview_object_name(digest)).rstrip('?'),
+        'previewSizeBytes': size_bytes,
+    }
+
+
+def _stored_preview(blob):
+    data = blob.to_dict() if _is_live(blob) else None
+    if data and data.get('previewSizeBytes'):
+        return preview_fields(blob.id, data['previewSizeBytes'])
+    return {}
+
+
+def _acquire(batch, blob, digest, size):
+    # The precondition fails the batch if another request changed the count since it was read
+    if blob.exists:
+        batch.update(blob.reference, {'refCount': blob.get('refCount') + 1}, option=_unchanged(blob))
+    else:
+        batch.create(blob.reference, {
+            'refCount': 1,
+            'size': size,
+            'objectName': object_name(digest),
+            'createdAt': firestore.SERVER_TIMESTAMP,
+        })
+
+
+def _release(batch, blob):
+    """Drop one reference on `blob`; returns True if that leaves a tombstone."""
+    if not blob.exists:
+        return False
+    count = blob.get('refCount')
+    batch.update(blob.reference, {'refCount': max(count - 1, 0)}, option=_unchanged(blob))
+    return count <= 1
+
+
+def _remove_object(blob_ref, update_time):
+    """Remove a tombstoned blob's object, then the tombstone itself unless it was taken over."""
+    try:
+        with timed('supabase_storage', 'remove', BUCKET_NAME):
+            storage.from_(BUCKET_NAME).remove([object_name(blob_ref.id), preview_object_name(blob_ref.id)])
+        blob_ref.delete(option=db.write_option(last_update_time=update_time))
+    except (FailedPrecondition, NotFound):
+        pass
+    except Exception as e:
+        # The tombstone stays and is taken over by the next upload of the same content
+        print(f"Error removing stored file {blob_ref.id}: {e}")
+
+
+def _remove_legacy_file(file_name):
+    """Remove a file stored under its own name, unless another resource from before hashing still uses it."""
+    others = db.collection('resources').where('fileName', '==', file_name).select(['fileHash']).stream()
+    if any('fileHash' not in doc.to_dict() for doc in others):
+        return
+    try:
+        with timed('supabase_storage', 'remove', BUCKET_NAME):
+            storage.from_(BUCKET_NAME).remove(file_name)
+    except Exception as e:
+        print(f"Error removing stored file {file_name}: {e}")
+
+
+def _release_previous(previous, blobs, batch):
+    """Release the file of the resource as it was before the write; returns a cleanup function."""
+    old_digest = previous.get('fileHash')
+    if old_digest:
+        old_blob = blobs[old_digest]
+        if _release(batch, old_blob):
+            return lambda update_time: _remove_object(old_blob.reference, update_time)
+    elif previous.get('fileName'):
+        return lambda update_time: _remove_legacy_file(previous['fileName'])
+    return None
+
+
+def save_with_file(resource_ref, resource_data, file_storage, upload_id, create=True):
+    """Write a resource with `file_storage` as its file and return the file fields.
+
+    The file is only uploaded if no stored object has the same content, in
+    which case its preview fields are returned too if it already has one. The
+    resource and the blob counts change in one batch; when the file replaces
+    another one, the old file loses a reference in the same batch. Raises
+    NotFound if the resource to update doesn't exist.
+    """
+    digest, size = file_digest(file_storage)
+    fields = file_fields(file_storage.filename, digest, size)
+    error = None
+    for _ in range(COMMIT_ATTEMPTS):
+        previous = {}
+        if not create:
+            current = resource_ref.get()
+            if not current.exists:
+                raise NotFound(f'Resource {resource_ref.id} not found')
+            previous = current.to_dict()
+        digests = {digest, previous.get('fileHash')} - {None}
+        blobs = {blob.id: blob for blob in db.get_all([_blob_ref(d) for d in digests])}
+        blob = blobs[digest]
+
+        if previous.get('fileHash') == digest:
+            # Same content as before, the counts don't change
+            batch, cleanup = db.batch(), None
+        else:
+            if blob.exists and not _is_live(blob) and not _is_stale(blob):
+                # Wait for the delete in progress to remove the object
+                time.sleep(RETRY_DELAY_SECONDS)
+                continue
+            if not _is_live(blob):
+                upload_file(BUCKET_NAME, object_name(digest), file_storage, upload_id, upsert=True)
+            batch = db.batch()
+            _acquire(batch, blob, digest, size)
+            cleanup = _release_previous(previous, blobs, batch)
+
+        preview = _stored_preview(blob)
+        if create:
+            batch.set(resource_ref, {**resource_data, **fields, **preview})
+        else:
+            # A preview of the previous file must not stay on the resource
+            cleared = {'previewUrl': firestore.DELETE_FIELD, 'previewSizeBytes': firestore.DELETE_FIELD}
+            batch.update(resource_ref, {**resource_data, **fields, **(preview or cleared)}, option=_unchanged(current))
+        try:
+            results = batch.commit()
+        except (AlreadyExists, FailedPrecondition) as e:
+            error = e
+            continue
+        except NotFound:
+            raise NotFound(f'Resource {resource_ref.id} not found')
+        if cleanup:
+            cleanup(results[-1].update_time)
+        return {**fields, **preview}
+    raise error or Exception('The file is being removed, try again')
+
+
+def delete_with_file(resource_ref):
+    """Delete a resource and drop its reference on its file; returns the deleted data.
+
+    The stored object is removed once no resource references it. Raises
+    NotFound if the resource doesn't exist.
+    """
+    error = None
+    for _ in range(COMMIT_ATTEMPTS):
+        current = resource_ref.get()
+        if not current.exists:
+            raise NotFound(f'Resource {resource_ref.id} not found')
+        resource_data = current.to_dict()
+        blobs = {}
+        if resource_data.get('fileHash'):
+            blobs[resource_data['fileHash']] = _blob_ref(resource_data['fileHash']).get()
+
+        batch = db.batch()
+        batch.delete(resource_ref, option=_unchanged(current))
+        cleanup = _release_previous(resource_data, blobs, batch)
+        try:
+            results = batch.commit()
+        except FailedPrecondition as e:
+            error = e
+            continue
+        if cleanup:
+            cleanup(results[-1].update_time)
+        return resource_data
+    raise error
@@ -0,0 +1,112 @@
+import os
+import random
+from firebase_admin import firestore
+from firebase_config import db
+from archiver import archive_name
+
+# Counters for each collection are spread over a few `stats/{collection}_{n}`
+# documents so busy periods don't hit Firestore's per-document write limit
+COUNTER_SHARDS = int(os.environ.get('STATS_COUNTER_SHARDS', 4))
+COUNTED_COLLECTIONS = ('tickets', 'appointments')
+
+# Counter map -> document field it groups by
+COUNTED_FIELDS = {
+    'tickets': {'byStatus': 'status'},
+    'appointments': {'byStatus': 'status', 'byDate': 'appointmentDate'},
+}
+
+
+def shard_ref(collection_name, shard):
+    return db.collection('stats').document(f'{collection_name}_{shard}')
+
+
+def counter_delta(collection_name, old_data=None, new_data=None):
+    """How the counters change when `old_data` is replaced by `new_data`.
+
+    Pass None as `old_data` for a created document and as `new_data` for a
+    deleted one.
+    """
+    delta = {'total': (new_data is not None) - (old_data is not None)}
+    for data, step in ((old_data, -1), (new_data, 1)):
+        if data is None:
+            continue
+        for counter, field in COUNTED_FIELDS[collection_name].items():
+            key = data.get(field)
+            if key:
+                counts = delta.setdefault(counter, {})
+                counts[key] = counts.get(key, 0) + step
+    return delta
+
+
+def _increments(delta):
+    increments = {}
+    for key, value in delta.items():
+        if isinstance(value, dict):
+            nested = _increments(value)
+            if nested:
+                increments[key] = nested
+        elif value:
+            increments[key] = firestore.Increment(value)
+    return increments
+
+
+def counter_update(collection_name, old_data=None, new_data=None):
+    """Return (shard reference, merge data) for the change, or None if no counter moves."""
+    increments = _increments(counter_delta(collection_name, old_data, new_data))
+    if not increments:
+        return None
+    return shard_ref(collection_name, random.randrange(COUNTER_SHARDS)), increments
+
+
+def record_change(batch, collection_name, old_data=None, new_data=None):
+    """Add the counter update to the batch or transaction writing the document."""
+    update = counter_update(collection_name, old_data, new_data)
+    if update is not None:
+        batch.set(*update, merge=True)
+
+
+def _add_counts(total, counts):
+    for key, value in counts.items():
+        if isinstance(value, dict):
+            _add_counts(total.setdefault(key, {}), value)
+        else:
+            total[key] = total.get(key, 0) + value
+
+
+def _drop_zero_counts(counts):
+    for key, value in list(counts.items()):
+        if isinstance(value, dict):
+            _drop_zero_counts(value)
+        elif value == 0 and key != 'total':
+            del counts[key]
+
+
+def read_stats():
+    """Sum every shard; the read size depends only on COUNTER_SHARDS."""
+    references = [shard_ref(collection_name, shard)
+                  for collection_name in COUNTED_COLLECTIONS for shard in range(COUNTER_SHARDS)]
+    stats = {collection_name: {'total': 0, **{counter: {} for counter in COUNTED_FIELDS[collection_name]}}
+             for collection_name in COUNTED_COLLECTIONS}
+    for snapshot in db.get_all(references):
+        if snapshot.exists:
+            _add_counts(stats[snapshot.id.rsplit('_', 1)[0]], snapshot.to_dict())
+    _drop_zero_counts(stats)
+    return stats
+
+
+def rebuild_counters(collection_name):
+    """Recount `collection_name` and its archive from their documents and replace its shards."""
+    counts = {'total': 0}
+    fields = list(COUNTED_FIELDS[collection_name].values())
+    # Archiving moves documents without changing the counters
+    for source in (collection_name, archive_name(collection_name)):
+        for doc in db.collection(source).select(fields).stream():
+            _add_counts(counts, counter_delta(collection_name, None, doc.to_dict()))
+
+    batch = db.batch()
+    for doc in db.collection('stats').select([]).stream():
+        if doc.id.rsplit('_', 1)[0] == collection_name:
+            batch.delete(doc.reference)
+    batch.set(shard_ref(collection_name, 0), counts)
+    batch.commit()
+    return counts
@@ -0,0 +1,219 @@
+import os
+import time
+import random
+import sqlite3
+import smtplib
+import threading
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+from metrics import timed
+
+# Outbox location and SMTP settings (override with environment variables,
+# e.g. SMTP_HOST=localhost SMTP_PORT=8025 SMTP_STARTTLS=0 for a local aiosmtpd)
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+OUTBOX_PATH = os.environ.get('OUTBOX_PATH', os.path.join(BASE_DIR, 'outbox.sqlite3'))
+OUTBOX_WORKERS = int(os.environ.get('OUTBOX_WORKERS', 2))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', 6))
+OUTBOX_BACKOFF_SECONDS = float(os.environ.get('OUTBOX_BACKOFF_SECONDS', 2))
+OUTBOX_LEASE_SECONDS = 300  # Messages stuck in 'sending' longer than this are retried
+
+SMTP_HOST = os.environ.get('SMTP_HOST', 'smtp.gmail.com')
+SMTP_PORT = int(os.environ.get('SMTP_PORT', 587))
+SMTP_STARTTLS = os.environ.get('SMTP_STARTTLS', '1') == '1'
+SMTP_USER = os.environ.get('SMTP_USER', 'official.smartsecretarysystem@gmail.com')
+SMTP_PASSWORD = os.environ.get('SMTP_PASSWORD', 'ygrf wpsi vblg dggi')
+SMTP_IDLE_SECONDS = 60  # Reused connections idle longer than this are checked with NOOP
+
+_wakeup = threading.Event()
+_local = threading.local()
+_workers_lock = threading.Lock()
+_workers_pid = None
+
+
+def _connect():
+    conn = sqlite3.connect(OUTBOX_PATH, timeout=30, isolation_level=None)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            recipient TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            body TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            claimed_at REAL,
+            last_error TEXT,
+            created_at REAL NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt_at)')
+    return conn
+
+
+def _thread_connection():
+    # One connection per request thread, never shared across a fork
+    if getattr(_local, 'pid', None) != os.getpid():
+        _local.conn = _connect()
+        _local.pid = os.getpid()
+    return _local.conn
+
+
+def enqueue_email(recipient, subject, body):
+    """Store a message in the outbox and wake the sender workers."""
+    now = time.time()
+    cursor = _thread_connection().execute(
+        'INSERT INTO outbox (recipient, subject, body, next_attempt_at, created_at) VALUES (?, ?, ?, ?, ?)',
+        (recipient, subject, body, now, now)
+    )
+    message_id = cursor.lastrowid
+
+    start_workers()
+    _wakeup.set()
+    return message_id
+
+
+def start_workers():
+    """Start the sender threads once per process (safe to call after a fork)."""
+    global _workers_pid
+    if OUTBOX_WORKERS <= 0 or _workers_pid == os.getpid():
+        return
+    with _workers_lock:
+        if _workers_pid == os.getpid():
+            return
+        for i in range(OUTBOX_WORKERS):
+            worker = threading.Thread(target=_worker_loop, name=f'email-outbox-{i}', daemon=True)
+            worker.start()
+        _workers_pid = os.getpid()
+
+
+def _claim_next(conn):
+    """Atomically mark the next due message as 'sending' and return it."""
+    now = time.time()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        row = conn.execute(
+            '''SELECT id, recipient, subject, body, attempts FROM outbox
+               WHERE (status = 'pending' AND next_attempt_at <= ?)
+                  OR (status = 'sending' AND claimed_at <= ?)
+               ORDER BY next_attempt_at LIMIT 1''',
+            (now, now - OUTBOX_LEASE_SECONDS)
+        ).fetchone()
+        if row:
+            conn.execute("UPDATE outbox SET status = 'sending', claimed_at = ? WHERE id = ?", (now, row[0]))
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    return row
+
+
+def _build_message(recipient, subject, body):
+    message = MIMEMultipart()
+    message["From"] = SMTP_USER
+    message["To"] = recipient
+    message["Subject"] = subject
+    message.attach(MIMEText(body, "plain"))
+    return message
+
+
+class _SmtpConnection:
+    """A single authenticated SMTP connection that is reused between messages."""
+
+    def __init__(self):
+        self.server = None
+        self.last_used = 0
+
+    def _open(self):
+        server = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=30)
+        if SMTP_STARTTLS:
+            server.starttls()
+        if SMTP_PASSWORD:
+            server.login(SMTP_USER, SMTP_PASSWORD)
+        self.server = server
+
+    def _is_alive(self):
+        if time.time() - self.last_used < SMTP_IDLE_SECONDS:
+            return True
+        try:
+            return self.server.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def send(self, message):
+        if self.server is None or not self._is_alive():
+            self.close()
+            self._open()
+        try:
+            with timed('smtp', 'send_message'):
+                self.server.send_message(message)
+        except (smtplib.SMTPServerDisconnected, OSError):
+            # The server dropped a reused connection, reconnect once
+            self.close()
+            self._open()
+            with timed('smtp', 'send_message'):
+                self.server.send_message(message)
+        self.last_used = time.time()
+
+    def close(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except Exception:
+                pass
+        self.server = None
+
+
+def _worker_loop():
+    conn = _connect()
+    smtp = _SmtpConnection()
+    while True:
+        try:
+            row = _claim_next(conn)
+        except sqlite3.Error as e:
+            print(f"Error reading email outbox: {e}")
+            row = None
+
+        if row is None:
+            _wakeup.wait(timeout=5)
+            _wakeup.clear()
+            continue
+
+        message_id, recipient, subject, body, attempts = row
+        try:
+            smtp.send(_build_message(recipient, subject, body))
+            conn.execute("UPDATE outbox SET status = 'sent', last_error = NULL WHERE id = ?", (message_id,))
+        except Exception as e:
+            smtp.close()
+            attempts += 1
+            if attempts >= OUTBOX_MAX_ATTEMPTS:
+                status, next_attempt_at = 'failed', time.time()
+                print(f"Error sending email {message_id}, giving up: {e}")
+            else:
+                # Exponential backoff with jitter
+                delay = OUTBOX_BACKOFF_SECONDS * (2 ** (attempts - 1))
+                status, next_attempt_at = 'pending', time.time() + random.uniform(delay / 2, delay)
+                print(f"Error sending email {message_id} (attempt {attempts}): {e}")
+            conn.execute(
+                'UPDATE outbox SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?',
+                (status, attempts, next_attempt_at, str(e), message_id)
+            )
+
+
+def drain(timeout=None):
+    """Wait until no message is pending or being sent, e.g. before shutting down."""
+    deadline = None if timeout is None else time.time() + timeout
+    conn = _connect()
+    try:
+        while True:
+            pending = conn.execute(
+                "SELECT COUNT(*) FROM outbox WHERE status IN ('pending', 'sending')"
+            ).fetchone()[0]
+            if pending == 0:
+                return True
+            if deadline is not None and time.time() >= deadline:
+                return False
+            _wakeup.set()
+            time.sleep(0.1)
+    finally:
+        conn.close()
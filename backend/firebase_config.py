@@ -1,14 +1,37 @@
 import os
 import firebase_admin
 from firebase_admin import credentials, firestore
+from google.cloud import firestore as google_firestore
+from lazy_client import LazyClient
+from metrics import instrument_firestore
 
 # Get absolute path to the service account key
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 SERVICE_ACCOUNT_PATH = os.path.join(BASE_DIR, 'firebase-service-account.json')
 
-# Initialize Firebase Admin
-cred = credentials.Certificate(SERVICE_ACCOUNT_PATH)
-firebase_admin.initialize_app(cred)
+# 'firebase' (default) or 'memory' for a local in-process datastore
+DATASTORE_BACKEND = os.environ.get('DATASTORE_BACKEND', 'firebase')
 
-# Initialize Firestore
-db = firestore.client()
+
+def _create_firestore_client():
+    # Built directly instead of firestore.client(), which would reuse a client
+    # (and its gRPC channel) cached on the app before a fork
+    app = firebase_admin.get_app()
+    client = google_firestore.Client(credentials=app.credential.get_credential(), project=app.project_id)
+    return instrument_firestore(client)
+
+
+if DATASTORE_BACKEND == 'memory':
+    from local_datastore import MemoryFirestore, transactional
+
+    # Firebase Auth calls still need an app; point FIREBASE_AUTH_EMULATOR_HOST at a local emulator
+    firebase_admin.initialize_app(options={'projectId': os.environ.get('FIREBASE_PROJECT_ID', 'demo-smart-secretary')})
+    db = MemoryFirestore()
+else:
+    # Initialize Firebase Admin (only loads the credentials, no connection is opened)
+    cred = credentials.Certificate(SERVICE_ACCOUNT_PATH)
+    firebase_admin.initialize_app(cred)
+
+    # Firestore is connected lazily, once per worker process
+    db = LazyClient('Firestore', _create_firestore_client)
+    transactional = firestore.transactional
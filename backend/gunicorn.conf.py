@@ -0,0 +1,64 @@
+"""Production server settings: gunicorn -c gunicorn.conf.py
+
+Workers are forked before any Firestore or Supabase client exists; each
+worker creates its own clients on first use (see lazy_client.py).
+
+GUNICORN_WORKER_CLASS=gevent serves each request on a greenlet instead of a
+thread, so requests waiting on Firestore, identitytoolkit, Supabase or SMTP
+don't cap a worker's concurrency (GUNICORN_WORKER_CONNECTIONS per worker).
+
+The master also starts preview_worker.py, which renders resource previews in
+its own processes, unless PREVIEW_WORKER=0.
+"""
+import os
+import sys
+import time
+import subprocess
+import multiprocessing
+
+wsgi_app = 'app:app'
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))
+preload_app = False  # Import the app in each worker, after the fork
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+accesslog = '-'
+preview_worker = os.environ.get('PREVIEW_WORKER', '1') == '1'
+
+
+def on_starting(server):
+    server.started_at = time.perf_counter()
+
+
+def when_ready(server):
+    server.log.info('Master ready in %.3fs', time.perf_counter() - server.started_at)
+    server.preview_worker = None
+    if preview_worker:
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'preview_worker.py')
+        server.preview_worker = subprocess.Popen([sys.executable, script], cwd=os.path.dirname(script))
+        server.log.info('Started preview worker %s', server.preview_worker.pid)
+
+
+def on_exit(server):
+    if getattr(server, 'preview_worker', None):
+        server.preview_worker.terminate()
+        server.preview_worker.wait(timeout=graceful_timeout)
+
+
+def post_fork(server, worker):
+    worker.forked_at = time.perf_counter()
+
+
+def post_worker_init(worker):
+    worker.log.info('Worker %s loaded the app in %.3fs', worker.pid, time.perf_counter() - worker.forked_at)
+    if worker_class == 'gevent':
+        # gRPC (Firestore) must cooperate with gevent before any channel is opened
+        import grpc.experimental.gevent
+        grpc.experimental.gevent.init_gevent()
+    # The app module is already imported in this worker
+    from app import warm_search_indexes
+    warm_search_indexes()
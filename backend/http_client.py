@@ -0,0 +1,119 @@
+import os
+import time
+import random
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from lazy_client import LazyClient
+from metrics import timed
+
+# Responses worth another attempt; 429 and 503 mean the request wasn't handled
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+UNHANDLED_STATUSES = {429, 503}
+
+
+class ServiceUnavailableError(Exception):
+    """The upstream service failed or its circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Stops calling a service after `threshold` failures in a row.
+
+    While open, calls fail straight away. After `reset_seconds` one trial call
+    is let through; its success closes the breaker, its failure opens it again.
+    """
+
+    def __init__(self, threshold=5, reset_seconds=30):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._reset_lock)
+
+    def _reset_lock(self):
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_seconds or self._trial:
+                return False
+            self._trial = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial or self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+            self._trial = False
+
+
+class HttpClient:
+    """Pooled keep-alive HTTP client for one upstream service.
+
+    Every request has connect and read timeouts. Connection errors, timeouts
+    and 5xx/429 responses are retried with exponential backoff and full
+    jitter, and too many failures in a row open the circuit breaker.
+    Requests that are not idempotent are only retried when the service
+    can't have handled them.
+    """
+
+    def __init__(self, name, connect_timeout=3.05, read_timeout=10, retries=2, backoff=0.2,
+                 pool_size=32, breaker=None):
+        self.name = name
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self.breaker = breaker or CircuitBreaker()
+        # Connection pools must not be shared across a fork
+        self._session = LazyClient(f'{name} HTTP', self._create_session)
+
+    def _create_session(self):
+        http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+        http.mount('https://', adapter)
+        http.mount('http://', adapter)
+        return http
+
+    def _retryable(self, error, response, idempotent):
+        if error is not None:
+            # A connection that timed out never reached the service
+            return idempotent or isinstance(error, requests.ConnectTimeout)
+        return response.status_code in (RETRY_STATUSES if idempotent else UNHANDLED_STATUSES)
+
+    def request(self, method, url, operation, idempotent=True, **kwargs):
+        """Send a request and return the response; raise ServiceUnavailableError if the service failed."""
+        if not self.breaker.allow():
+            raise ServiceUnavailableError(f'{self.name} is temporarily unavailable')
+        kwargs.setdefault('timeout', self.timeout)
+        for attempt in range(self.retries + 1):
+            error = response = None
+            try:
+                with timed(self.name, operation):
+                    response = self._session.request(method, url, **kwargs)
+            except requests.RequestException as e:
+                error = e
+            if error is None and response.status_code not in RETRY_STATUSES:
+                self.breaker.record_success()
+                return response
+            if attempt == self.retries or not self._retryable(error, response, idempotent):
+                break
+            time.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+
+        self.breaker.record_failure()
+        detail = str(error) if error is not None else f'HTTP {response.status_code}'
+        raise ServiceUnavailableError(f'{self.name} request failed: {detail}')
+
+    def post(self, url, operation, idempotent=True, **kwargs):
+        return self.request('POST', url, operation, idempotent, **kwargs)
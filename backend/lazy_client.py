@@ -0,0 +1,36 @@
+import os
+import time
+import threading
+
+
+class LazyClient:
+    """Proxy that creates the real client on first use, once per process.
+
+    Clients holding gRPC channels or HTTP connection pools must not be shared
+    across a fork, so a worker that was forked from a process which already
+    created the client builds its own on first use.
+    """
+
+    def __init__(self, name, factory):
+        self._name = name
+        self._factory = factory
+        self._client = None
+        self._pid = None
+        self._lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._reset_lock)
+
+    def _reset_lock(self):
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    started = time.perf_counter()
+                    self._client = self._factory()
+                    self._pid = os.getpid()
+                    print(f"{self._name} client created in {time.perf_counter() - started:.3f}s (pid {self._pid})")
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
@@ -0,0 +1,613 @@
+"""In-memory stand-ins for the Firestore client and Supabase storage.
+
+Enabled with DATASTORE_BACKEND=memory so the whole API can be run, profiled
+and load tested on one machine without cloud credentials. Only the part of
+the client APIs used by this backend is implemented. Every simulated round
+trip is counted in `stats` so hot paths can be compared across backends, and
+can be slowed down with MEMORY_DATASTORE_LATENCY_MS to mimic the network.
+"""
+import os
+import copy
+import time
+import random
+import string
+import threading
+import functools
+from datetime import datetime, timezone, timedelta
+from google.api_core.exceptions import NotFound, AlreadyExists, FailedPrecondition
+from google.cloud.firestore_v1 import transforms
+from google.cloud.firestore_v1.watch import ChangeType, DocumentChange
+
+DOCUMENT_ID = '__name__'
+_ID_CHARS = string.ascii_letters + string.digits
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _get_path(data, field_path):
+    value = data
+    for part in field_path.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            raise KeyError(field_path)
+        value = value[part]
+    return value
+
+
+def _apply_value(target, key, value):
+    """Set `target[key]` to `value`, resolving Firestore transforms."""
+    if value is transforms.DELETE_FIELD:
+        target.pop(key, None)
+    elif value is transforms.SERVER_TIMESTAMP:
+        target[key] = _now()
+    elif isinstance(value, transforms.Increment):
+        target[key] = target.get(key, 0) + value.value
+    elif isinstance(value, transforms.ArrayUnion):
+        current = list(target.get(key, []))
+        target[key] = current + [item for item in value.values if item not in current]
+    elif isinstance(value, transforms.ArrayRemove):
+        target[key] = [item for item in target.get(key, []) if item not in value.values]
+    elif isinstance(value, dict):
+        nested = {}
+        for nested_key, nested_value in value.items():
+            _apply_value(nested, nested_key, nested_value)
+        target[key] = nested
+    else:
+        target[key] = copy.deepcopy(value)
+
+
+def _merge_into(target, data):
+    for key, value in data.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge_into(target[key], value)
+        else:
+            _apply_value(target, key, value)
+
+
+def _update_path(target, field_path, value):
+    parts = field_path.split('.')
+    for part in parts[:-1]:
+        if not isinstance(target.get(part), dict):
+            target[part] = {}
+        target = target[part]
+    _apply_value(target, parts[-1], value)
+
+
+def _sort_key(value):
+    # Firestore orders values by type first, then by value
+    if value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (1, value)
+    if isinstance(value, (int, float)):
+        return (2, value)
+    if isinstance(value, datetime):
+        return (3, value)
+    if isinstance(value, str):
+        return (4, value)
+    return (5, str(value))
+
+
+_OPERATORS = {
+    '==': lambda a, b: a == b,
+    '!=': lambda a, b: a != b,
+    '<': lambda a, b: _sort_key(a) < _sort_key(b),
+    '<=': lambda a, b: _sort_key(a) <= _sort_key(b),
+    '>': lambda a, b: _sort_key(a) > _sort_key(b),
+    '>=': lambda a, b: _sort_key(a) >= _sort_key(b),
+    'in': lambda a, b: a in b,
+    'not-in': lambda a, b: a not in b,
+    'array_contains': lambda a, b: isinstance(a, list) and b in a,
+    'array-contains': lambda a, b: isinstance(a, list) and b in a,
+}
+
+
+class WriteOption:
+    def __init__(self, last_update_time=None, exists=None):
+        self.last_update_time = last_update_time
+        self.exists = exists
+
+
+class DocumentSnapshot:
+    def __init__(self, reference, data, create_time=None, update_time=None, field_paths=None):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+        self.create_time = create_time
+        self.update_time = update_time
+        self.read_time = _now()
+        if data is not None and field_paths is not None:
+            projected = {}
+            for field_path in field_paths:
+                try:
+                    _update_path(projected, field_path, _get_path(data, field_path))
+                except KeyError:
+                    pass
+            self._data = projected
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field_path):
+        if self._data is None:
+            return None
+        return copy.deepcopy(_get_path(self._data, field_path))
+
+
+class DocumentReference:
+    def __init__(self, client, collection_name, document_id):
+        self._client = client
+        self.id = document_id
+        self.path = f'{collection_name}/{document_id}'
+        self._collection_name = collection_name
+
+    @property
+    def parent(self):
+        return self._client.collection(self._collection_name)
+
+    def get(self, field_paths=None, transaction=None):
+        self._client._record('get', self._collection_name, reads=1)
+        return self._client._snapshot(self, field_paths)
+
+    def create(self, document_data):
+        return self._client._commit([('create', self, document_data, None)])
+
+    def set(self, document_data, merge=False):
+        return self._client._commit([('set', self, document_data, merge)])
+
+    def update(self, field_updates, option=None):
+        return self._client._commit([('update', self, field_updates, option)])
+
+    def delete(self, option=None):
+        return self._client._commit([('delete', self, None, option)])
+
+    def collection(self, name):
+        return self._client.collection(f'{self.path}/{name}')
+
+    def __eq__(self, other):
+        return isinstance(other, DocumentReference) and other.path == self.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+
+class Query:
+    ASCENDING = 'ASCENDING'
+    DESCENDING = 'DESCENDING'
+
+    def __init__(self, client, collection_name, filters=(), orders=(), limit=None,
+                 start_after=None, projection=None):
+        self._client = client
+        self._collection_name = collection_name
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._start_after = start_after
+        self._projection = projection
+
+    def _copy(self, **changes):
+        fields = {
+            'filters': self._filters,
+            'orders': self._orders,
+            'limit': self._limit,
+            'start_after': self._start_after,
+            'projection': self._projection,
+        }
+        fields.update(changes)
+        return Query(self._client, self._collection_name, **fields)
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path, direction=ASCENDING):
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def start_after(self, document_fields_or_snapshot):
+        return self._copy(start_after=document_fields_or_snapshot)
+
+    def select(self, field_paths):
+        return self._copy(projection=list(field_paths))
+
+    def _value(self, snapshot_data, document_id, field_path):
+        if field_path == DOCUMENT_ID:
+            return document_id
+        return _get_path(snapshot_data, field_path)
+
+    def _cursor_values(self):
+        cursor = self._start_after
+        if isinstance(cursor, DocumentSnapshot):
+            data = dict(cursor._data or {}, **{DOCUMENT_ID: cursor.id})
+        else:
+            data = dict(cursor)
+        values = []
+        for field_path, _ in self._orders:
+            value = data[field_path]
+            if field_path == DOCUMENT_ID and isinstance(value, DocumentReference):
+                value = value.id
+            values.append(value)
+        return values
+
+    def _matches(self, document_id, data):
+        for field_path, op_string, value in self._filters:
+            try:
+                field_value = self._value(data, document_id, field_path)
+            except KeyError:
+                return False
+            if not _OPERATORS[op_string](field_value, value):
+                return False
+        return True
+
+    def _run(self):
+        rows = []
+        for document_id, (data, create_time, update_time) in self._client._documents(self._collection_name):
+            if not self._matches(document_id, data):
+                continue
+            try:
+                keys = [self._value(data, document_id, field_path) for field_path, _ in self._orders]
+            except KeyError:
+                continue  # Documents without an ordered field are excluded
+            rows.append((keys, document_id, data, create_time, update_time))
+
+        orders = list(self._orders) or [(DOCUMENT_ID, Query.ASCENDING)]
+        if not self._orders:
+            rows = [([document_id], document_id, data, c, u) for _, document_id, data, c, u in rows]
+        for index in reversed(range(len(orders))):
+            rows.sort(key=lambda row: _sort_key(row[0][index]), reverse=orders[index][1] == Query.DESCENDING)
+
+        if self._start_after is not None:
+            cursor = self._cursor_values()
+            rows = [row for row in rows if self._after(row[0], cursor, orders)]
+
+        if self._limit is not None:
+            rows = rows[:self._limit]
+        return rows
+
+    def _after(self, keys, cursor, orders):
+        for key, value, (_, direction) in zip(keys, cursor, orders):
+            if _sort_key(key) == _sort_key(value):
+                continue
+            if direction == Query.DESCENDING:
+                return _sort_key(key) < _sort_key(value)
+            return _sort_key(key) > _sort_key(value)
+        return False
+
+    def stream(self, transaction=None):
+        with self._client._lock:
+            rows = self._run()
+        self._client._record('query', self._collection_name, reads=max(len(rows), 1))
+        for _, document_id, data, create_time, update_time in rows:
+            reference = DocumentReference(self._client, self._collection_name, document_id)
+            yield DocumentSnapshot(reference, copy.deepcopy(data), create_time, update_time, self._projection)
+
+    def get(self, transaction=None):
+        return list(self.stream(transaction=transaction))
+
+    def on_snapshot(self, callback):
+        return self._client._watch(self, callback)
+
+    def _snapshots(self):
+        return [DocumentSnapshot(DocumentReference(self._client, self._collection_name, document_id),
+                                 copy.deepcopy(data), create_time, update_time, self._projection)
+                for _, document_id, data, create_time, update_time in self._run()]
+
+
+class Watch:
+    """Listener returned by `on_snapshot`; callbacks run in the writing thread."""
+
+    def __init__(self, client, query, callback):
+        self._client = client
+        self._query = query
+        self._callback = callback
+        self._snapshots = {}
+        self.is_active = True
+
+    def _changes(self, document_ids):
+        """Diff the query result against the last one for the written documents."""
+        snapshots = self._query._snapshots()
+        by_id = {snapshot.id: snapshot for snapshot in snapshots}
+        changes = []
+        for document_id in document_ids:
+            snapshot = by_id.get(document_id)
+            previous = self._snapshots.get(document_id)
+            if snapshot is None and previous is not None:
+                changes.append(DocumentChange(ChangeType.REMOVED, previous, -1, -1))
+            elif snapshot is not None and previous is None:
+                changes.append(DocumentChange(ChangeType.ADDED, snapshot, -1, snapshots.index(snapshot)))
+            elif snapshot is not None and previous.update_time != snapshot.update_time:
+                index = snapshots.index(snapshot)
+                changes.append(DocumentChange(ChangeType.MODIFIED, snapshot, index, index))
+        self._snapshots = by_id
+        return snapshots, changes
+
+    def unsubscribe(self):
+        self.is_active = False
+        with self._client._lock:
+            if self in self._client._watches:
+                self._client._watches.remove(self)
+
+
+class CollectionReference(Query):
+    def __init__(self, client, name):
+        super().__init__(client, name)
+        self.id = name.rsplit('/', 1)[-1]
+
+    def document(self, document_id=None):
+        if document_id is None:
+            document_id = ''.join(random.choice(_ID_CHARS) for _ in range(20))
+        return DocumentReference(self._client, self._collection_name, document_id)
+
+    def add(self, document_data, document_id=None):
+        reference = self.document(document_id)
+        write_result = reference.create(document_data)
+        return write_result.update_time, reference
+
+
+class WriteResult:
+    def __init__(self, update_time):
+        self.update_time = update_time
+
+
+class WriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def create(self, reference, document_data):
+        self._writes.append(('create', reference, document_data, None))
+
+    def set(self, reference, document_data, merge=False):
+        self._writes.append(('set', reference, document_data, merge))
+
+    def update(self, reference, field_updates, option=None):
+        self._writes.append(('update', reference, field_updates, option))
+
+    def delete(self, reference, option=None):
+        self._writes.append(('delete', reference, None, option))
+
+    def commit(self):
+        if not self._writes:
+            return []
+        result = self._client._commit(self._writes)
+        self._writes = []
+        return [result]
+
+    def __len__(self):
+        return len(self._writes)
+
+
+class Transaction(WriteBatch):
+    """Writes are buffered and committed when the transactional function returns."""
+
+    def get(self, reference_or_query):
+        if isinstance(reference_or_query, DocumentReference):
+            return reference_or_query.get(transaction=self)
+        return reference_or_query.stream(transaction=self)
+
+
+def transactional(func):
+    """Run `func(transaction, ...)` and commit its writes atomically.
+
+    The client lock is held for the whole function, so concurrent
+    transactions are serialized instead of retried.
+    """
+    @functools.wraps(func)
+    def wrapper(transaction, *args, **kwargs):
+        with transaction._client._lock:
+            result = func(transaction, *args, **kwargs)
+            transaction.commit()
+            return result
+    return wrapper
+
+
+class MemoryFirestore:
+    """Thread-safe in-memory subset of `google.cloud.firestore.Client`."""
+
+    def __init__(self, latency_ms=None):
+        if latency_ms is None:
+            latency_ms = float(os.environ.get('MEMORY_DATASTORE_LATENCY_MS', 0))
+        self.latency = latency_ms / 1000
+        self._lock = threading.RLock()
+        self._data = {}
+        self._last_update_time = _now()
+        self._watches = []
+        self.operation_hooks = []
+        self.reset_stats()
+
+    # Accounting
+    def reset_stats(self):
+        self.stats = {'roundTrips': 0, 'reads': 0, 'writes': 0, 'byOperation': {}}
+
+    def _record(self, operation, collection_name, reads=0, writes=0):
+        with self._lock:
+            self.stats['roundTrips'] += 1
+            self.stats['reads'] += reads
+            self.stats['writes'] += writes
+            key = f'{collection_name}.{operation}'
+            self.stats['byOperation'][key] = self.stats['byOperation'].get(key, 0) + 1
+        for hook in self.operation_hooks:
+            hook(operation, collection_name, reads, writes)
+        if self.latency:
+            time.sleep(self.latency)
+
+    # Client API
+    def collection(self, name):
+        return CollectionReference(self, name)
+
+    def document(self, path):
+        collection_name, document_id = path.rsplit('/', 1)
+        return DocumentReference(self, collection_name, document_id)
+
+    def batch(self):
+        return WriteBatch(self)
+
+    def transaction(self, **kwargs):
+        return Transaction(self)
+
+    def write_option(self, last_update_time=None, exists=None):
+        return WriteOption(last_update_time, exists)
+
+    def _watch(self, query, callback):
+        watch = Watch(self, query, callback)
+        with self._lock:
+            self._watches.append(watch)
+            snapshots = query._snapshots()
+            watch._snapshots = {snapshot.id: snapshot for snapshot in snapshots}
+        # Like Firestore, the first callback reports every matching document as added
+        callback(snapshots, [DocumentChange(ChangeType.ADDED, snapshot, -1, index)
+                             for index, snapshot in enumerate(snapshots)], _now())
+        return watch
+
+    def _notify(self, writes):
+        notifications = []
+        with self._lock:
+            for watch in self._watches:
+                document_ids = [reference.id for _, reference, _, _ in writes
+                                if reference._collection_name == watch._query._collection_name]
+                if document_ids:
+                    snapshots, changes = watch._changes(dict.fromkeys(document_ids))
+                    if changes:
+                        notifications.append((watch._callback, snapshots, changes))
+        read_time = _now()
+        for callback, snapshots, changes in notifications:
+            callback(snapshots, changes, read_time)
+
+    def get_all(self, references, field_paths=None, transaction=None):
+        references = list(references)
+        if not references:
+            return
+        self._record('get_all', references[0]._collection_name, reads=len(references))
+        for reference in references:
+            yield self._snapshot(reference, field_paths)
+
+    # Storage
+    def _documents(self, collection_name):
+        return list(self._data.get(collection_name, {}).items())
+
+    def _snapshot(self, reference, field_paths=None):
+        with self._lock:
+            entry = self._data.get(reference._collection_name, {}).get(reference.id)
+            if entry is None:
+                return DocumentSnapshot(reference, None)
+            data, create_time, update_time = entry
+            return DocumentSnapshot(reference, copy.deepcopy(data), create_time, update_time, field_paths)
+
+    def _next_update_time(self):
+        update_time = _now()
+        if update_time <= self._last_update_time:
+            update_time = self._last_update_time + timedelta(microseconds=1)
+        self._last_update_time = update_time
+        return update_time
+
+    def _check(self, kind, reference, option, current):
+        if kind == 'create' and current is not None:
+            raise AlreadyExists(f'Document already exists: {reference.path}')
+        if kind == 'update' and current is None:
+            raise NotFound(f'No document to update: {reference.path}')
+        if option is not None and kind in ('update', 'delete'):
+            if option.exists is not None and option.exists != (current is not None):
+                raise FailedPrecondition(f'Precondition failed for {reference.path}')
+            if option.last_update_time is not None and (current is None or current[2] != option.last_update_time):
+                raise FailedPrecondition(f'Document {reference.path} was modified')
+
+    def _commit(self, writes):
+        with self._lock:
+            for kind, reference, _, option in writes:
+                current = self._data.get(reference._collection_name, {}).get(reference.id)
+                self._check(kind, reference, option if kind != 'set' else None, current)
+
+            update_time = self._next_update_time()
+            for kind, reference, document_data, option in writes:
+                collection = self._data.setdefault(reference._collection_name, {})
+                current = collection.get(reference.id)
+                if kind == 'delete':
+                    if current is not None:
+                        del collection[reference.id]
+                    continue
+
+                if kind == 'update':
+                    data = copy.deepcopy(current[0])
+                    for field_path, value in document_data.items():
+                        _update_path(data, field_path, value)
+                elif kind == 'set' and option and current is not None:
+                    data = copy.deepcopy(current[0])
+                    _merge_into(data, document_data)
+                else:
+                    data = {}
+                    _merge_into(data, document_data)
+
+                create_time = current[1] if current is not None else update_time
+                collection[reference.id] = (data, create_time, update_time)
+
+        self._record('commit', writes[0][1]._collection_name, writes=len(writes))
+        if self._watches:
+            self._notify(writes)
+        return WriteResult(update_time)
+
+    def clear(self):
+        with self._lock:
+            self._data = {}
+
+
+class MemoryBucket:
+    def __init__(self, storage, name):
+        self._storage = storage
+        self._name = name
+
+    def upload(self, path, file, file_options=None):
+        data = file if isinstance(file, bytes) else file.read()
+        upsert = (file_options or {}).get('upsert') in ('true', True)
+        with self._storage._lock:
+            objects = self._storage._objects.setdefault(self._name, {})
+            if path in objects and not upsert:
+                raise Exception('The resource already exists')
+            objects[path] = data
+        self._storage._record('upload', len(data))
+        return {'path': path}
+
+    def download(self, path):
+        with self._storage._lock:
+            data = self._storage._objects.get(self._name, {}).get(path)
+        if data is None:
+            raise Exception('Object not found')
+        self._storage._record('download', len(data))
+        return data
+
+    def remove(self, paths):
+        if isinstance(paths, str):
+            paths = [paths]
+        with self._storage._lock:
+            objects = self._storage._objects.get(self._name, {})
+            for path in paths:
+                objects.pop(path, None)
+        self._storage._record('remove', 0)
+        return []
+
+    def get_public_url(self, path, options=None):
+        return f'http://localhost/storage/v1/object/public/{self._name}/{path}?'
+
+
+class MemoryStorage:
+    """In-memory subset of the Supabase storage client."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._objects = {}
+        self.stats = {'calls': 0, 'bytes': 0}
+
+    def _record(self, operation, size):
+        with self._lock:
+            self.stats['calls'] += 1
+            self.stats['bytes'] += size
+
+    def from_(self, bucket_name):
+        return MemoryBucket(self, bucket_name)
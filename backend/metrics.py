@@ -0,0 +1,183 @@
+"""Minimal in-process metrics exported in the Prometheus text format.
+
+Request latency is recorded per route by `init_app`, and calls to Firestore,
+SMTP, Supabase storage and Firebase identitytoolkit are recorded per
+dependency operation with `timed()` or `instrument_firestore()`.
+"""
+import time
+import bisect
+import threading
+import contextlib
+from flask import request, g
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Histogram:
+    def __init__(self, name, help_text, label_names, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, seconds, *labels):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += seconds
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {labels: (list(counts), total) for labels, (counts, total) in self._series.items()}
+        for labels, (counts, total) in sorted(series.items()):
+            label_text = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{self.name}_bucket{{{label_text},le="{le}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{label_text}}} {total}')
+            lines.append(f'{self.name}_count{{{label_text}}} {cumulative}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            label_text = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, labels))
+            lines.append(f'{self.name}{{{label_text}}} {value}')
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+request_duration = Histogram(
+    'http_request_duration_seconds', 'Time spent handling HTTP requests.', ('method', 'route', 'status'))
+dependency_duration = Histogram(
+    'dependency_request_duration_seconds', 'Time spent waiting on external services.', ('dependency', 'operation', 'target'))
+dependency_errors = Counter(
+    'dependency_errors_total', 'Failed calls to external services.', ('dependency', 'operation', 'target'))
+
+_collectors = []
+
+
+def register_collector(collector):
+    """Add a callable returning extra exposition lines (e.g. cache counters)."""
+    _collectors.append(collector)
+
+
+def render():
+    lines = request_duration.render() + dependency_duration.render() + dependency_errors.render()
+    for collector in _collectors:
+        lines.extend(collector())
+    return '\n'.join(lines) + '\n'
+
+
+@contextlib.contextmanager
+def timed(dependency, operation, target=''):
+    """Record how long the wrapped call to `dependency` took, and whether it failed."""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        dependency_errors.inc(dependency, operation, target)
+        raise
+    finally:
+        dependency_duration.observe(time.perf_counter() - started, dependency, operation, target)
+
+
+def init_app(app):
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop('request_started', None)
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            request_duration.observe(time.perf_counter() - started, request.method, route, str(response.status_code))
+        return response
+
+
+# Firestore RPC instrumentation
+_FIRESTORE_RPCS = ('batch_get_documents', 'run_query', 'run_aggregation_query', 'commit', 'begin_transaction', 'rollback')
+
+
+def _collection_from_path(path):
+    parts = path.split('/documents/', 1)[-1].split('/')
+    return parts[-2] if len(parts) >= 2 else parts[0]
+
+
+def _firestore_target(rpc, request_data):
+    try:
+        if rpc == 'batch_get_documents':
+            return _collection_from_path(request_data['documents'][0])
+        if rpc in ('run_query', 'run_aggregation_query'):
+            query = request_data.get('structured_query') or request_data['structured_aggregation_query'].structured_query
+            return query.from_[0].collection_id
+        if rpc == 'commit':
+            write = request_data['writes'][0]
+            return _collection_from_path(write.update.name or write.delete or write.transform.document)
+    except (KeyError, IndexError, AttributeError, TypeError):
+        pass
+    return ''
+
+
+def _timed_stream(iterator, rpc, target, started):
+    try:
+        for item in iterator:
+            yield item
+    except Exception:
+        dependency_errors.inc('firestore', rpc, target)
+        raise
+    finally:
+        dependency_duration.observe(time.perf_counter() - started, 'firestore', rpc, target)
+
+
+def _timed_rpc(method, rpc):
+    streaming = rpc in ('batch_get_documents', 'run_query', 'run_aggregation_query')
+
+    def wrapper(*args, **kwargs):
+        target = _firestore_target(rpc, kwargs.get('request') or {})
+        started = time.perf_counter()
+        if streaming:
+            # Time the stream until it is fully consumed
+            try:
+                return _timed_stream(method(*args, **kwargs), rpc, target, started)
+            except Exception:
+                dependency_errors.inc('firestore', rpc, target)
+                raise
+        with timed('firestore', rpc, target):
+            return method(*args, **kwargs)
+    return wrapper
+
+
+def instrument_firestore(client):
+    """Time every Firestore RPC made through `client`, labelled by collection."""
+    api = client._firestore_api
+    for rpc in _FIRESTORE_RPCS:
+        setattr(api, rpc, _timed_rpc(getattr(api, rpc), rpc))
+    return client
@@ -0,0 +1,131 @@
+import json
+import base64
+from datetime import datetime
+from firebase_admin import firestore
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+DOCUMENT_ID = '__name__'
+
+# Fields each listing may be ordered by (besides the document id)
+SORTABLE_FIELDS = {
+    'users': ['createdAt', 'lastUpdatedDate', 'firstName', 'lastName'],
+    'tickets': ['createdAt', 'lastUpdatedDate', 'title', 'status'],
+    'appointments': ['createdAt', 'lastUpdatedDate', 'title', 'status', 'appointmentDate'],
+    'resources': ['createdAt', 'lastUpdatedDate', 'title', 'type'],
+}
+
+
+class PaginationError(ValueError):
+    """Raised for invalid limit, orderBy or cursor parameters."""
+
+
+def wants_pagination(args, default=False):
+    """Paginate when a limit or cursor is passed, or when enabled by default.
+
+    `paginate=false` keeps the legacy full listing even when pagination is the default.
+    """
+    if 'limit' in args or 'cursor' in args:
+        return True
+    flag = args.get('paginate')
+    if flag is not None:
+        return flag.lower() in ('1', 'true', 'yes')
+    return default
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'$dt': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict) and '$dt' in value:
+        return datetime.fromisoformat(value['$dt'])
+    return value
+
+
+def encode_cursor(order_field, snapshot):
+    """Build an opaque token pointing just after `snapshot`."""
+    payload = {'o': order_field, 'id': snapshot.id}
+    if order_field != DOCUMENT_ID:
+        payload['v'] = _encode_value(snapshot.get(order_field))
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, order_field):
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        payload = json.loads(raw)
+    except ValueError:
+        raise PaginationError('Invalid cursor')
+    if not isinstance(payload, dict) or payload.get('o') != order_field or 'id' not in payload:
+        raise PaginationError('Cursor does not match orderBy')
+    return payload
+
+
+def parse_page_args(args, collection_name):
+    """Validate `limit` and `orderBy` (prefix with '-' for descending)."""
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise PaginationError('limit must be an integer')
+    if limit < 1 or limit > MAX_PAGE_SIZE:
+        raise PaginationError(f'limit must be between 1 and {MAX_PAGE_SIZE}')
+
+    order_by = args.get('orderBy', DOCUMENT_ID)
+    descending = order_by.startswith('-')
+    order_field = order_by.lstrip('-')
+    if order_field != DOCUMENT_ID and order_field not in SORTABLE_FIELDS.get(collection_name, []):
+        raise PaginationError(f'Invalid orderBy. Must be one of: {", ".join(SORTABLE_FIELDS.get(collection_name, []))}')
+    return limit, order_field, descending
+
+
+def paginate(query, collection_name, args):
+    """Return one page of `query` as (snapshots, next_cursor).
+
+    Results are ordered by the requested field with the document id as a
+    tie-breaker, and the cursor resumes with Firestore `start_after`.
+    """
+    return paginate_many([query], collection_name, args)
+
+
+def paginate_many(queries, collection_name, args):
+    """Like paginate, over several queries merged into one ordered sequence.
+
+    Used for a collection together with its archive; a document id must not
+    appear in more than one of the queries.
+    """
+    limit, order_field, descending = parse_page_args(args, collection_name)
+    direction = firestore.Query.DESCENDING if descending else firestore.Query.ASCENDING
+
+    token = args.get('cursor')
+    position = None
+    if token:
+        payload = decode_cursor(token, order_field)
+        position = {DOCUMENT_ID: payload['id']}
+        if order_field != DOCUMENT_ID:
+            position = {order_field: _decode_value(payload.get('v')), DOCUMENT_ID: payload['id']}
+
+    snapshots = []
+    for query in queries:
+        if order_field != DOCUMENT_ID:
+            query = query.order_by(order_field, direction=direction)
+        query = query.order_by(DOCUMENT_ID, direction=direction)
+        if position is not None:
+            query = query.start_after(position)
+        # Fetch one extra document to know whether another page exists
+        snapshots.extend(query.limit(limit + 1).stream())
+
+    if len(queries) > 1:
+        if order_field == DOCUMENT_ID:
+            snapshots.sort(key=lambda snapshot: snapshot.id, reverse=descending)
+        else:
+            snapshots.sort(key=lambda snapshot: (snapshot.get(order_field), snapshot.id), reverse=descending)
+
+    next_cursor = None
+    if len(snapshots) > limit:
+        snapshots = snapshots[:limit]
+        next_cursor = encode_cursor(order_field, snapshots[-1])
+    return snapshots, next_cursor
@@ -0,0 +1,45 @@
+"""Preview rendering, run in the preview worker's process pool.
+
+Kept apart from the queue and datastore code so the pool processes only
+import Pillow and pdfium.
+"""
+import io
+import os
+from PIL import Image, ImageOps
+
+PREVIEW_SIZE = int(os.environ.get('PREVIEW_SIZE', 480))  # Longest side in pixels
+PREVIEW_QUALITY = 80
+PREVIEW_MIMETYPE = 'image/webp'
+# Larger images are refused instead of decoded (Pillow's decompression bomb check)
+Image.MAX_IMAGE_PIXELS = int(os.environ.get('PREVIEW_MAX_PIXELS', 50_000_000))
+
+
+def _first_pdf_page(path):
+    import pypdfium2 as pdfium
+
+    pdf = pdfium.PdfDocument(path)
+    try:
+        page = pdf[0]
+        # Render straight at preview size rather than at full resolution
+        scale = PREVIEW_SIZE / max(page.get_size())
+        return page.render(scale=scale).to_pil()
+    finally:
+        pdf.close()
+
+
+def _image(path):
+    image = Image.open(path)
+    # JPEGs can be decoded at a fraction of their size
+    image.draft('RGB', (PREVIEW_SIZE, PREVIEW_SIZE))
+    return ImageOps.exif_transpose(image)
+
+
+def render_preview(path, mimetype):
+    """WebP bytes of a thumbnail of the image, or of the first page of the PDF, at `path`."""
+    image = _first_pdf_page(path) if mimetype == 'application/pdf' else _image(path)
+    image.thumbnail((PREVIEW_SIZE, PREVIEW_SIZE))
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+    output = io.BytesIO()
+    image.save(output, 'WEBP', quality=PREVIEW_QUALITY)
+    return output.getvalue()
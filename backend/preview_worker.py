@@ -0,0 +1,27 @@
+"""Render previews of uploaded images and PDFs queued by create_resource and
+update_resource, in a pool of PREVIEW_PROCESSES processes (default 2) that is
+separate from the request workers. gunicorn.conf.py starts it next to the
+server; in development run it alongside the app:
+cd backend && python preview_worker.py
+
+Use --once to run the jobs that are due and exit.
+"""
+import argparse
+import threading
+from previews import PREVIEW_PROCESSES, create_pool, dispatch_loop, run_pending
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--processes', type=int, default=PREVIEW_PROCESSES)
+    parser.add_argument('--once', action='store_true')
+    args = parser.parse_args()
+
+    with create_pool(args.processes) as pool:
+        if args.once:
+            print(f"Ran {run_pending(pool)} preview jobs")
+        else:
+            # One dispatcher per process keeps the pool busy while others upload
+            for i in range(args.processes):
+                threading.Thread(target=dispatch_loop, args=(pool,), name=f'preview-{i}', daemon=True).start()
+            threading.Event().wait()
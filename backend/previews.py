@@ -0,0 +1,238 @@
+import os
+import time
+import random
+import shutil
+import sqlite3
+import mimetypes
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from google.api_core.exceptions import FailedPrecondition, NotFound
+from firebase_config import db
+from supabase_config import storage
+from content_store import BUCKET_NAME, BLOB_COLLECTION, preview_object_name, preview_fields
+from preview_render import render_preview, PREVIEW_MIMETYPE
+from metrics import timed
+
+# Preview jobs are queued in SQLite by the request workers and run by
+# preview_worker.py, which renders them in its own process pool. The uploaded
+# file is copied to PREVIEW_SPOOL_DIR so the worker doesn't download it again.
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PREVIEW_QUEUE_PATH = os.environ.get('PREVIEW_QUEUE_PATH', os.path.join(BASE_DIR, 'previews.sqlite3'))
+PREVIEW_SPOOL_DIR = os.environ.get('PREVIEW_SPOOL_DIR', os.path.join(BASE_DIR, 'preview_spool'))
+PREVIEW_PROCESSES = int(os.environ.get('PREVIEW_PROCESSES', 2))
+PREVIEW_MAX_SOURCE_BYTES = int(os.environ.get('PREVIEW_MAX_SOURCE_BYTES', 100 * 1024 * 1024))
+PREVIEW_MAX_ATTEMPTS = int(os.environ.get('PREVIEW_MAX_ATTEMPTS', 4))
+PREVIEW_BACKOFF_SECONDS = float(os.environ.get('PREVIEW_BACKOFF_SECONDS', 5))
+PREVIEW_RENDER_TIMEOUT = 120
+PREVIEW_POLL_SECONDS = 1
+PREVIEW_LEASE_SECONDS = 300  # Jobs stuck in 'running' longer than this are retried
+PREVIEW_TASKS_PER_PROCESS = 100  # Pool processes are replaced after this many renders
+PREVIEWABLE_MIMETYPES = {'image/jpeg', 'image/png', 'image/gif', 'image/webp', 'image/bmp', 'application/pdf'}
+
+_local = threading.local()
+
+
+def _connect():
+    conn = sqlite3.connect(PREVIEW_QUEUE_PATH, timeout=30, isolation_level=None)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS preview_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            resource_id TEXT NOT NULL,
+            digest TEXT NOT NULL,
+            mimetype TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            claimed_at REAL,
+            last_error TEXT,
+            created_at REAL NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS preview_jobs_due ON preview_jobs (status, next_attempt_at)')
+    return conn
+
+
+def _thread_connection():
+    # One connection per request thread, never shared across a fork
+    if getattr(_local, 'pid', None) != os.getpid():
+        _local.conn = _connect()
+        _local.pid = os.getpid()
+    return _local.conn
+
+
+def _spool_path(digest):
+    return os.path.join(PREVIEW_SPOOL_DIR, digest)
+
+
+def preview_mimetype(file_storage):
+    """The file's type if a preview can be made of it, else None."""
+    mimetype = file_storage.mimetype
+    if mimetype not in PREVIEWABLE_MIMETYPES:
+        mimetype = mimetypes.guess_type(file_storage.filename or '')[0]
+    return mimetype if mimetype in PREVIEWABLE_MIMETYPES else None
+
+
+def _spool(file_storage, digest):
+    """Copy the upload to the spool directory, once per content."""
+    path = _spool_path(digest)
+    if os.path.exists(path):
+        return
+    os.makedirs(PREVIEW_SPOOL_DIR, exist_ok=True)
+    temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}'
+    stream = file_storage.stream
+    stream.seek(0)
+    with open(temp_path, 'wb') as spooled:
+        shutil.copyfileobj(stream, spooled)
+    stream.seek(0)
+    os.replace(temp_path, path)
+
+
+def enqueue_preview(resource_id, file_storage, fields):
+    """Queue a preview of a resource's new file, if it is an image or PDF; returns the job id."""
+    mimetype = preview_mimetype(file_storage)
+    if mimetype is None or fields['fileSize'] > PREVIEW_MAX_SOURCE_BYTES:
+        return None
+    now = time.time()
+    cursor = _thread_connection().execute(
+        'INSERT INTO preview_jobs (resource_id, digest, mimetype, next_attempt_at, created_at) VALUES (?, ?, ?, ?, ?)',
+        (resource_id, fields['fileHash'], mimetype, now, now)
+    )
+    # Spooled after the job exists, so the worker doesn't discard the file in between
+    _spool(file_storage, fields['fileHash'])
+    return cursor.lastrowid
+
+
+def create_pool(processes=PREVIEW_PROCESSES):
+    # Spawned rather than forked: the worker has Firestore and gRPC threads running
+    return ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context('spawn'),
+                               max_tasks_per_child=PREVIEW_TASKS_PER_PROCESS)
+
+
+def _claim_next(conn):
+    """Atomically mark the next due job as 'running' and return it."""
+    now = time.time()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        row = conn.execute(
+            '''SELECT id, resource_id, digest, mimetype, attempts FROM preview_jobs
+               WHERE (status = 'pending' AND next_attempt_at <= ?)
+                  OR (status = 'running' AND claimed_at <= ?)
+               ORDER BY next_attempt_at LIMIT 1''',
+            (now, now - PREVIEW_LEASE_SECONDS)
+        ).fetchone()
+        if row:
+            conn.execute("UPDATE preview_jobs SET status = 'running', claimed_at = ? WHERE id = ?", (now, row[0]))
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    return row
+
+
+def _blob_preview(digest, mimetype, pool):
+    """The preview fields of a stored file, rendering and uploading the preview if it has none yet.
+
+    Returns None if the file is no longer used by any resource.
+    """
+    blob_ref = db.collection(BLOB_COLLECTION).document(digest)
+    blob = blob_ref.get()
+    data = blob.to_dict() if blob.exists else None
+    if not data or data['refCount'] <= 0:
+        return None
+    if data.get('previewSizeBytes'):
+        return preview_fields(digest, data['previewSizeBytes'])
+
+    preview = pool.submit(render_preview, _spool_path(digest), mimetype).result(timeout=PREVIEW_RENDER_TIMEOUT)
+    with timed('supabase_storage', 'upload', BUCKET_NAME):
+        storage.from_(BUCKET_NAME).upload(preview_object_name(digest), preview, file_options={
+            'content-type': PREVIEW_MIMETYPE,
+            'upsert': 'true',
+        })
+    try:
+        # Fails if the file was released (and maybe removed) since it was read
+        blob_ref.update({'previewSizeBytes': len(preview)}, option=db.write_option(last_update_time=blob.update_time))
+    except (FailedPrecondition, NotFound):
+        current = blob_ref.get()
+        if current.exists and current.get('refCount') > 0:
+            raise  # Only the count changed, retry the job
+        with timed('supabase_storage', 'remove', BUCKET_NAME):
+            storage.from_(BUCKET_NAME).remove([preview_object_name(digest)])
+        return None
+    return preview_fields(digest, len(preview))
+
+
+def _attach(resource_id, digest, fields):
+    """Write the preview fields on the resource, unless its file has changed since."""
+    resource_ref = db.collection('resources').document(resource_id)
+    resource = resource_ref.get()
+    if not resource.exists or resource.to_dict().get('fileHash') != digest:
+        return
+    resource_ref.update(fields, option=db.write_option(last_update_time=resource.update_time))
+
+
+def _discard_spooled(conn, digest):
+    queued = conn.execute(
+        "SELECT COUNT(*) FROM preview_jobs WHERE digest = ? AND status IN ('pending', 'running')", (digest,)
+    ).fetchone()[0]
+    if queued == 0:
+        try:
+            os.remove(_spool_path(digest))
+        except FileNotFoundError:
+            pass
+
+
+def process_next(conn, pool):
+    """Run the next due preview job; returns False if there was none."""
+    row = _claim_next(conn)
+    if row is None:
+        return False
+
+    job_id, resource_id, digest, mimetype, attempts = row
+    try:
+        fields = _blob_preview(digest, mimetype, pool)
+        if fields:
+            _attach(resource_id, digest, fields)
+        conn.execute("UPDATE preview_jobs SET status = 'done', last_error = NULL WHERE id = ?", (job_id,))
+    except Exception as e:
+        attempts += 1
+        if attempts >= PREVIEW_MAX_ATTEMPTS:
+            status, next_attempt_at = 'failed', time.time()
+            print(f"Error creating preview for resource {resource_id}, giving up: {e}")
+        else:
+            # Exponential backoff with jitter
+            delay = PREVIEW_BACKOFF_SECONDS * (2 ** (attempts - 1))
+            status, next_attempt_at = 'pending', time.time() + random.uniform(delay / 2, delay)
+            print(f"Error creating preview for resource {resource_id} (attempt {attempts}): {e}")
+        conn.execute(
+            'UPDATE preview_jobs SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?',
+            (status, attempts, next_attempt_at, str(e), job_id)
+        )
+    _discard_spooled(conn, digest)
+    return True
+
+
+def dispatch_loop(pool):
+    """Run jobs as they become due, polling the queue when it is empty."""
+    conn = _connect()
+    while True:
+        try:
+            ran = process_next(conn, pool)
+        except sqlite3.Error as e:
+            print(f"Error reading preview queue: {e}")
+            ran = False
+        if not ran:
+            time.sleep(PREVIEW_POLL_SECONDS)
+
+
+def run_pending(pool):
+    """Run every due job, e.g. from a benchmark; returns how many ran."""
+    conn = _connect()
+    try:
+        count = 0
+        while process_next(conn, pool):
+            count += 1
+        return count
+    finally:
+        conn.close()
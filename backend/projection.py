@@ -0,0 +1,52 @@
+import re
+
+MAX_FIELDS = 30
+DOCUMENT_ID = '__name__'
+# Top-level Firestore field names that need no quoting in a field path
+_FIELD_NAME = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+class ProjectionError(ValueError):
+    """Raised for an invalid `fields` or `expand` parameter."""
+
+
+def parse_fields(args):
+    """Return the field names listed in `fields=a,b,c`, or None to return whole documents.
+
+    `id` is always returned, so it may be listed but is never fetched as a field.
+    """
+    raw = args.get('fields')
+    if raw is None:
+        return None
+    fields = []
+    for name in raw.split(','):
+        name = name.strip()
+        if not name or name == 'id' or name in fields:
+            continue
+        if not _FIELD_NAME.match(name):
+            raise ProjectionError(f'Invalid field name: {name}')
+        fields.append(name)
+    if len(fields) > MAX_FIELDS:
+        raise ProjectionError(f'At most {MAX_FIELDS} fields can be selected')
+    return fields
+
+
+def parse_expand(args, allowed):
+    """Return the set of relations listed in `expand=a,b`, each of which must be in `allowed`."""
+    expand = {name.strip() for name in args.get('expand', '').split(',') if name.strip()}
+    invalid = expand - set(allowed)
+    if invalid:
+        raise ProjectionError(f'Invalid expand. Must be one of: {", ".join(allowed) or "none"}')
+    return expand
+
+
+def selected_fields(fields, args):
+    """Fields to fetch from Firestore: the requested ones plus the orderBy field the cursor needs."""
+    order_field = args.get('orderBy', DOCUMENT_ID).lstrip('-')
+    if order_field != DOCUMENT_ID and order_field not in fields:
+        return fields + [order_field]
+    return fields
+
+
+def project(data, fields):
+    return {field: data[field] for field in fields if field in data}
@@ -0,0 +1,14 @@
+"""Recount the dashboard counters behind /stats from the tickets and
+appointments collections and their archives. Run once before deploying, and
+again whenever the counters drift (e.g. after editing documents in the console):
+python rebuild_stats.py
+
+Writes made while the recount runs can be lost, so run it when the system is quiet.
+"""
+from dashboard_stats import COUNTED_COLLECTIONS, rebuild_counters
+
+
+if __name__ == '__main__':
+    for collection_name in COUNTED_COLLECTIONS:
+        counts = rebuild_counters(collection_name)
+        print(f"{collection_name}: {counts['total']} documents, by status {counts.get('byStatus', {})}")
@@ -0,0 +1,130 @@
+import os
+import base64
+import threading
+import requests
+from cachetools import TTLCache
+from metrics import timed
+from supabase_config import storage, SUPABASE_URL, SUPABASE_SERVICE_KEY, RESUMABLE_UPLOADS
+
+# Supabase resumable (TUS) uploads must be sent in 6 MB chunks
+CHUNK_SIZE = 6 * 1024 * 1024
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_RESOURCE_UPLOAD_BYTES', 200 * 1024 * 1024))
+CHUNK_RETRIES = 3
+
+# Progress of recent uploads by upload id, polled through /upload_progress
+_progress = TTLCache(maxsize=1024, ttl=3600)
+_progress_lock = threading.Lock()
+
+
+class UploadTooLargeError(Exception):
+    pass
+
+
+def get_upload_progress(upload_id):
+    with _progress_lock:
+        progress = _progress.get(upload_id)
+        return dict(progress) if progress else None
+
+
+def _report(upload_id, **fields):
+    with _progress_lock:
+        _progress.setdefault(upload_id, {}).update(fields)
+
+
+def file_size(file_storage):
+    """Size of a Werkzeug upload without reading it into memory."""
+    stream = file_storage.stream
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(0)
+    return size
+
+
+def upload_file(bucket_name, object_name, file_storage, upload_id, upsert=False):
+    """Upload a spooled request file to Supabase storage in bounded memory.
+
+    Files up to one chunk use a single request; larger files use a resumable
+    session so at most CHUNK_SIZE bytes are held in memory at any time.
+    With `upsert` an existing object of the same name is overwritten.
+    """
+    size = file_size(file_storage)
+    if size > MAX_UPLOAD_BYTES:
+        raise UploadTooLargeError(f'File exceeds the {MAX_UPLOAD_BYTES // (1024 * 1024)} MB upload limit')
+
+    _report(upload_id, status='uploading', uploadedBytes=0, totalBytes=size, fileName=file_storage.filename)
+    try:
+        if size <= CHUNK_SIZE or not RESUMABLE_UPLOADS:
+            with timed('supabase_storage', 'upload', bucket_name):
+                storage.from_(bucket_name).upload(object_name, file_storage.stream.read(), file_options={
+                    'content-type': file_storage.mimetype or 'application/octet-stream',
+                    'upsert': 'true' if upsert else 'false',
+                })
+            _report(upload_id, uploadedBytes=size)
+        else:
+            _resumable_upload(bucket_name, object_name, file_storage, size, upload_id, upsert)
+    except Exception as e:
+        _report(upload_id, status='failed', error=str(e))
+        raise
+    _report(upload_id, status='done')
+    return size
+
+
+def _encode_metadata(**metadata):
+    return ','.join(f"{key} {base64.b64encode(value.encode('utf-8')).decode('ascii')}" for key, value in metadata.items())
+
+
+def _resumable_upload(bucket_name, object_name, file_storage, size, upload_id, upsert):
+    endpoint = f"{SUPABASE_URL}/storage/v1/upload/resumable"
+    headers = {
+        'Authorization': f'Bearer {SUPABASE_SERVICE_KEY}',
+        'apikey': SUPABASE_SERVICE_KEY,
+        'Tus-Resumable': '1.0.0',
+    }
+
+    with requests.Session() as http:
+        with timed('supabase_storage', 'resumable_create', bucket_name):
+            response = http.post(endpoint, headers={
+                **headers,
+                'Upload-Length': str(size),
+                'Upload-Metadata': _encode_metadata(
+                    bucketName=bucket_name,
+                    objectName=object_name,
+                    contentType=file_storage.mimetype or 'application/octet-stream',
+                ),
+                'x-upsert': 'true' if upsert else 'false',
+            }, timeout=30)
+        if response.status_code != 201:
+            raise Exception(f'Could not start upload: {response.status_code} {response.text}')
+        upload_url = response.headers['Location']
+
+        offset = 0
+        while offset < size:
+            offset = _send_chunk(http, upload_url, headers, file_storage.stream, offset)
+            _report(upload_id, uploadedBytes=offset)
+
+
+def _send_chunk(http, upload_url, headers, stream, offset):
+    """Send the chunk starting at `offset` and return the server's new offset."""
+    stream.seek(offset)
+    chunk = stream.read(CHUNK_SIZE)
+    last_error = None
+    for _ in range(CHUNK_RETRIES):
+        try:
+            with timed('supabase_storage', 'resumable_chunk'):
+                response = http.patch(upload_url, data=chunk, headers={
+                    **headers,
+                    'Upload-Offset': str(offset),
+                    'Content-Type': 'application/offset+octet-stream',
+                }, timeout=120)
+            if response.status_code == 204:
+                return int(response.headers.get('Upload-Offset', offset + len(chunk)))
+            last_error = f'{response.status_code} {response.text}'
+        except requests.RequestException as e:
+            last_error = str(e)
+
+        # The server may have stored part of the chunk, resume from its offset
+        with timed('supabase_storage', 'resumable_offset'):
+            head = http.head(upload_url, headers=headers, timeout=30)
+        if head.ok and int(head.headers.get('Upload-Offset', offset)) != offset:
+            return int(head.headers['Upload-Offset'])
+    raise Exception(f'Chunk upload failed: {last_error}')
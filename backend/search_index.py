@@ -0,0 +1,210 @@
+import re
+import math
+import time
+import bisect
+import threading
+import unicodedata
+
+# Arabic diacritics, Quranic marks and tatweel carry no meaning for search
+_ARABIC_MARKS = re.compile('[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]')
+# Letter variants users type interchangeably
+_ARABIC_VARIANTS = str.maketrans({'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا', 'ى': 'ي', 'ة': 'ه', 'ؤ': 'و', 'ئ': 'ي'})
+_ARABIC_PREFIXES = ('وال', 'بال', 'كال', 'فال', 'لل', 'ال')
+# Letters and digits; underscores and punctuation (e.g. in file names) split words
+_WORD = re.compile(r'[^\W_]+')
+
+# BM25 parameters
+_K1 = 1.2
+_B = 0.75
+MAX_PREFIX_EXPANSIONS = 50
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKC', text).casefold()
+    return _ARABIC_MARKS.sub('', text).translate(_ARABIC_VARIANTS)
+
+
+def _stem(word):
+    if '\u0600' <= word[0] <= '\u06ff':
+        for prefix in _ARABIC_PREFIXES:
+            if word.startswith(prefix) and len(word) - len(prefix) >= 2:
+                return word[len(prefix):]
+        return word
+    if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+        return word[:-1]
+    return word
+
+
+STOP_WORDS = {_stem(normalize(word)) for word in (
+    'a', 'an', 'the', 'and', 'or', 'of', 'to', 'in', 'on', 'for', 'is', 'are', 'it', 'with', 'my', 'i', 'at', 'by',
+    'في', 'من', 'على', 'إلى', 'عن', 'و', 'مع', 'هذا', 'هذه', 'أن', 'او', 'ما', 'لا', 'التي', 'الذي',
+)}
+
+
+def tokenize(text):
+    """Split Arabic or English text into normalized, lightly stemmed terms."""
+    terms = []
+    for word in _WORD.findall(normalize(text or '')):
+        term = _stem(word)
+        if term not in STOP_WORDS:
+            terms.append(term)
+    return terms
+
+
+class SearchIndex:
+    """In-process inverted index over a few text fields of one collection.
+
+    Built from `loader()` on first use and again after `ttl` seconds so writes
+    made by other worker processes are picked up; the write handlers keep it
+    current in between with `update()` and `remove()`.
+    """
+
+    def __init__(self, loader, fields, owner_field=None, ttl=300):
+        self.loader = loader
+        # Field name -> weight of a term found in that field
+        self.fields = fields
+        self.owner_field = owner_field
+        self.ttl = ttl
+        self._loaded_at = None
+        self._pending = None
+        self._generation = 0
+        self._load_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._postings = {}
+        self._terms = []
+        self._documents = {}
+        self._total_length = 0
+
+    # Building
+    def _index(self, doc_id, values):
+        self._unindex(doc_id)
+        frequencies = {}
+        for field, weight in self.fields.items():
+            for term in tokenize(values.get(field)):
+                frequencies[term] = frequencies.get(term, 0) + weight
+        length = sum(frequencies.values())
+        self._documents[doc_id] = (values, length, frequencies.keys())
+        self._total_length += length
+        for term, frequency in frequencies.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                bisect.insort(self._terms, term)
+            postings[doc_id] = frequency
+
+    def _unindex(self, doc_id):
+        entry = self._documents.pop(doc_id, None)
+        if entry is None:
+            return
+        self._total_length -= entry[1]
+        for term in entry[2]:
+            postings = self._postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[term]
+                del self._terms[bisect.bisect_left(self._terms, term)]
+
+    def _values(self, data):
+        keys = list(self.fields) + ([self.owner_field] if self.owner_field else [])
+        return {key: data.get(key) for key in keys if data.get(key) is not None}
+
+    def ensure_loaded(self):
+        if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl:
+            return
+        with self._load_lock:
+            if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl:
+                return
+            with self._lock:
+                self._pending = []
+                generation = self._generation
+            fresh = SearchIndex(None, self.fields, self.owner_field)
+            for doc in self.loader():
+                fresh._index(doc.id, self._values(doc.to_dict()))
+            with self._lock:
+                # Replay writes made while the collection was being read
+                for doc_id, data, replace in self._pending:
+                    fresh._apply(doc_id, data, replace)
+                self._pending = None
+                if generation == self._generation:
+                    self._postings, self._terms, self._documents = fresh._postings, fresh._terms, fresh._documents
+                    self._total_length = fresh._total_length
+                    self._loaded_at = time.monotonic()
+
+    def warm(self):
+        """Build the index in the background, e.g. when a worker starts."""
+        threading.Thread(target=self.ensure_loaded, daemon=True).start()
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._loaded_at = None
+            self._reset()
+
+    # Incremental updates from the write handlers
+    def _apply(self, doc_id, data, replace):
+        if data is None:
+            self._unindex(doc_id)
+            return
+        values = self._values(data)
+        if not replace and doc_id in self._documents:
+            values = {**self._documents[doc_id][0], **values}
+        self._index(doc_id, values)
+
+    def _record(self, doc_id, data, replace):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((doc_id, data, replace))
+            if self._loaded_at is not None:
+                self._apply(doc_id, data, replace)
+
+    def add(self, doc_id, data):
+        self._record(doc_id, data, True)
+
+    def update(self, doc_id, changes):
+        """Apply a partial update; fields that aren't indexed are ignored."""
+        if any(field in changes for field in self.fields):
+            self._record(doc_id, changes, False)
+
+    def remove(self, doc_id):
+        self._record(doc_id, None, True)
+
+    # Querying
+    def _expand(self, term):
+        start = bisect.bisect_left(self._terms, term)
+        expansions = []
+        for candidate in self._terms[start:start + MAX_PREFIX_EXPANSIONS]:
+            if not candidate.startswith(term):
+                break
+            expansions.append(candidate)
+        return expansions
+
+    def search(self, query, owner=None):
+        """Return [(doc_id, score)] best first; the last query term also matches as a prefix."""
+        terms = tokenize(query)
+        if not terms:
+            return []
+        self.ensure_loaded()
+        with self._lock:
+            documents = self._documents
+            if not documents:
+                return []
+            average_length = self._total_length / len(documents) or 1
+            query_terms = [(term, 1.0) for term in terms[:-1]]
+            query_terms += [(term, 1.0 if term == terms[-1] else 0.5) for term in self._expand(terms[-1])]
+
+            scores = {}
+            for term, boost in query_terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (len(documents) - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, frequency in postings.items():
+                    values, length, _ = documents[doc_id]
+                    if owner is not None and values.get(self.owner_field) != owner:
+                        continue
+                    norm = frequency + _K1 * (1 - _B + _B * length / average_length)
+                    scores[doc_id] = scores.get(doc_id, 0) + boost * idf * frequency * (_K1 + 1) / norm
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
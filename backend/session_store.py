@@ -0,0 +1,194 @@
+import os
+import json
+import time
+import secrets
+import sqlite3
+import tempfile
+import threading
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+from lazy_client import LazyClient
+from metrics import timed
+
+# 'sqlite' (default) keeps sessions in a file shared by the workers on one
+# machine, 'redis' in a Redis-protocol server shared by every machine, and
+# 'cookie' in Flask's signed cookie
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'sqlite')
+SESSION_DB_PATH = os.environ.get('SESSION_DB_PATH', os.path.join(BASE_DIR, 'sessions.sqlite3'))
+SESSION_REDIS_URL = os.environ.get('SESSION_REDIS_URL', 'redis://localhost:6379/0')
+SECRET_KEY_PATH = os.environ.get('SECRET_KEY_PATH', os.path.join(BASE_DIR, '.secret_key'))
+PURGE_INTERVAL_SECONDS = 600
+
+
+def load_secret_key():
+    """Return SECRET_KEY, or a key generated once and shared by every worker on this machine."""
+    key = os.environ.get('SECRET_KEY')
+    if key:
+        return key
+    if not os.path.exists(SECRET_KEY_PATH):
+        # Written to a temporary file and linked into place, so concurrently
+        # starting workers all end up with the same key
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(SECRET_KEY_PATH))
+        with os.fdopen(fd, 'w') as f:
+            f.write(secrets.token_hex(32))
+        try:
+            os.link(temp_path, SECRET_KEY_PATH)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(temp_path)
+    with open(SECRET_KEY_PATH) as f:
+        return f.read().strip()
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    """Session data kept in a store; the cookie only carries its random id."""
+
+    def __init__(self, initial=None, sid=None, new=False, expires_at=None):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.expires_at = expires_at
+        self.modified = False
+        self.loaded_user_id = self.get('user_id')
+
+
+class SQLiteSessionStore:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._purged_at = 0
+
+    def _connection(self):
+        # One connection per request thread, never shared across a fork
+        if getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS sessions (
+                    sid TEXT PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS sessions_expiry ON sessions (expires_at)')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return self._local.conn
+
+    def load(self, sid):
+        row = self._connection().execute(
+            'SELECT data, expires_at FROM sessions WHERE sid = ? AND expires_at > ?', (sid, time.time())
+        ).fetchone()
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def save(self, sid, data, ttl):
+        conn = self._connection()
+        now = time.time()
+        conn.execute('INSERT OR REPLACE INTO sessions (sid, data, expires_at) VALUES (?, ?, ?)',
+                     (sid, json.dumps(data), now + ttl))
+        if now - self._purged_at > PURGE_INTERVAL_SECONDS:
+            self._purged_at = now
+            conn.execute('DELETE FROM sessions WHERE expires_at <= ?', (now,))
+
+    def touch(self, sid, ttl):
+        self._connection().execute('UPDATE sessions SET expires_at = ? WHERE sid = ?', (time.time() + ttl, sid))
+
+    def delete(self, sid):
+        self._connection().execute('DELETE FROM sessions WHERE sid = ?', (sid,))
+
+
+def _create_redis_client(url):
+    import redis  # Only needed with SESSION_BACKEND=redis
+    return redis.Redis.from_url(url, socket_timeout=2, socket_connect_timeout=2)
+
+
+class RedisSessionStore:
+    """Sessions as Redis keys that expire on their own."""
+
+    def __init__(self, url, prefix='session:'):
+        self.prefix = prefix
+        self._client = LazyClient('Redis', lambda: _create_redis_client(url))
+
+    def load(self, sid):
+        with timed('redis', 'load_session'):
+            pipe = self._client.pipeline()
+            pipe.get(self.prefix + sid)
+            pipe.ttl(self.prefix + sid)
+            data, ttl = pipe.execute()
+        return (json.loads(data), time.time() + ttl) if data is not None and ttl > 0 else None
+
+    def save(self, sid, data, ttl):
+        with timed('redis', 'save_session'):
+            self._client.set(self.prefix + sid, json.dumps(data), ex=int(ttl))
+
+    def touch(self, sid, ttl):
+        with timed('redis', 'touch_session'):
+            self._client.expire(self.prefix + sid, int(ttl))
+
+    def delete(self, sid):
+        with timed('redis', 'delete_session'):
+            self._client.delete(self.prefix + sid)
+
+
+class ServerSessionInterface(SessionInterface):
+    """Stores sessions server-side so any worker on any machine can serve any request.
+
+    A session is written when it changes. An unchanged one is only extended
+    once less than half of its lifetime is left.
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        loaded = self.store.load(sid) if sid else None
+        if loaded is None:
+            return ServerSession(sid=secrets.token_urlsafe(32), new=True)
+        data, expires_at = loaded
+        return ServerSession(data, sid=sid, expires_at=expires_at)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        ttl = app.permanent_session_lifetime.total_seconds()
+
+        if not session:
+            if session.modified and not session.new:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path, secure=self.get_cookie_secure(app),
+                                       samesite=self.get_cookie_samesite(app), httponly=self.get_cookie_httponly(app))
+                response.vary.add('Cookie')
+            return
+
+        response.vary.add('Cookie')
+        if session.modified:
+            if not session.new and session.get('user_id') != session.loaded_user_id:
+                # Someone else signed in with this cookie; don't keep its id
+                self.store.delete(session.sid)
+                session.sid = secrets.token_urlsafe(32)
+            self.store.save(session.sid, dict(session), ttl)
+        elif session.expires_at - time.time() < ttl / 2:
+            self.store.touch(session.sid, ttl)
+        else:
+            return
+
+        response.set_cookie(name, session.sid, expires=self.get_expiration_time(app, session), domain=domain,
+                            path=path, secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app),
+                            httponly=self.get_cookie_httponly(app), partitioned=self.get_cookie_partitioned(app))
+
+
+def init_sessions(app):
+    app.secret_key = load_secret_key()
+    if SESSION_BACKEND == 'sqlite':
+        app.session_interface = ServerSessionInterface(SQLiteSessionStore(SESSION_DB_PATH))
+    elif SESSION_BACKEND == 'redis':
+        app.session_interface = ServerSessionInterface(RedisSessionStore(SESSION_REDIS_URL))
+    elif SESSION_BACKEND != 'cookie':
+        raise ValueError(f'Unknown SESSION_BACKEND: {SESSION_BACKEND}')
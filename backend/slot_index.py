@@ -0,0 +1,59 @@
+import time
+import threading
+
+
+class SlotIndex:
+    """In-process per-day bitmap of booked appointment slots.
+
+    Bit i of a day's bitmap is set when the i-th allowed time slot is booked.
+    Days are loaded from Firestore on demand and reloaded after `ttl` seconds,
+    so bookings made by other worker processes are picked up eventually.
+    """
+
+    def __init__(self, time_slots, ttl=60):
+        self.time_slots = list(time_slots)
+        self.ttl = ttl
+        self._bits = {slot: 1 << i for i, slot in enumerate(self.time_slots)}
+        self._days = {}
+        self._loaded_at = {}
+        self._lock = threading.Lock()
+
+    def missing_days(self, days):
+        """Return the days that were never loaded or whose entry expired."""
+        now = time.monotonic()
+        with self._lock:
+            return [day for day in days if now - self._loaded_at.get(day, float('-inf')) > self.ttl]
+
+    def load(self, days, bookings):
+        """Replace the bitmaps of `days` with the given (date, time) bookings."""
+        bitmaps = dict.fromkeys(days, 0)
+        for date, time_slot in bookings:
+            if date in bitmaps:
+                bitmaps[date] |= self._bits.get(time_slot, 0)
+        now = time.monotonic()
+        with self._lock:
+            self._days.update(bitmaps)
+            for day in bitmaps:
+                self._loaded_at[day] = now
+
+    def book(self, date, time_slot):
+        with self._lock:
+            if date in self._days:
+                self._days[date] |= self._bits.get(time_slot, 0)
+
+    def release(self, date, time_slot):
+        with self._lock:
+            if date in self._days:
+                self._days[date] &= ~self._bits.get(time_slot, 0)
+
+    def invalidate(self, date=None):
+        """Force a reload of one day, or of every day when no date is given."""
+        with self._lock:
+            if date is None:
+                self._loaded_at.clear()
+            else:
+                self._loaded_at.pop(date, None)
+
+    def bitmap(self, date):
+        with self._lock:
+            return self._days.get(date, 0)
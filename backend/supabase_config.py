@@ -1,6 +1,7 @@
 import os
 from supabase import create_client, Client
 from dotenv import load_dotenv
+from lazy_client import LazyClient
 
 # Load environment variables from .env file in root directory
 load_dotenv()
@@ -9,8 +10,24 @@ load_dotenv()
 SUPABASE_URL = os.environ.get("SUPABASE_URL")
 SUPABASE_SERVICE_KEY = os.environ.get("SUPABASE_SERVICE_KEY")  # Use service role key
 
-# Initialize Supabase client with service role key
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+# 'firebase' (default) or 'memory' for a local in-process storage
+DATASTORE_BACKEND = os.environ.get("DATASTORE_BACKEND", "firebase")
 
-# Get storage client
-storage = supabase.storage 
+
+def _create_storage_client():
+    # Initialize Supabase client with service role key
+    supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+
+    # Get storage client
+    return supabase.storage
+
+
+if DATASTORE_BACKEND == "memory":
+    from local_datastore import MemoryStorage
+
+    storage = MemoryStorage()
+    RESUMABLE_UPLOADS = False
+else:
+    # Supabase is connected lazily, once per worker process
+    storage = LazyClient("Supabase storage", _create_storage_client)
+    RESUMABLE_UPLOADS = True
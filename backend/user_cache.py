@@ -0,0 +1,84 @@
+import os
+import threading
+from cachetools import TTLCache
+from firebase_config import db
+
+# Bounded, short-lived cache of `users` documents keyed by user id
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 4096))
+USER_CACHE_TTL_SECONDS = int(os.environ.get('USER_CACHE_TTL_SECONDS', 60))
+
+_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL_SECONDS)
+_lock = threading.Lock()
+_MISSING = object()
+
+# Counters proving how often the authorization path reaches Firestore
+stats = {
+    'sessionHits': 0,
+    'cacheHits': 0,
+    'firestoreReads': 0,
+    'batchReads': 0,
+}
+
+
+def _count(name):
+    with _lock:
+        stats[name] += 1
+
+
+def get_user_profile(user_id):
+    """Return a copy of the user's profile, or None if the user doesn't exist."""
+    with _lock:
+        profile = _cache.get(user_id, _MISSING)
+    if profile is not _MISSING:
+        _count('cacheHits')
+        return dict(profile) if profile is not None else None
+
+    _count('firestoreReads')
+    user_doc = db.collection('users').document(user_id).get()
+    profile = user_doc.to_dict() if user_doc.exists else None
+    remember_user_profile(user_id, profile)
+    return dict(profile) if profile is not None else None
+
+
+def get_user_profiles(user_ids):
+    """Return {user_id: profile copy or None}, reading every uncached user in one batched get_all."""
+    profiles = {}
+    missing = []
+    with _lock:
+        for user_id in set(user_ids):
+            profile = _cache.get(user_id, _MISSING)
+            if profile is _MISSING:
+                missing.append(user_id)
+            else:
+                profiles[user_id] = profile
+        stats['cacheHits'] += len(profiles)
+
+    if missing:
+        _count('batchReads')
+        references = [db.collection('users').document(user_id) for user_id in missing]
+        for user_doc in db.get_all(references):
+            profile = user_doc.to_dict() if user_doc.exists else None
+            remember_user_profile(user_doc.id, profile)
+            profiles[user_doc.id] = profile
+    return {user_id: dict(profile) if profile is not None else None for user_id, profile in profiles.items()}
+
+
+def remember_user_profile(user_id, profile):
+    """Store a freshly read profile (e.g. from login) in the cache."""
+    with _lock:
+        _cache[user_id] = profile
+
+
+def invalidate_user(user_id):
+    """Drop the cached profile after the user's document changes."""
+    with _lock:
+        _cache.pop(user_id, None)
+
+
+def record_session_hit():
+    _count('sessionHits')
+
+
+def get_stats():
+    with _lock:
+        return dict(stats, cachedUsers=len(_cache))
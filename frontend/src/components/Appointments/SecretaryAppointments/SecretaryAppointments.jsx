@@ -3,7 +3,6 @@ import "./SecretaryAppointments.css";
 import {
   getAllAppointments,
   updateAppointment,
-  getUser,
 } from "../../../services/ApiService";
 
 const SecretaryAppointments = () => {
@@ -16,20 +15,6 @@ const SecretaryAppointments = () => {
   const [newFeedback, setNewFeedback] = useState("");
   const [loading, setLoading] = useState(true);
 
-  // Add function to fetch user details
-  const fetchUserDetails = useCallback(async (userId) => {
-    try {
-      const response = await getUser(userId);
-      if (response.error) {
-        throw new Error(response.error);
-      }
-      return response;
-    } catch (error) {
-      console.error("Error fetching user details:", error.message);
-      return null;
-    }
-  }, []);
-
   // Fetch all appointments with user details
   const fetchAllAppointments = useCallback(async () => {
     try {
@@ -39,17 +24,12 @@ const SecretaryAppointments = () => {
         throw new Error(response.error);
       }
 
-      // Fetch user details for each appointment
-      const appointmentsWithUserDetails = await Promise.all(
-        response.map(async (appointment) => {
-          const userInfo = await fetchUserDetails(appointment.userId);
-          return {
-            ...appointment,
-            userFirstName: userInfo?.firstName || "Unknown",
-            userLastName: userInfo?.lastName || "User",
-          };
-        })
-      );
+      // Each appointment comes with its user's name
+      const appointmentsWithUserDetails = response.map((appointment) => ({
+        ...appointment,
+        userFirstName: appointment.user?.firstName || "Unknown",
+        userLastName: appointment.user?.lastName || "User",
+      }));
 
       setAppointmentsList(appointmentsWithUserDetails);
       applyFilters(appointmentsWithUserDetails, statusFilter, searchTerm);
@@ -58,7 +38,7 @@ const SecretaryAppointments = () => {
       console.error("Error fetching appointments:", error.message);
       setLoading(false);
     }
-  }, [statusFilter, searchTerm, fetchUserDetails]);
+  }, [statusFilter, searchTerm]);
 
   useEffect(() => {
     fetchAllAppointments();
@@ -62,6 +62,7 @@ const NoSecResources = () => {
           lastUpdatedDate: resource.lastUpdatedDate,
           fileUrl: resource.fileUrl,
           fileName: resource.fileName,
+          previewUrl: resource.previewUrl,
         });
       } else {
         acc.push({
@@ -75,6 +76,7 @@ const NoSecResources = () => {
               lastUpdatedDate: resource.lastUpdatedDate,
               fileUrl: resource.fileUrl,
               fileName: resource.fileName,
+              previewUrl: resource.previewUrl,
             },
           ],
         });
@@ -179,6 +181,14 @@ const NoSecResources = () => {
                       </div>
                       {isOpen && (
                         <div className="nosec-resources-content">
+                          {section.previewUrl && (
+                            <img
+                              className="nosec-resources-preview"
+                              src={section.previewUrl}
+                              alt={`Preview of ${section.fileName}`}
+                              loading="lazy"
+                            />
+                          )}
                           <p className="nosec-resources-paragraph">
                             {section.content}
                           </p>
@@ -3,7 +3,6 @@ import "./SecretaryTickets.css";
 import {
   getAllTickets,
   updateTicket,
-  getUser,
 } from "../../../services/ApiService";
 
 const SecretaryTickets = () => {
@@ -16,19 +15,6 @@ const SecretaryTickets = () => {
   const [newFeedback, setNewFeedback] = useState("");
   const [loading, setLoading] = useState(true);
 
-  const fetchUserDetails = useCallback(async (userId) => {
-    try {
-      const response = await getUser(userId);
-      if (response.error) {
-        throw new Error(response.error);
-      }
-      return response;
-    } catch (error) {
-      console.error("Error fetching user details:", error.message);
-      return null;
-    }
-  }, []);
-
   const fetchAllTickets = useCallback(async () => {
     try {
       setLoading(true);
@@ -37,16 +23,11 @@ const SecretaryTickets = () => {
         throw new Error(response.error);
       }
 
-      const ticketsWithUserDetails = await Promise.all(
-        response.map(async (ticket) => {
-          const userInfo = await fetchUserDetails(ticket.userId);
-          return {
-            ...ticket,
-            userFirstName: userInfo?.firstName || "Unknown",
-            userLastName: userInfo?.lastName || "User",
-          };
-        })
-      );
+      const ticketsWithUserDetails = response.map((ticket) => ({
+        ...ticket,
+        userFirstName: ticket.user?.firstName || "Unknown",
+        userLastName: ticket.user?.lastName || "User",
+      }));
 
       setTicketsList(ticketsWithUserDetails);
       applyFilters(ticketsWithUserDetails, statusFilter, searchTerm);
@@ -55,7 +36,7 @@ const SecretaryTickets = () => {
       console.error("Error fetching tickets:", error.message);
       setLoading(false);
     }
-  }, [statusFilter, searchTerm, fetchUserDetails]);
+  }, [statusFilter, searchTerm]);
 
   useEffect(() => {
     fetchAllTickets();
@@ -99,7 +99,7 @@ export const getTicket = async (ticketId) => {
 };
 
 export const getAllTickets = async () => {
-  const response = await fetch(`${API_BASE_URL}/get_all_tickets`, {
+  const response = await fetch(`${API_BASE_URL}/get_all_tickets?expand=user`, {
     credentials: "include",
   });
   return handleResponse(response);
@@ -107,7 +107,7 @@ export const getAllTickets = async () => {
 
 export const getUserAllTickets = async (userId) => {
   const response = await fetch(
-    `${API_BASE_URL}/get_user_tickets?userId=${userId}`,
+    `${API_BASE_URL}/get_user_tickets?userId=${userId}&includeArchived=1`,
     {
       credentials: "include",
     }
@@ -162,7 +162,7 @@ export const getAppointment = async (appointmentId) => {
 };
 
 export const getAllAppointments = async () => {
-  const response = await fetch(`${API_BASE_URL}/get_all_appointments`, {
+  const response = await fetch(`${API_BASE_URL}/get_all_appointments?expand=user`, {
     credentials: "include",
   });
   return response.json();
@@ -170,7 +170,7 @@ export const getAllAppointments = async () => {
 
 export const getUserAllAppointments = async (userId) => {
   const response = await fetch(
-    `${API_BASE_URL}/get_user_appointments?userId=${userId}`,
+    `${API_BASE_URL}/get_user_appointments?userId=${userId}&includeArchived=1`,
     {
       credentials: "include",
     }